@@ -23,7 +23,7 @@ import jsonrpc
 from jsonrpc import dispatcher
 import inspect
 
-from . import (config, litecoin, exceptions, util)
+from . import (config, litecoin, exceptions, util, prevouts)
 from . import (send, order, ltcpay, issuance, broadcast, bet, dividend, burn, cancel, callback, rps, rpsresolve, publish)
 
 API_TABLES = ['balances', 'credits', 'debits', 'bets', 'bet_matches',
@@ -536,7 +536,8 @@ class APIServer(threading.Thread):
                 'running_testcoin': config.TESTCOIN,
                 'version_major': config.VERSION_MAJOR,
                 'version_minor': config.VERSION_MINOR,
-                'version_revision': config.VERSION_REVISION
+                'version_revision': config.VERSION_REVISION,
+                'prevout_cache': prevouts.stats()
             }
 
         @dispatcher.add_method
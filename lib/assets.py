@@ -0,0 +1,103 @@
+#! /usr/bin/python3
+
+"""
+Registry of the assets that have been issued, with what the other modules
+need to know of their valid issuances, so that looking an asset up doesn’t
+mean reading all of its issuances again.
+
+An asset is read from the `issuances` table the first time that it is looked
+up, and its record is then kept current by `issue()`, as issuances are
+parsed; the records that a block changes are pending until it has been
+parsed (`blockstate`). Outside of a block (for the mempool, say), nothing
+that is read within a transaction is kept, since the transaction may yet be
+rolled back.
+
+A record holds the divisibility of the first issuance of the asset; the
+issuer, callability, call date and price, lock and description of the last
+one; and the sum of the quantities issued.
+"""
+
+import threading
+
+from . import blockstate
+
+REGISTRY = {}               # asset -> record, or `None` if there is no such asset.
+LOCK = threading.Lock()     # (The API server looks assets up too.)
+PENDING = None              # Set while a block is being parsed.
+GENERATION = 0              # Number of times that the registry has been cleared.
+
+LAST_ISSUANCE_FIELDS = ['issuer', 'callable', 'call_date', 'call_price', 'locked', 'description']
+
+class Changes (blockstate.BlockState):
+    """Records of the assets issued in the block being parsed."""
+    def __init__(self):
+        super().__init__()
+        self.records = {}
+
+def load (db, asset):
+    cursor = db.cursor()
+    issuances = list(cursor.execute('''SELECT * FROM issuances \
+                                       WHERE (status = ? AND asset = ?)
+                                       ORDER BY tx_index ASC''', ('valid', asset)))
+    cursor.close()
+    if not issuances:
+        return None
+    record = {'divisible': issuances[0]['divisible'], 'supply': sum([issuance['quantity'] for issuance in issuances])}
+    for field in LAST_ISSUANCE_FIELDS:
+        record[field] = issuances[-1][field]
+    return record
+
+def get (db, asset):
+    """Return the record of `asset`, or `None` if it hasn’t been issued."""
+    changes = blockstate.current(PENDING)
+    if changes is not None:
+        if asset in changes.records:
+            return changes.records[asset]
+    elif not db.getautocommit():
+        return load(db, asset)
+    with LOCK:
+        if asset in REGISTRY:
+            return REGISTRY[asset]
+        generation = GENERATION
+    record = load(db, asset)
+    with LOCK:
+        if generation != GENERATION:    # (Read before a rollback.)
+            return record
+        return REGISTRY.setdefault(asset, record)
+
+def issue (db, issuance):
+    """Note a valid issuance, before it is inserted."""
+    asset = issuance['asset']
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        with LOCK:
+            REGISTRY.pop(asset, None)
+        return
+
+    previous = get(db, asset)
+    if previous is None:
+        record = {'divisible': int(issuance['divisible']), 'supply': 0}
+    else:
+        record = dict(previous)
+    record['supply'] += issuance['quantity']
+    for field in LAST_ISSUANCE_FIELDS:
+        value = issuance[field]
+        record[field] = int(value) if isinstance(value, bool) else value    # As read from the database.
+    changes.records[asset] = record
+
+def commit ():
+    """Publish the records changed by the block just parsed."""
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        return
+    with LOCK:
+        REGISTRY.update(changes.records)
+    changes.records = {}
+
+def clear ():
+    global GENERATION
+    with LOCK:
+        REGISTRY.clear()
+        GENERATION += 1
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
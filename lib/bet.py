@@ -18,7 +18,7 @@ D = decimal.Decimal
 import time
 import logging
 
-from . import (util, config, litecoin, exceptions, util)
+from . import (util, config, litecoin, exceptions, util, ledger, betbook)
 
 FORMAT = '>HIQQdII'
 LENGTH = 2 + 4 + 8 + 8 + 8 + 4 + 4
@@ -28,13 +28,7 @@ def cancel_bet (db, bet, status, block_index):
     cursor = db.cursor()
 
     # Update status of bet.
-    bindings = {
-        'status': status,
-        'tx_hash': bet['tx_hash']
-    }
-    sql='update bets set status = :status where tx_hash = :tx_hash'
-    cursor.execute(sql, bindings)
-    util.message(db, block_index, 'update', 'bets', bindings)
+    ledger.update(db, 'bets', {'tx_hash': bet['tx_hash']}, {'status': status}, block_index)
 
     util.credit(db, block_index, bet['source'], config.XPT, bet['wager_remaining'], action='recredit wager remaining', event=bet['tx_hash'])
 
@@ -54,13 +48,7 @@ def cancel_bet_match (db, bet_match, status, block_index):
                 bet_match['backward_quantity'], action='recredit backward quantity', event=bet_match['id'])
 
     # Update status of bet match.
-    bindings = {
-        'status': status,
-        'bet_match_id': bet_match['id']
-    }
-    sql='update bet_matches set status = :status where id = :bet_match_id'
-    cursor.execute(sql, bindings)
-    util.message(db, block_index, 'update', 'bet_matches', bindings)
+    ledger.update(db, 'bet_matches', {'id': bet_match['id']}, {'status': status}, block_index)
 
     cursor.close()
 
@@ -68,11 +56,8 @@ def cancel_bet_match (db, bet_match, status, block_index):
 def get_fee_fraction (db, feed_address):
     '''Get fee fraction from the last broadcast from the feed_address address.
     '''
-    cursor = db.cursor()
-    broadcasts = list(cursor.execute('''SELECT * FROM broadcasts WHERE (status = ? AND source = ?) ORDER BY tx_index ASC''', ('valid', feed_address)))
-    cursor.close()
-    if broadcasts:
-        last_broadcast = broadcasts[-1]
+    last_broadcast = util.last_broadcast(db, feed_address)
+    if last_broadcast:
         fee_fraction_int = last_broadcast['fee_fraction_int']
         if fee_fraction_int: return fee_fraction_int / 1e8
         else: return 0
@@ -84,14 +69,12 @@ def validate (db, source, feed_address, bet_type, deadline, wager_quantity,
     problems = []
 
     # Look at feed to be bet on.
-    cursor = db.cursor()
-    broadcasts = list(cursor.execute('''SELECT * FROM broadcasts WHERE (status = ? AND source = ?) ORDER BY tx_index ASC''', ('valid', feed_address)))
-    cursor.close()
-    if not broadcasts:
+    last_broadcast = util.last_broadcast(db, feed_address)
+    if not last_broadcast:
         problems.append('feed doesn’t exist')
-    elif not broadcasts[-1]['text']:
+    elif not last_broadcast['text']:
         problems.append('feed is locked')
-    elif broadcasts[-1]['timestamp'] >= deadline:
+    elif last_broadcast['timestamp'] >= deadline:
         problems.append('deadline in that feed’s past')
 
     if not bet_type in (0, 1, 2, 3):
@@ -180,13 +163,10 @@ def parse (db, tx, message):
         fee_fraction = get_fee_fraction(db, feed_address)
 
         # Overbet
-        bet_parse_cursor.execute('''SELECT * FROM balances \
-                                    WHERE (address = ? AND asset = ?)''', (tx['source'], config.XPT))
-        balances = list(bet_parse_cursor)
-        if not balances:
+        balance = util.get_balance(db, tx['source'], config.XPT)
+        if balance is None:
             wager_quantity = 0
         else:
-            balance = balances[0]['quantity']
             if balance < wager_quantity:
                 wager_quantity = balance
                 counterwager_quantity = int(util.price(wager_quantity, odds, tx['block_index']))
@@ -219,8 +199,7 @@ def parse (db, tx, message):
         'fee_fraction_int': fee_fraction * 1e8,
         'status': status,
     }
-    sql='insert into bets values(:tx_index, :tx_hash, :block_index, :source, :feed_address, :bet_type, :deadline, :wager_quantity, :wager_remaining, :counterwager_quantity, :counterwager_remaining, :target_value, :leverage, :expiration, :expire_index, :fee_fraction_int, :status)'
-    bet_parse_cursor.execute(sql, bindings)
+    ledger.insert(db, 'bets', bindings)
 
     # Match.
     if status == 'open' and tx['block_index'] != config.MEMPOOL_BLOCK_INDEX:
@@ -248,15 +227,22 @@ def match (db, tx):
 
     feed_address = tx1['feed_address']
 
-    cursor.execute('''SELECT * FROM bets\
-                             WHERE (feed_address=? AND status=? AND bet_type=?)''',
-                             (tx1['feed_address'], 'open', counterbet_type))
     tx1_wager_remaining = tx1['wager_remaining']
     tx1_counterwager_remaining = tx1['counterwager_remaining']
-    bet_matches = cursor.fetchall()
-    if tx['block_index'] > 284500 or config.TESTNET:  # Protocol change.
-        sorted(bet_matches, key=lambda x: x['tx_index'])                                        # Sort by tx index second.
-        sorted(bet_matches, key=lambda x: util.price(x['wager_quantity'], x['counterwager_quantity'], tx1['block_index']))   # Sort by price first.
+
+    # From the book of bets on the same terms, within a block.
+    terms = (feed_address, counterbet_type, tx1['deadline'], tx1['leverage'], tx1['target_value'], tx1['fee_fraction_int'])
+    bet_matches = betbook.bets(db, terms)
+    if bet_matches is None:
+        cursor.execute('''SELECT * FROM bets\
+                                 WHERE (feed_address=? AND status=? AND bet_type=?)''',
+                                 (tx1['feed_address'], 'open', counterbet_type))
+        bet_matches = cursor.fetchall()
+        # NOTE: The sorted lists are discarded, and so bets are considered in
+        # the order in which they are selected (and inserted).
+        if tx['block_index'] > 284500 or config.TESTNET:  # Protocol change.
+            sorted(bet_matches, key=lambda x: x['tx_index'])                                        # Sort by tx index second.
+            sorted(bet_matches, key=lambda x: util.price(x['wager_quantity'], x['counterwager_quantity'], tx1['block_index']))   # Sort by price first.
 
     tx1_status = tx1['status']
     for tx0 in bet_matches:
@@ -332,15 +318,12 @@ def match (db, tx):
                 # Fill order, and recredit give_remaining.
                 tx0_status = 'filled'
                 util.credit(db, tx1['block_index'], tx0['source'], config.XPT, tx0_wager_remaining, event=tx1['tx_hash'], action='filled')
-            bindings = {
+            changes = {
                 'wager_remaining': tx0_wager_remaining,
                 'counterwager_remaining': tx0_counterwager_remaining,
-                'status': tx0_status,
-                'tx_hash': tx0['tx_hash']
+                'status': tx0_status
             }
-            sql='update bets set wager_remaining = :wager_remaining, counterwager_remaining = :counterwager_remaining, status = :status where tx_hash = :tx_hash'
-            cursor.execute(sql, bindings)
-            util.message(db, tx1['block_index'], 'update', 'bets', bindings)
+            ledger.update(db, 'bets', {'tx_hash': tx0['tx_hash']}, changes, tx1['block_index'])
 
             if tx1['block_index'] >= 292000 or config.TESTNET:  # Protocol change
                 if tx1_wager_remaining <= 0 or tx1_counterwager_remaining <= 0:
@@ -348,19 +331,15 @@ def match (db, tx):
                     tx1_status = 'filled'
                     util.credit(db, tx1['block_index'], tx1['source'], config.XPT, tx1_wager_remaining, event=tx1['tx_hash'], action='filled')
             # tx1
-            bindings = {
+            changes = {
                 'wager_remaining': tx1_wager_remaining,
                 'counterwager_remaining': tx1_counterwager_remaining,
-                'status': tx1_status,
-                'tx_hash': tx1['tx_hash']
+                'status': tx1_status
             }
-            sql='update bets set wager_remaining = :wager_remaining, counterwager_remaining = :counterwager_remaining, status = :status where tx_hash = :tx_hash'
-            cursor.execute(sql, bindings)
-            util.message(db, tx1['block_index'], 'update', 'bets', bindings)
+            ledger.update(db, 'bets', {'tx_hash': tx1['tx_hash']}, changes, tx1['block_index'])
 
             # Get last value of feed.
-            broadcasts = list(cursor.execute('''SELECT * FROM broadcasts WHERE (status = ? AND source = ?) ORDER BY tx_index ASC''', ('valid', feed_address)))
-            initial_value = broadcasts[-1]['value']
+            initial_value = util.last_broadcast(db, feed_address)['value']
 
             # Record bet fulfillment.
             bindings = {
@@ -389,8 +368,7 @@ def match (db, tx):
                 'fee_fraction_int': tx1['fee_fraction_int'],
                 'status': 'pending',
             }
-            sql='insert into bet_matches values(:id, :tx0_index, :tx0_hash, :tx0_address, :tx1_index, :tx1_hash, :tx1_address, :tx0_bet_type, :tx1_bet_type, :feed_address, :initial_value, :deadline, :target_value, :leverage, :forward_quantity, :backward_quantity, :tx0_block_index, :tx1_block_index, :block_index, :tx0_expiration, :tx1_expiration, :match_expire_index, :fee_fraction_int, :status)'
-            cursor.execute(sql, bindings)
+            ledger.insert(db, 'bet_matches', bindings)
 
     cursor.close()
     return
@@ -411,8 +389,7 @@ def expire (db, block_index, block_time):
             'source': bet['source'],
             'block_index': block_index
         }
-        sql='insert into bet_expirations values(:bet_index, :bet_hash, :source, :block_index)'
-        cursor.execute(sql, bindings)
+        ledger.insert(db, 'bet_expirations', bindings)
 
     # Expire bet matches whose deadline is more than two weeks before the current block time.
     cursor.execute('''SELECT * FROM bet_matches \
@@ -427,8 +404,7 @@ def expire (db, block_index, block_time):
             'tx1_address': bet_match['tx1_address'],
             'block_index': block_index
         }
-        sql='insert into bet_match_expirations values(:bet_match_id, :tx0_address, :tx1_address, :block_index)'
-        cursor.execute(sql, bindings)
+        ledger.insert(db, 'bet_match_expirations', bindings)
 
     cursor.close()
 
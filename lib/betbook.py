@@ -0,0 +1,114 @@
+#! /usr/bin/python3
+
+"""
+Books of the open bets, for `bet.match()` to find those that a new bet may
+be matched with, without selecting every open bet of the opposite type on
+the feed and checking the terms of each.
+
+There is a book for each feed and set of terms (`feed_address`,
+`bet_type`, `deadline`, `leverage`, `target_value` and
+`fee_fraction_int`), which lists the open bets on those terms by
+`tx_index`: the order in which they are inserted, and so in which
+`bet.match()` has always considered them. The bets themselves are read
+from the database as they are needed.
+
+As for the books of orders (`orderbook`), a book is read from the `bets`
+table the first time that it is needed, and then kept current by
+`ledger.insert()` and `ledger.update()`, as bets are opened, filled,
+cancelled, dropped and expired.
+"""
+
+import bisect
+
+from . import blockstate
+
+BOOKS = {}          # terms -> sorted list of tx_index.
+PENDING = None      # Set while a block is being parsed.
+
+TERMS = ['feed_address', 'bet_type', 'deadline', 'leverage', 'target_value', 'fee_fraction_int']
+
+class Changes (blockstate.BlockState):
+    """Books changed by the block being parsed."""
+    def __init__(self):
+        super().__init__()
+        self.books = {}
+
+def get_terms (bet):
+    return tuple([bet[field] for field in TERMS])
+
+def load (db, terms):
+    cursor = db.cursor()
+    bets = list(cursor.execute('''SELECT tx_index FROM bets \
+                                  WHERE ({} AND status = ?)'''.format(' AND '.join(['{} = ?'.format(field) for field in TERMS])), terms + ('open',)))
+    cursor.close()
+    return sorted([bet['tx_index'] for bet in bets])
+
+def get_book (db, changes, terms):
+    if terms in changes.books:
+        return changes.books[terms]
+    if terms not in BOOKS:
+        BOOKS[terms] = load(db, terms)  # (The block hasn’t changed these bets.)
+    return BOOKS[terms]
+
+def bets (db, terms):
+    """Return an iterator over the open bets on `terms`, by `tx_index`, or
+    `None` outside of a block.
+    """
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        return None
+    return iterate(db, get_book(db, changes, terms))
+
+def iterate (db, book):
+    # The book may lose the bets already considered on the way, as they are
+    # filled.
+    position = 0
+    while position < len(book):
+        tx_index = book[position]
+        cursor = db.cursor()
+        bet = list(cursor.execute('''SELECT * FROM bets WHERE tx_index = ?''', (tx_index,)))[0]
+        cursor.close()
+        yield bet
+        position = bisect.bisect_right(book, tx_index)
+
+def change (db, bet, opened):
+    """Note that `bet` has been opened, or closed, after the fact."""
+    terms = get_terms(bet)
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        BOOKS.pop(terms, None)
+        return
+
+    if terms not in changes.books:
+        if terms not in BOOKS:
+            changes.books[terms] = load(db, terms)  # (With the change.)
+            return
+        changes.books[terms] = list(BOOKS[terms])
+    book = changes.books[terms]
+    if opened:
+        bisect.insort(book, bet['tx_index'])
+    else:
+        position = bisect.bisect_left(book, bet['tx_index'])
+        assert book[position] == bet['tx_index']
+        del book[position]
+
+def add (db, bet):
+    if bet['status'] == 'open':
+        change(db, bet, True)
+
+def replace (db, old_bet, new_bet):
+    if (old_bet['status'] == 'open') != (new_bet['status'] == 'open'):
+        change(db, new_bet, new_bet['status'] == 'open')
+
+def commit ():
+    """Publish the books changed by the block just parsed."""
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        return
+    BOOKS.update(changes.books)
+    changes.books = {}
+
+def clear ():
+    BOOKS.clear()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -11,13 +11,16 @@ import struct
 import decimal
 D = decimal.Decimal
 import logging
+import threading
 import collections
+import concurrent.futures
+import multiprocessing
 from Crypto.Cipher import ARC4
 import apsw
 import bitcoin as litecoinlib
 import bitcoin.rpc as litecoinlib_rpc
 
-from . import (config, exceptions, util, litecoin)
+from . import (config, exceptions, util, litecoin, schema, prevouts, undolog, snapshot, blockstate, assets, conservation, escrow, supply, orderbook, betbook, pairs)
 from . import (send, order, ltcpay, issuance, broadcast, bet, dividend, burn, cancel, callback, rps, rpsresolve)
 
 # Order matters for FOREIGN KEY constraints.
@@ -26,11 +29,19 @@ TABLES = ['credits', 'debits', 'messages'] + \
           'order_matches', 'order_expirations', 'orders', 'bet_match_expirations',
           'bet_matches', 'bet_expirations', 'bets', 'broadcasts', 'ltcpays',
           'burns', 'callbacks', 'cancels', 'dividends', 'issuances', 'sends',
-          'rps_match_expirations', 'rps_expirations', 'rpsresolves', 'rps_matches', 'rps']
+          'rps_match_expirations', 'rps_expirations', 'rpsresolves', 'rps_matches', 'rps',
+          'escrows', 'supplies']
+
+# Tables derived from the others, which are rebuilt rather than restored.
+DERIVED_TABLES = ['escrows', 'supplies']
+
+# Tables kept in snapshots; the derived ones are rebuilt from them.
+SNAPSHOT_TABLES = [table for table in TABLES if table not in DERIVED_TABLES] + ['balances']
 
 def check_conservation (db):
     logging.debug('Status: Checking for conservation of assets.')
 
+    supply.verify(db)
     supplies = util.supplies(db)
     for asset in supplies.keys():
 
@@ -43,6 +54,20 @@ def check_conservation (db):
             raise exceptions.SanityError('{} {} issued ≠ {} {} held'.format(util.devise(db, issued, asset, 'output'), asset, util.devise(db, held, asset, 'output'), asset))
         logging.debug('Status: {} has been conserved ({} {} both issued and held)'.format(asset, util.devise(db, issued, asset, 'output'), asset))
 
+def check_changes (db):
+    """Check for conservation of the assets that have changed since the last
+    check, or of all of them, outside of a block.
+    """
+    changes = blockstate.current(conservation.PENDING)
+    if changes is None:
+        check_conservation(db)
+        return
+    unbalanced = changes.unbalanced()
+    if unbalanced:
+        asset, issued, held = unbalanced[0]
+        raise exceptions.SanityError('{} {} issued ≠ {} {} held, since the last check'.format(util.devise(db, issued, asset, 'output'), asset, util.devise(db, held, asset, 'output'), asset))
+    changes.clear()
+
 def parse_tx (db, tx):
     cursor = db.cursor()
 
@@ -102,7 +127,7 @@ def parse_tx (db, tx):
 
     # Check for conservation of assets every CAREFULNESS transactions.
     if config.CAREFULNESS and not tx['tx_index'] % config.CAREFULNESS:
-        check_conservation(db)
+        check_changes(db)
 
     cursor.close()
     return True
@@ -167,27 +192,64 @@ def parse_block (db, block_index, block_time,
     util.BLOCK_LEDGER = []
     cursor = db.cursor()
 
-    # Expire orders, bets and rps.
-    order.expire(db, block_index)
-    bet.expire(db, block_index, block_time)
-    rps.expire(db, block_index)
-
-    # Parse transactions, sorting them by type.
-    cursor.execute('''SELECT * FROM transactions \
-                      WHERE block_index=? ORDER BY tx_index''',
-                   (block_index,))
-    txlist = []
-    for tx in list(cursor):
-        parse_tx(db, tx)
-        txlist.append(tx['tx_hash'])
+    # Balances and messages are written at the end of the block (or dropped,
+    # with it), and so are the records of the assets that it issues, the
+    # books of the orders and bets that it changes and the pairs that it
+    # matches.
+    util.BALANCE_CACHE = util.BalanceCache()
+    util.MESSAGE_BUFFER = util.MessageBuffer(db)
+    assets.PENDING = assets.Changes()
+    orderbook.PENDING = orderbook.Changes()
+    betbook.PENDING = betbook.Changes()
+    pairs.PENDING = pairs.Changes()
+    if config.CAREFULNESS:
+        conservation.PENDING = conservation.Changes()
+    try:
+        # Expire orders, bets and rps.
+        order.expire(db, block_index)
+        bet.expire(db, block_index, block_time)
+        rps.expire(db, block_index)
+
+        # Parse transactions, sorting them by type.
+        cursor.execute('''SELECT * FROM transactions \
+                          WHERE block_index=? ORDER BY tx_index''',
+                       (block_index,))
+        txlist = []
+        for tx in list(cursor):
+            parse_tx(db, tx)
+            txlist.append(tx['tx_hash'])
+        if config.CAREFULNESS:
+            check_changes(db)
+
+        util.flush_balances(db)
+        util.flush_messages(db)
+        cursor.close()
 
-    cursor.close()
+        ledger_hash = generate_ledger_hash(db, block_index, previous_ledger_hash, current_ledger_hash)
+        txlist_hash = generate_txlist_hash(db, block_index, txlist, previous_txlist_hash, current_txlist_hash)
+
+        # Only a block that passes its consensus checks changes the registry,
+        # the books and the pairs.
+        assets.commit()
+        orderbook.commit()
+        betbook.commit()
+        pairs.commit()
+    finally:
+        util.BALANCE_CACHE = None
+        util.MESSAGE_BUFFER = None
+        assets.PENDING = None
+        orderbook.PENDING = None
+        betbook.PENDING = None
+        pairs.PENDING = None
+        conservation.PENDING = None
 
-    ledger_hash = generate_ledger_hash(db, block_index, previous_ledger_hash, current_ledger_hash)
-    txlist_hash = generate_txlist_hash(db, block_index, txlist, previous_txlist_hash, current_txlist_hash)
     return ledger_hash, txlist_hash
 
 def initialise(db):
+    assets.clear()
+    orderbook.clear()
+    betbook.clear()
+    pairs.clear()
     cursor = db.cursor()
 
     # Blocks
@@ -197,12 +259,6 @@ def initialise(db):
                       block_time INTEGER,
                       PRIMARY KEY (block_index, block_hash))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON blocks (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      index_hash_idx ON blocks (block_index, block_hash)
-                   ''')
 
     # sqlite don't manage ALTER TABLE IF COLUMN NOT EXISTS
     columns = [column['name'] for column in cursor.execute('''PRAGMA table_info(blocks)''')]
@@ -234,21 +290,6 @@ def initialise(db):
                       FOREIGN KEY (block_index, block_hash) REFERENCES blocks(block_index, block_hash),
                       PRIMARY KEY (tx_index, tx_hash, block_index))
                     ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON transactions (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx_index_idx ON transactions (tx_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx_hash_idx ON transactions (tx_hash)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      index_index_idx ON transactions (block_index, tx_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      index_hash_index_idx ON transactions (tx_index, tx_hash, block_index)
-                   ''')
 
     # Purge database of blocks, transactions from before BLOCK_FIRST.
     cursor.execute('''DELETE FROM blocks WHERE block_index < ?''', (config.BLOCK_FIRST,))
@@ -265,12 +306,6 @@ def initialise(db):
                       event TEXT,
                       FOREIGN KEY (block_index) REFERENCES blocks(block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      address_idx ON debits (address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      asset_idx ON debits (asset)
-                   ''')
 
     # (Valid) credits
     cursor.execute('''CREATE TABLE IF NOT EXISTS credits(
@@ -282,12 +317,6 @@ def initialise(db):
                       event TEXT,
                       FOREIGN KEY (block_index) REFERENCES blocks(block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      address_idx ON credits (address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      asset_idx ON credits (asset)
-                   ''')
 
     # Balances
     cursor.execute('''CREATE TABLE IF NOT EXISTS balances(
@@ -295,15 +324,6 @@ def initialise(db):
                       asset TEXT,
                       quantity INTEGER)
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      address_asset_idx ON balances (address, asset)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      address_idx ON balances (address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      asset_idx ON balances (asset)
-                   ''')
 
     # Sends
     cursor.execute('''CREATE TABLE IF NOT EXISTS sends(
@@ -317,18 +337,6 @@ def initialise(db):
                       status TEXT,
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON sends (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON sends (source)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      destination_idx ON sends (destination)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      asset_idx ON sends (asset)
-                   ''')
 
     # Orders
     cursor.execute('''CREATE TABLE IF NOT EXISTS orders(
@@ -352,30 +360,6 @@ def initialise(db):
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index),
                       PRIMARY KEY (tx_index, tx_hash))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON orders (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      index_hash_idx ON orders (tx_index, tx_hash)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      expire_idx ON orders (expire_index, status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      give_status_idx ON orders (give_asset, status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_give_status_idx ON orders (source, give_asset, status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      give_get_status_idx ON orders (get_asset, give_asset, status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON orders (source)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      give_asset_idx ON orders (give_asset)
-                   ''')
 
     # Order Matches
     cursor.execute('''CREATE TABLE IF NOT EXISTS order_matches(
@@ -401,24 +385,6 @@ def initialise(db):
                       FOREIGN KEY (tx0_index, tx0_hash, tx0_block_index) REFERENCES transactions(tx_index, tx_hash, block_index),
                       FOREIGN KEY (tx1_index, tx1_hash, tx1_block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      match_expire_idx ON order_matches (status, match_expire_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      forward_status_idx ON order_matches (forward_asset, status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      backward_status_idx ON order_matches (backward_asset, status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      id_idx ON order_matches (id)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx0_address_idx ON order_matches (tx0_address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx1_address_idx ON order_matches (tx1_address)
-                   ''')
 
     # LTCpays
     cursor.execute('''CREATE TABLE IF NOT EXISTS ltcpays(
@@ -433,15 +399,6 @@ def initialise(db):
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
                       # Disallows invalids: FOREIGN KEY (order_match_id) REFERENCES order_matches(id))
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON ltcpays (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON ltcpays (source)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      destination_idx ON ltcpays (destination)
-                   ''')
 
     # Issuances
     cursor.execute('''CREATE TABLE IF NOT EXISTS issuances(
@@ -463,18 +420,6 @@ def initialise(db):
                       status TEXT,
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON issuances (block_index)
-                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      valid_asset_idx ON issuances (asset, status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      status_idx ON issuances (status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON issuances (source)
-                   ''')
 
     # Broadcasts
     cursor.execute('''CREATE TABLE IF NOT EXISTS broadcasts(
@@ -490,18 +435,6 @@ def initialise(db):
                       status TEXT,
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON broadcasts (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      status_source_idx ON broadcasts (status, source)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      status_source_index_idx ON broadcasts (status, source, tx_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      timestamp_idx ON broadcasts (timestamp)
-                   ''')
 
     # Bets.
     cursor.execute('''CREATE TABLE IF NOT EXISTS bets(
@@ -525,24 +458,6 @@ def initialise(db):
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index),
                       PRIMARY KEY (tx_index, tx_hash))
                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON bets (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      index_hash_idx ON bets (tx_index, tx_hash)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      expire_idx ON bets (status, expire_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      feed_valid_bettype_idx ON bets (feed_address, status, bet_type)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON bets (source)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      status_idx ON bets (status)
-                   ''')
 
     # Bet Matches
     cursor.execute('''CREATE TABLE IF NOT EXISTS bet_matches(
@@ -573,24 +488,6 @@ def initialise(db):
                       FOREIGN KEY (tx0_index, tx0_hash, tx0_block_index) REFERENCES transactions(tx_index, tx_hash, block_index),
                       FOREIGN KEY (tx1_index, tx1_hash, tx1_block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      match_expire_idx ON bet_matches (status, match_expire_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      valid_feed_idx ON bet_matches (feed_address, status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      id_idx ON bet_matches (id)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx0_address_idx ON bet_matches (tx0_address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx1_address_idx ON bet_matches (tx1_address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      status_idx ON bet_matches (status)
-                   ''')
 
     # Dividends
     cursor.execute('''CREATE TABLE IF NOT EXISTS dividends(
@@ -605,15 +502,6 @@ def initialise(db):
                       status TEXT,
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON dividends (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON dividends (source)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      asset_idx ON dividends (asset)
-                   ''')
 
     # Burns
     cursor.execute('''CREATE TABLE IF NOT EXISTS burns(
@@ -626,12 +514,6 @@ def initialise(db):
                       status TEXT,
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      status_idx ON burns (status)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      address_idx ON burns (source)
-                   ''')
 
     # Cancels
     cursor.execute('''CREATE TABLE IF NOT EXISTS cancels(
@@ -644,12 +526,6 @@ def initialise(db):
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
                       # Offer hash is not a foreign key. (And it cannot be, because of some invalid cancels.)
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      cancels_block_index_idx ON cancels (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON cancels (source)
-                   ''')
 
     # Callbacks
     cursor.execute('''CREATE TABLE IF NOT EXISTS callbacks(
@@ -662,15 +538,6 @@ def initialise(db):
                       status TEXT,
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON callbacks (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON callbacks (source)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      asset_idx ON callbacks (asset)
-                   ''')
 
     # RPS (Rock-Paper-Scissors)
     cursor.execute('''CREATE TABLE IF NOT EXISTS rps(
@@ -687,15 +554,6 @@ def initialise(db):
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index),
                       PRIMARY KEY (tx_index, tx_hash))
                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON rps (source)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      matching_idx ON rps (wager, possible_moves)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      status_idx ON rps (status)
-                   ''')
 
     # RPS Matches
     cursor.execute('''CREATE TABLE IF NOT EXISTS rps_matches(
@@ -720,18 +578,6 @@ def initialise(db):
                       FOREIGN KEY (tx0_index, tx0_hash, tx0_block_index) REFERENCES transactions(tx_index, tx_hash, block_index),
                       FOREIGN KEY (tx1_index, tx1_hash, tx1_block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      rps_match_expire_idx ON rps_matches (status, match_expire_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      rps_tx0_address_idx ON rps_matches (tx0_address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      rps_tx1_address_idx ON rps_matches (tx1_address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      status_idx ON rps_matches (status)
-                   ''')
 
     # RPS Resolves
     cursor.execute('''CREATE TABLE IF NOT EXISTS rpsresolves(
@@ -745,15 +591,6 @@ def initialise(db):
                       status TEXT,
                       FOREIGN KEY (tx_index, tx_hash, block_index) REFERENCES transactions(tx_index, tx_hash, block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON rpsresolves (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON rpsresolves (source)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      rps_match_id_idx ON rpsresolves (rps_match_id)
-                   ''')
 
     # Order Expirations
     cursor.execute('''CREATE TABLE IF NOT EXISTS order_expirations(
@@ -764,12 +601,6 @@ def initialise(db):
                       FOREIGN KEY (block_index) REFERENCES blocks(block_index),
                       FOREIGN KEY (order_index, order_hash) REFERENCES orders(tx_index, tx_hash))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON order_expirations (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON order_expirations (source)
-                   ''')
 
     # Bet Expirations
     cursor.execute('''CREATE TABLE IF NOT EXISTS bet_expirations(
@@ -780,12 +611,6 @@ def initialise(db):
                       FOREIGN KEY (block_index) REFERENCES blocks(block_index),
                       FOREIGN KEY (bet_index, bet_hash) REFERENCES bets(tx_index, tx_hash))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON bet_expirations (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON bet_expirations (source)
-                   ''')
 
     # RPS Expirations
     cursor.execute('''CREATE TABLE IF NOT EXISTS rps_expirations(
@@ -796,12 +621,6 @@ def initialise(db):
                       FOREIGN KEY (block_index) REFERENCES blocks(block_index),
                       FOREIGN KEY (rps_index, rps_hash) REFERENCES rps(tx_index, tx_hash))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON rps_expirations (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      source_idx ON rps_expirations (source)
-                   ''')
 
     # Order Match Expirations
     cursor.execute('''CREATE TABLE IF NOT EXISTS order_match_expirations(
@@ -812,15 +631,6 @@ def initialise(db):
                       FOREIGN KEY (order_match_id) REFERENCES order_matches(id),
                       FOREIGN KEY (block_index) REFERENCES blocks(block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON order_match_expirations (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx0_address_idx ON order_match_expirations (tx0_address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx1_address_idx ON order_match_expirations (tx1_address)
-                   ''')
 
     # Bet Match Expirations
     cursor.execute('''CREATE TABLE IF NOT EXISTS bet_match_expirations(
@@ -831,15 +641,6 @@ def initialise(db):
                       FOREIGN KEY (bet_match_id) REFERENCES bet_matches(id),
                       FOREIGN KEY (block_index) REFERENCES blocks(block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON bet_match_expirations (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx0_address_idx ON bet_match_expirations (tx0_address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx1_address_idx ON bet_match_expirations (tx1_address)
-                   ''')
 
     # Bet Match Resolutions
     cursor.execute('''CREATE TABLE IF NOT EXISTS bet_match_resolutions(
@@ -865,15 +666,12 @@ def initialise(db):
                       FOREIGN KEY (rps_match_id) REFERENCES rps_matches(id),
                       FOREIGN KEY (block_index) REFERENCES blocks(block_index))
                    ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON rps_match_expirations (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx0_address_idx ON rps_match_expirations (tx0_address)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      tx1_address_idx ON rps_match_expirations (tx1_address)
-                   ''')
+
+    # Escrows (derived from orders, bets, rps and their matches)
+    escrow.initialise(db)
+
+    # Supplies (derived from burns, issuances and dividends)
+    supply.initialise(db)
 
     # Messages
     cursor.execute('''CREATE TABLE IF NOT EXISTS messages(
@@ -885,12 +683,6 @@ def initialise(db):
                       timestamp INTEGER)
                   ''')
                       # TODO: FOREIGN KEY (block_index) REFERENCES blocks(block_index) DEFERRABLE INITIALLY DEFERRED)
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_idx ON messages (block_index)
-                   ''')
-    cursor.execute('''CREATE INDEX IF NOT EXISTS
-                      block_index_message_index_idx ON messages (block_index, message_index)
-                   ''')
 
     # Mempool messages
     # NOTE: `status`, 'block_index` are removed from bindings.
@@ -903,7 +695,38 @@ def initialise(db):
                       timestamp INTEGER)
                   ''')
 
+    # Indexes
+    schema.migrate(db)
+
+    # Undo journal (for tables created above).
+    undolog.initialise(db)
+
     cursor.close()
+
+def get_prevouts (vins):
+    """Get the outputs spent by some inputs, in the form of the output of
+    `getrawtransaction <tx_hash> 1`: from the prevout cache if possible, and
+    otherwise by fetching their transactions (in one batch).
+    """
+    vouts, missing = {}, []
+    for vin in vins:
+        output = prevouts.get(vin['txid'], vin['vout'])
+        if output:
+            value, script = output
+            vouts[(vin['txid'], vin['vout'])] = {'value': value / config.UNIT,
+                                                 'n': vin['vout'],
+                                                 'scriptPubKey': {'asm': litecoin.script_to_asm(script),
+                                                                  'hex': binascii.hexlify(script).decode('utf-8')}}
+        elif vin['txid'] not in missing:
+            missing.append(vin['txid'])
+    if missing:
+        vin_txs = litecoin.get_raw_transactions(missing)
+        prevouts.add_transactions(vin_txs)
+        for vin in vins:
+            if vin['txid'] in missing:
+                vouts[(vin['txid'], vin['vout'])] = vin_txs[missing.index(vin['txid'])]['vout'][vin['vout']]
+    return [vouts[(vin['txid'], vin['vout'])] for vin in vins]
+
 def get_tx_info (tx, block_index):
     """
     The destination, if it exists, always comes before the data output; the
@@ -989,10 +812,10 @@ def get_tx_info (tx, block_index):
 
     # Collect all possible source addresses; ignore coinbase transactions and anything but the simplest Pay‐to‐PubkeyHash inputs.
     source_list = []
-    for vin in tx['vin']:                                               # Loop through input transactions.
+    for vin in tx['vin']:
         if 'coinbase' in vin: raise exceptions.DecodeError('coinbase transaction')
-        vin_tx = litecoin.get_raw_transaction(vin['txid'])     # Get the full transaction data for this input transaction.
-        vout = vin_tx['vout'][vin['vout']]
+    vouts = get_prevouts(tx['vin'])
+    for vout in vouts:                                                  # Loop through input transactions.
         fee += vout['value'] * config.UNIT
 
         address = get_address(vout['scriptPubKey'])
@@ -1015,7 +838,10 @@ def get_tx_info2 (tx, block_index):
     if config.TESTNET:
         litecoinlib.SelectParams('testnet')
     rpc = litecoinlib_rpc.Proxy(service_url=config.BACKEND_RPC)
-    ctx = rpc.getrawtransaction(litecoinlib.core.lx(tx['txid']))
+    if 'hex' in tx:     # Already fetched (in whole raw blocks, say).
+        ctx = litecoinlib.core.CTransaction.deserialize(binascii.unhexlify(bytes(tx['hex'], 'utf-8')))
+    else:
+        ctx = rpc.getrawtransaction(litecoinlib.core.lx(tx['txid']))
 
     def arc4_decrypt (cyphertext):
         '''Un‐obfuscate. Initialise key once per attempt.'''
@@ -1139,11 +965,18 @@ def get_tx_info2 (tx, block_index):
     # Collect all (unique) source addresses.
     sources = []
     for vin in ctx.vin[:]:                                              # Loop through inputs.
-        vin_ctx = rpc.getrawtransaction(vin.prevout.hash) # Get the full transaction data for this input transaction.
-        vout = vin_ctx.vout[vin.prevout.n]
-        fee += vout.nValue
+        vin_txid = litecoinlib.core.b2lx(vin.prevout.hash)
+        output = prevouts.get(vin_txid, vin.prevout.n)
+        if output:
+            value, script = output
+            script = litecoinlib.core.script.CScript(script)
+        else:
+            vin_ctx = rpc.getrawtransaction(vin.prevout.hash) # Get the full transaction data for this input transaction.
+            prevouts.add_ctransaction(vin_txid, vin_ctx)
+            value, script = vin_ctx.vout[vin.prevout.n].nValue, vin_ctx.vout[vin.prevout.n].scriptPubKey
+        fee += value
 
-        asm = get_asm(vout.scriptPubKey)
+        asm = get_asm(script)
         if asm[-1] == 'OP_CHECKSIG':
             new_source, new_data = decode_checksig(asm)
             if new_data or not new_source: raise exceptions.DecodeError('data in source')
@@ -1166,62 +999,158 @@ def reparse (db, block_index=None, quiet=False):
     """Reparse all transactions (atomically). If block_index is set, rollback
     to the end of that block.
     """
+    if block_index:
+        snapshot.prune(block_index)
+
+    # Recent blocks are rolled back with the undo journal.
+    if block_index and undolog.rollback(db, block_index):
+        assets.clear()
+        orderbook.clear()
+        betbook.clear()
+        pairs.clear()
+        return
+
     logging.warning('Status: Reparsing all transactions.')
     cursor = db.cursor()
 
-    with db:
-
-        # Delete all of the results of parsing.
-        for table in TABLES + ['balances']:
-            cursor.execute('''DROP TABLE IF EXISTS {}'''.format(table))
-
-        # clean consensus hashes if first block hash don't match with checkpoint.
-        checkpoints = config.CHECKPOINTS_TESTNET if config.TESTNET else config.CHECKPOINTS_MAINNET
-        columns = [column['name'] for column in cursor.execute('''PRAGMA table_info(blocks)''')]
-        for field, check_hash_pos in [('ledger_hash', 0), ('txlist_hash', 1)]:
-            if field in columns:
-                sql = '''SELECT {} FROM blocks  WHERE block_index = ?'''.format(field)
-                first_hash = list(cursor.execute(sql, (config.BLOCK_FIRST,)))[0][field]
-                if first_hash != checkpoints[config.BLOCK_FIRST][check_hash_pos]:
-                    logging.info('First hash changed. Cleaning {}.'.format(field))
-                    cursor.execute('''UPDATE blocks SET {} = NULL'''.format(field))
-
-        # For rollbacks, just delete new blocks and then reparse what’s left.
-        if block_index:
-            cursor.execute('''DELETE FROM transactions WHERE block_index > ?''', (block_index,))
-            cursor.execute('''DELETE FROM blocks WHERE block_index > ?''', (block_index,))
-
-        # Reparse all blocks, transactions.
-        if quiet:
-            log = logging.getLogger('')
-            log.setLevel(logging.WARNING)
-        initialise(db)
-        previous_ledger_hash = None
-        previous_txlist_hash = None
-        cursor.execute('''SELECT * FROM blocks ORDER BY block_index''')
-        for block in cursor.fetchall():
-            logging.info('Block (re‐parse): {}'.format(str(block['block_index'])))
-            previous_ledger_hash, previous_txlist_hash = parse_block(db, block['block_index'], block['block_time'], 
-                                                                     previous_ledger_hash, block['ledger_hash'],
-                                                                     previous_txlist_hash, block['txlist_hash'])
-        if quiet:
-            log.setLevel(logging.INFO)
-
-        # Check for conservation of assets.
-        check_conservation(db)
+    # clean consensus hashes if first block hash don't match with checkpoint.
+    checkpoints = config.CHECKPOINTS_TESTNET if config.TESTNET else config.CHECKPOINTS_MAINNET
+    columns = [column['name'] for column in cursor.execute('''PRAGMA table_info(blocks)''')]
+    clean_fields = []
+    for field, check_hash_pos in [('ledger_hash', 0), ('txlist_hash', 1)]:
+        if field in columns:
+            sql = '''SELECT {} FROM blocks  WHERE block_index = ?'''.format(field)
+            first_hash = list(cursor.execute(sql, (config.BLOCK_FIRST,)))[0][field]
+            if first_hash != checkpoints[config.BLOCK_FIRST][check_hash_pos]:
+                clean_fields.append(field)
+
+    # Roll back from the newest snapshot that is still valid, if any. (A full
+    # reparse replays every block, to rebuild and check all of the state.)
+    snapshot_block_index = None
+    if block_index and 'ledger_hash' in columns and not clean_fields:
+        snapshot_block_index = snapshot.find(db, block_index)
+    if snapshot_block_index:
+        logging.warning('Status: Restoring snapshot at block {}.'.format(snapshot_block_index))
+        snapshot.attach(db, snapshot_block_index)
+
+    try:
+        with db:
 
-        # Update minor version number.
-        minor_version = cursor.execute('PRAGMA user_version = {}'.format(int(config.VERSION_MINOR))) # Syntax?!
-        logging.info('Status: Database minor version number updated.')
+            # Delete all of the results of parsing (or, for a snapshot to
+            # restore, just their rows).
+            for table in TABLES + ['balances']:
+                if snapshot_block_index:
+                    cursor.execute('''DELETE FROM {}'''.format(table))
+                else:
+                    cursor.execute('''DROP TABLE IF EXISTS {}'''.format(table))
+
+            for field in clean_fields:
+                logging.info('First hash changed. Cleaning {}.'.format(field))
+                cursor.execute('''UPDATE blocks SET {} = NULL'''.format(field))
+
+            # For rollbacks, just delete new blocks and then reparse what’s left.
+            if block_index:
+                cursor.execute('''DELETE FROM transactions WHERE block_index > ?''', (block_index,))
+                cursor.execute('''DELETE FROM blocks WHERE block_index > ?''', (block_index,))
+
+            # Reparse all blocks, transactions (after the snapshot).
+            if quiet:
+                log = logging.getLogger('')
+                log.setLevel(logging.WARNING)
+            initialise(db)
+            undolog.clear(db)
+            previous_ledger_hash = None
+            previous_txlist_hash = None
+            first_block_index = config.BLOCK_FIRST
+            if snapshot_block_index:
+                snapshot.restore(db, SNAPSHOT_TABLES)
+                escrow.rebuild(db)
+                supply.rebuild(db)
+                snapshot_block = list(cursor.execute('''SELECT * FROM blocks WHERE block_index = ?''', (snapshot_block_index,)))[0]
+                previous_ledger_hash, previous_txlist_hash = snapshot_block['ledger_hash'], snapshot_block['txlist_hash']
+                first_block_index = snapshot_block_index + 1
+            cursor.execute('''SELECT * FROM blocks WHERE block_index >= ? ORDER BY block_index''', (first_block_index,))
+            for block in cursor.fetchall():
+                logging.info('Block (re‐parse): {}'.format(str(block['block_index'])))
+                previous_ledger_hash, previous_txlist_hash = parse_block(db, block['block_index'], block['block_time'], 
+                                                                         previous_ledger_hash, block['ledger_hash'],
+                                                                         previous_txlist_hash, block['txlist_hash'])
+            if quiet:
+                log.setLevel(logging.INFO)
+            undolog.initialise(db)
+
+            # Check for conservation of assets.
+            check_conservation(db)
+
+            # Update minor version number.
+            minor_version = cursor.execute('PRAGMA user_version = {}'.format(int(config.VERSION_MINOR))) # Syntax?!
+            logging.info('Status: Database minor version number updated.')
+    finally:
+        if snapshot_block_index:
+            snapshot.detach(db)
+        assets.clear()  # (In case of a failure, after some blocks have been parsed.)
+        orderbook.clear()
+        betbook.clear()
+        pairs.clear()
 
     cursor.close()
     return
 
-def list_tx (db, block_hash, block_index, block_time, tx_hash, tx_index):
-    # Get the important details about each transaction.
-    tx = litecoin.get_raw_transaction(tx_hash)
-    logging.debug('Status: examining transaction {}.'.format(tx_hash))
+# Output scripts that can carry neither data nor a burn, by (length, prefix, suffix).
+NO_DATA_SCRIPTS = [
+    (23, b'\xa9\x14', b'\x87'),    # Pay‐to‐ScriptHash
+    (22, b'\x00\x14', b''),        # Pay‐to‐WitnessPubkeyHash
+    (34, b'\x00\x20', b''),        # Pay‐to‐WitnessScriptHash
+    (34, b'\x51\x20', b''),        # Pay‐to‐Taproot
+    (35, b'\x21', b'\xac'),         # Pay‐to‐Pubkey (compressed)
+    (67, b'\x41', b'\xac'),         # Pay‐to‐Pubkey (uncompressed)
+]
+PUBKEYHASH_SCRIPT = (25, litecoin.OP_DUP + litecoin.OP_HASH160 + b'\x14', litecoin.OP_EQUALVERIFY + litecoin.OP_CHECKSIG)
+
+UNSPENDABLE_PUBKEYHASHES = {}
+def get_unspendable_pubkeyhash ():
+    key = (config.UNSPENDABLE, config.ADDRESSVERSION)
+    if key not in UNSPENDABLE_PUBKEYHASHES:
+        UNSPENDABLE_PUBKEYHASHES[key] = litecoin.base58_check_decode(config.UNSPENDABLE, config.ADDRESSVERSION)
+    return UNSPENDABLE_PUBKEYHASHES[key]
+
+def prefilter (tx):
+    """Cheap first pass over the output scripts of a transaction. Return False
+    only if neither `get_tx_info` nor `get_tx_info2` could find data with the
+    prefix in it, or a burn; anything unfamiliar is left to them.
+    """
+    if 'coinbase' in tx['vin'][0]:
+        return False
+    key = None
+    unspendable_pubkeyhash = get_unspendable_pubkeyhash()
 
+    for vout in tx['vout']:
+        script = binascii.unhexlify(bytes(vout['scriptPubKey']['hex'], 'utf-8'))
+        if not script:
+            continue
+
+        # OP_RETURN and multi‐sig data.
+        if script[:1] == litecoin.OP_RETURN or script[-1:] == litecoin.OP_CHECKMULTISIG:
+            return True
+
+        # Pubkeyhash data (obfuscated), and burns.
+        length, prefix, suffix = PUBKEYHASH_SCRIPT
+        if len(script) == length and script.startswith(prefix) and script.endswith(suffix):
+            pubkeyhash = script[3:23]
+            if pubkeyhash == unspendable_pubkeyhash:
+                return True
+            if not key:
+                key = binascii.unhexlify(bytes(tx['vin'][0]['txid'], 'utf-8'))
+            if ARC4.new(key).decrypt(pubkeyhash)[1:len(config.PREFIX) + 1] == config.PREFIX:
+                return True
+            continue
+
+        if not any(len(script) == length and script.startswith(prefix) and script.endswith(suffix) for length, prefix, suffix in NO_DATA_SCRIPTS):
+            return True
+
+    return False
+
+def get_any_tx_info (tx, block_index):
     try:
         if (config.TESTNET and block_index >= config.FIRST_MULTISIG_BLOCK_TESTNET):  # Protocol change.
             tx_info = get_tx_info2(tx, block_index)
@@ -1230,6 +1159,76 @@ def list_tx (db, block_hash, block_index, block_time, tx_hash, tx_index):
     except exceptions.DecodeError as e:
         logging.debug('Could not decode: ' + str(e))
         tx_info = b'', None, None, None, None
+    return tx_info
+
+def reject_tx (tx_hash, tx, block_index):
+    logging.debug('Could not decode: rejected by prefilter')
+    if config.CHECK_PREFILTER:
+        source, destination, ltc_amount, fee, data = get_any_tx_info(tx, block_index)
+        assert not (source and (data or destination == config.UNSPENDABLE)), 'prefilter rejected valid transaction {}'.format(tx_hash)
+    return b'', None, None, None, None
+
+def decode_tx (tx_hash, block_index, tx=None):
+    # Get the important details about each transaction.
+    if tx is None:
+        tx = litecoin.get_raw_transaction(tx_hash)
+    logging.debug('Status: examining transaction {}.'.format(tx_hash))
+
+    if prefilter(tx):
+        return get_any_tx_info(tx, block_index)
+    else:
+        return reject_tx(tx_hash, tx, block_index)
+
+DECODE_POOL = None
+
+def init_decode_worker ():
+    # Nothing that the parent had open may be shared with it: not the prevout
+    # cache’s database connection (nor its lock, which a prefetching thread
+    # might have held at the fork), nor the keep‐alive connection to the
+    # backend, nor the pool itself.
+    global DECODE_POOL
+    DECODE_POOL = None
+    prevouts.CACHE = None
+    prevouts.CACHE_LOCK = threading.Lock()
+    litecoin.litecoin_rpc_session = None
+
+def get_decode_pool ():
+    """Return the pool of decoding processes, or `None` if it is disabled."""
+    global DECODE_POOL
+    if DECODE_POOL is None and config.DECODE_WORKERS:
+        logging.debug('Status: Starting {} decoding processes.'.format(config.DECODE_WORKERS))
+        DECODE_POOL = multiprocessing.Pool(config.DECODE_WORKERS, init_decode_worker)
+    return DECODE_POOL
+
+def decode_candidate (args):
+    tx_hash, block_index, tx = args
+    logging.debug('Status: examining transaction {}.'.format(tx_hash))
+    return get_any_tx_info(tx, block_index)
+
+def decode_txs (block_index, tx_hashes, txs):
+    """Decode the transactions of a block, on the pool of decoding processes
+    if there is one. Results are in the order of the transactions.
+    """
+    candidates = [prefilter(tx) for tx in txs]
+    pool = get_decode_pool()
+    if pool:
+        # Only transactions that pass the prefilter are worth sending over.
+        args = [(tx_hash, block_index, tx) for tx_hash, tx, candidate in zip(tx_hashes, txs, candidates) if candidate]
+        decoded = iter(pool.map(decode_candidate, args))
+    else:
+        decoded = (get_any_tx_info(tx, block_index) for tx, candidate in zip(txs, candidates) if candidate)
+
+    tx_info_list = []
+    for tx_hash, tx, candidate in zip(tx_hashes, txs, candidates):
+        if candidate:
+            tx_info_list.append((tx_hash, next(decoded)))
+        else:
+            tx_info_list.append((tx_hash, reject_tx(tx_hash, tx, block_index)))
+    return tx_info_list
+
+def list_tx (db, block_hash, block_index, block_time, tx_hash, tx_index, tx_info=None):
+    if tx_info is None:
+        tx_info = decode_tx(tx_hash, block_index)
     source, destination, ltc_amount, fee, data = tx_info
 
     # For mempool
@@ -1267,6 +1266,120 @@ def list_tx (db, block_hash, block_index, block_time, tx_hash, tx_index):
 
     return
 
+def fetch_block (block_index):
+    """Get a block and decode its transactions, without touching the database."""
+    block_hash = litecoin.get_block_hash(block_index)
+    block, txs = None, None
+    if config.RAW_BLOCKS:
+        # One call, and no JSON decoding of every transaction.
+        try:
+            block, txs = litecoin.deserialise_block(litecoin.get_raw_block(block_hash))
+        except exceptions.DecodeError as e:
+            logging.warning('Warning: Could not deserialise raw block {} ({}); falling back to verbose RPC calls.'.format(block_index, e))
+    if not block:
+        block = litecoin.get_block(block_hash)
+        txs = litecoin.get_raw_transactions(block['tx'])
+    prevouts.add_transactions(txs)
+    tx_info_list = decode_txs(block_index, block['tx'], txs)
+    return block_hash, block, tx_info_list
+
+class BlockPrefetcher (object):
+    """Fetch and decode the next `depth` blocks on worker threads, while the
+    current one is parsed. Blocks are always handed out in order.
+    """
+    def __init__(self, depth):
+        self.depth = depth
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(depth, config.PREFETCH_THREADS))
+        self.queue = collections.deque()    # Entries in form of (block_index, future), in order.
+        self.stall_time = 0
+
+    def reset(self):
+        """Drop everything prefetched, e.g. after a reorganisation."""
+        for block_index, future in self.queue:
+            future.cancel()
+        self.queue.clear()
+
+    def get(self, block_index, block_count):
+        if self.queue and self.queue[0][0] != block_index:
+            self.reset()
+
+        # Top up the queue, without going past the tip.
+        next_index = self.queue[-1][0] + 1 if self.queue else block_index
+        while next_index <= min(block_index + self.depth, block_count):
+            self.queue.append((next_index, self.executor.submit(fetch_block, next_index)))
+            next_index += 1
+
+        future = self.queue.popleft()[1]
+        starttime = time.time()
+        result = future.result()
+        stall_time = time.time() - starttime
+        self.stall_time += stall_time
+        ready = len([f for i, f in self.queue if f.done()])
+        logging.debug('Status: Prefetch queue: {} blocks ({} ready); stalled {:.2f}s ({:.2f}s in total).'.format(len(self.queue), ready, stall_time, self.stall_time))
+        return result
+
+class CatchUpBatch (object):
+    """While far behind the backend, group blocks into one transaction,
+    committed every `config.CATCH_UP_BLOCKS` blocks or
+    `config.CATCH_UP_SECONDS` seconds, with `synchronous = NORMAL`: in WAL
+    mode, a crash may lose the last commits, but never leaves the database
+    inconsistent. Each block is still parsed within its own savepoint (`with
+    db:`), so that whatever is committed ends at the end of a block.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.blocks = 0
+        self.start_time = None
+        self.synchronous = None
+
+    def is_open(self):
+        return self.start_time is not None
+
+    def begin(self):
+        cursor = self.db.cursor()
+        self.synchronous = list(cursor.execute('''PRAGMA synchronous'''))[0]['synchronous']
+        cursor.execute('''PRAGMA synchronous = NORMAL''')
+        cursor.execute('''BEGIN''')
+        cursor.close()
+        self.blocks = 0
+        self.start_time = time.time()
+
+    def commit(self):
+        if not self.is_open():
+            return
+        cursor = self.db.cursor()
+        # If SQLite has rolled the batch back already (after an error), its
+        # blocks are lost: parsing must start again after the last commit.
+        rolled_back = self.db.getautocommit()
+        if not rolled_back:
+            cursor.execute('''COMMIT''')
+        cursor.execute('''PRAGMA synchronous = {}'''.format(int(self.synchronous)))
+        cursor.close()
+        duration = time.time() - self.start_time
+        self.start_time = None
+        if rolled_back:
+            raise exceptions.DatabaseError('Batch of {} blocks rolled back.'.format(self.blocks))
+        logging.debug('Status: Committed {} blocks in {:.2f}s.'.format(self.blocks, duration))
+
+    def before_block(self, block_index, block_count):
+        """Open a batch when far behind, and close it when near the tip."""
+        catching_up = config.CATCH_UP_BLOCKS and block_count - block_index > config.CATCH_UP_DISTANCE
+        if catching_up and not self.is_open():
+            logging.info('Status: Catching up ({} blocks behind).'.format(block_count - block_index))
+            self.begin()
+        elif not catching_up and self.is_open():
+            self.commit()
+
+    def after_block(self, block_index):
+        """Commit if the batch is full or old, or if a snapshot is due."""
+        if not self.is_open():
+            return
+        self.blocks += 1
+        if (self.blocks >= config.CATCH_UP_BLOCKS or
+            time.time() - self.start_time >= config.CATCH_UP_SECONDS or
+            snapshot.is_due(block_index)):
+            self.commit()
+
 def follow (db):
     cursor = db.cursor()
 
@@ -1305,22 +1418,40 @@ def follow (db):
     # a reorg can happen without the block count increasing, or even for that
         # matter, with the block count decreasing. This should only delay
         # processing of the new blocks a bit.
+    get_decode_pool()  # Fork before there are any prefetching threads.
+    if config.PREFETCH_DEPTH:
+        prefetcher = BlockPrefetcher(config.PREFETCH_DEPTH)
+    else:
+        prefetcher = None
+    batch = CatchUpBatch(db)
     while True:
         starttime = time.time()
         # Get new blocks.
         block_count = litecoin.get_block_count()
         if block_index <= block_count:
+            batch.before_block(block_index, block_count)
+
+            # Get the block, and decode its transactions.
+            if prefetcher:
+                block_hash, block, tx_info_list = prefetcher.get(block_index, block_count)
+            else:
+                block_hash, block, tx_info_list = fetch_block(block_index)
 
             # Backwards check for incorrect blocks due to chain reorganisation, and stop when a common parent is found.
             c = block_index
+            litecoind_hashes = collections.deque()
             requires_rollback = False
             while True:
                 if c == config.BLOCK_FIRST: break
 
                 # Litecoind parent hash.
-                c_hash = litecoin.get_block_hash(c)
-                c_block = litecoin.get_block(c_hash)
-                litecoind_parent = c_block['previousblockhash']
+                if c == block_index:
+                    litecoind_parent = block['previousblockhash']
+                else:
+                    if not litecoind_hashes:    # Walk back one batch of blocks at a time.
+                        parent_indexes = range(c - 1, max(c - 1 - config.RPC_BATCH_SIZE, config.BLOCK_FIRST - 1), -1)
+                        litecoind_hashes.extend(litecoin.get_block_hashes(list(parent_indexes)))
+                    litecoind_parent = litecoind_hashes.popleft()
 
                 # DB parent hash.
                 blocks = list(cursor.execute('''SELECT * FROM blocks
@@ -1340,18 +1471,19 @@ def follow (db):
                 # Record reorganisation.
                 logging.warning('Status: Blockchain reorganisation at block {}.'.format(c))
                 util.message(db, block_index, 'reorg', None, {'block_index': c})
+                batch.commit()
 
                 # Rollback the DB.
                 reparse(db, block_index=c-1, quiet=True)
                 block_index = c
+                if prefetcher: prefetcher.reset()
                 continue
 
-            # Get and parse transactions in this block (atomically).
-            block_hash = litecoin.get_block_hash(block_index)
-            block = litecoin.get_block(block_hash)
+            # Parse transactions in this block (atomically).
             block_time = block['time']
-            tx_hash_list = block['tx']
             with db:
+                undolog.start_block(db, block_index)
+
                 # List the block.
                 cursor.execute('''INSERT INTO blocks(
                                     block_index,
@@ -1363,15 +1495,19 @@ def follow (db):
                               )
 
                 # List the transactions in the block.
-                for tx_hash in tx_hash_list:
-                    list_tx(db, block_hash, block_index, block_time, tx_hash, tx_index)
+                for tx_hash, tx_info in tx_info_list:
+                    list_tx(db, block_hash, block_index, block_time, tx_hash, tx_index, tx_info=tx_info)
                     tx_index += 1
 
                 # Parse the transactions in the block.
                 parse_block(db, block_index, block_time)
 
-            # When newly caught up, check for conservation of assets.
-            if block_index == block_count:
+            batch.after_block(block_index)
+            snapshot.take(db, block_index, SNAPSHOT_TABLES)
+
+            # When newly caught up, and every AUDIT_INTERVAL blocks, check for
+            # conservation of (all) assets.
+            if block_index == block_count or (config.AUDIT_INTERVAL and not block_index % config.AUDIT_INTERVAL):
                 check_conservation(db)
 
             # Remove any non‐supported transactions older than ten blocks.
@@ -1379,12 +1515,17 @@ def follow (db):
                 (i, tx_h) = not_supported_sorted.popleft()
                 del not_supported[tx_h]
             
+            prevout_stats = prevouts.stats()
+            if prevout_stats:
+                logging.debug('Status: Prevout cache: {size} entries; {hits} hits, {disk_hits} disk hits, {misses} misses.'.format(**prevout_stats))
             logging.info('Block: %s (%ss)'%(str(block_index), "{:.2f}".format(time.time() - starttime, 3)))
             # Increment block index.
             block_count = litecoin.get_block_count()
             block_index +=1
 
         else:
+            batch.commit()
+
             # First mempool fill for session?
             if mempool_initialised:
                 logging.debug('Status: Updating mempool.')
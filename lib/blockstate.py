@@ -0,0 +1,28 @@
+#! /usr/bin/python3
+
+"""
+State of the block being parsed, which is kept apart until the block has
+been parsed (then written or published), and dropped with it otherwise:
+the balances and messages that it writes (`util`), the records of the assets
+that it issues (`assets`), the books of the orders and bets that it changes
+(`orderbook`, `betbook`), the pairs that it matches (`pairs`) and its
+changes to the quantities of assets (`conservation`).
+
+Only the thread that parses the block sees that state: the API server must
+not see (or fill) it, and reads the database instead.
+"""
+
+import threading
+
+class BlockState (object):
+    """State that belongs to the thread that creates it."""
+    def __init__(self):
+        self.thread = threading.current_thread()
+
+def current (state):
+    """Return `state` if it belongs to the current thread, or else `None`."""
+    if state is not None and state.thread is threading.current_thread():
+        return state
+    return None
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -27,12 +27,17 @@ D = decimal.Decimal
 from fractions import Fraction
 import logging
 
-from . import (util, exceptions, config, litecoin)
+from . import (util, exceptions, config, litecoin, ledger)
 from . import (bet)
 
 FORMAT = '>IdI'
 LENGTH = 4 + 8 + 4
 ID = 30
+
+# The values of a bet match resolution, in the order in which they have
+# always been inserted (which isn’t that of the columns).
+RESOLUTION_FIELDS = ['bet_match_id', 'bet_match_type_id', 'block_index', 'settled', 'bull_credit', 'bear_credit', 'winner', 'escrow_less_fee', 'fee']
+
 # NOTE: Pascal strings are used for storing texts for backwards‐compatibility.
 
 
@@ -47,11 +52,8 @@ def validate (db, source, timestamp, value, fee_fraction_int, text, block_index)
     if not source:
         problems.append('null source address')
     # Check previous broadcast in this feed.
-    cursor = db.cursor()
-    broadcasts = list(cursor.execute('''SELECT * FROM broadcasts WHERE (status = ? AND source = ?) ORDER BY tx_index ASC''', ('valid', source)))
-    cursor.close()
-    if broadcasts:
-        last_broadcast = broadcasts[-1]
+    last_broadcast = util.last_broadcast(db, source)
+    if last_broadcast:
         if last_broadcast['locked']:
             problems.append('locked feed')
         elif timestamp <= last_broadcast['timestamp']:
@@ -129,8 +131,7 @@ def parse (db, tx, message):
         'locked': lock,
         'status': status,
     }
-    sql='insert into broadcasts values(:tx_index, :tx_hash, :block_index, :source, :timestamp, :value, :fee_fraction_int, :text, :locked, :status)'
-    cursor.execute(sql, bindings)
+    ledger.insert(db, 'broadcasts', bindings)
 
     # Negative values (default to ignore).
     if value == None or value < 0:
@@ -156,23 +157,38 @@ def parse (db, tx, message):
                       WHERE (status=? AND feed_address=?)
                       ORDER BY tx1_index ASC, tx0_index ASC''',
                    ('pending', tx['source']))
-    for bet_match in cursor.fetchall():
-        broadcast_bet_match_cursor = db.cursor()
+    settle(db, tx, value, timestamp, fee_fraction_int, cursor.fetchall())
+
+    cursor.close()
+
+def settlements (bet_matches, block_index, value, timestamp, fee_fraction_int):
+    """Return how a broadcast of `value` at `timestamp`, with a fee of
+    `fee_fraction_int`, settles each of `bet_matches`, in order, as
+    (bet_match, status, credits, resolution): the credits are (address,
+    quantity, action), and the resolution is the row of
+    `bet_match_resolutions`. The status of a match that isn’t settled is
+    `None`, and it has neither credits nor resolution.
+    """
+    # Get known bet match type IDs.
+    cfd_type_id = util.BET_TYPE_ID['BullCFD'] + util.BET_TYPE_ID['BearCFD']
+    equal_type_id = util.BET_TYPE_ID['Equal'] + util.BET_TYPE_ID['NotEqual']
+
+    fee_fraction = fee_fraction_int / config.UNIT
+
+    settlements = []
+    for bet_match in bet_matches:
         bet_match_id = bet_match['tx0_hash'] + bet_match['tx1_hash']
         bet_match_status = None
+        credits = []
+        resolution = None
 
         # Calculate total funds held in escrow and total fee to be paid if
         # the bet match is settled. Escrow less fee is amount to be paid back
         # to betters.
         total_escrow = bet_match['forward_quantity'] + bet_match['backward_quantity']
-        fee_fraction = fee_fraction_int / config.UNIT
         fee = int(fee_fraction * total_escrow)              # Truncate.
         escrow_less_fee = total_escrow - fee
 
-        # Get known bet match type IDs.
-        cfd_type_id = util.BET_TYPE_ID['BullCFD'] + util.BET_TYPE_ID['BearCFD']
-        equal_type_id = util.BET_TYPE_ID['Equal'] + util.BET_TYPE_ID['NotEqual']
-
         # Get the bet match type ID of this bet match.
         bet_match_type_id = bet_match['tx0_bet_type'] + bet_match['tx1_bet_type']
 
@@ -191,10 +207,17 @@ def parse (db, tx, message):
                 bull_escrow = bet_match['backward_quantity']
                 bear_escrow = bet_match['forward_quantity']
 
-            leverage = Fraction(bet_match['leverage'], 5040)
-            initial_value = bet_match['initial_value']
+            # NOTE: With a value (or initial value) that is a float, as it
+            # generally is, this has always been computed with floats (which
+            # is what multiplying a float by a `Fraction` does), and must go
+            # on being computed, and rounded, exactly so.
+            difference = value - bet_match['initial_value']
+            if isinstance(difference, float):
+                leverage = bet_match['leverage'] / 5040
+            else:
+                leverage = Fraction(bet_match['leverage'], 5040)
 
-            bear_credit = bear_escrow - (value - initial_value) * leverage * config.UNIT
+            bear_credit = bear_escrow - difference * leverage * config.UNIT
             bull_credit = escrow_less_fee - bear_credit
             bear_credit = round(bear_credit)
             bull_credit = round(bull_credit)
@@ -205,55 +228,37 @@ def parse (db, tx, message):
                     bull_credit = escrow_less_fee
                     bear_credit = 0
                     bet_match_status = 'settled: liquidated for bull'
-                    util.credit(db, tx['block_index'], bull_address, config.XPT, bull_credit, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
+                    credits.append((bull_address, bull_credit, 'bet {}'.format(bet_match_status)))
                 elif bull_credit <= 0:
                     bull_credit = 0
                     bear_credit = escrow_less_fee
                     bet_match_status = 'settled: liquidated for bear'
-                    util.credit(db, tx['block_index'], bear_address, config.XPT, bear_credit, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
-
-                # Pay fee to feed.
-                util.credit(db, tx['block_index'], bet_match['feed_address'], config.XPT, fee, action='feed fee', event=tx['tx_hash'])
-
-                # For logging purposes.
-                bindings = {
-                    'bet_match_id': bet_match_id,
-                    'bet_match_type_id': bet_match_type_id,
-                    'block_index': tx['block_index'],
-                    'settled': False,
-                    'bull_credit': bull_credit,
-                    'bear_credit': bear_credit,
-                    'winner': None,
-                    'escrow_less_fee': None,
-                    'fee': fee
-                }
-                sql='insert into bet_match_resolutions values(:bet_match_id, :bet_match_type_id, :block_index, :settled, :bull_credit, :bear_credit, :winner, :escrow_less_fee, :fee)'
-                cursor.execute(sql, bindings)
+                    credits.append((bear_address, bear_credit, 'bet {}'.format(bet_match_status)))
+                settled = False
 
             # Settle (if not liquidated).
             elif timestamp >= bet_match['deadline']:
                 bet_match_status = 'settled'
+                credits.append((bull_address, bull_credit, 'bet {}'.format(bet_match_status)))
+                credits.append((bear_address, bear_credit, 'bet {}'.format(bet_match_status)))
+                settled = True
 
-                util.credit(db, tx['block_index'], bull_address, config.XPT, bull_credit, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
-                util.credit(db, tx['block_index'], bear_address, config.XPT, bear_credit, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
-
+            if bet_match_status:
                 # Pay fee to feed.
-                util.credit(db, tx['block_index'], bet_match['feed_address'], config.XPT, fee, action='feed fee', event=tx['tx_hash'])
+                credits.append((bet_match['feed_address'], fee, 'feed fee'))
 
                 # For logging purposes.
-                bindings = {
+                resolution = {
                     'bet_match_id': bet_match_id,
                     'bet_match_type_id': bet_match_type_id,
-                    'block_index': tx['block_index'],
-                    'settled': True,
+                    'block_index': block_index,
+                    'settled': settled,
                     'bull_credit': bull_credit,
                     'bear_credit': bear_credit,
                     'winner': None,
                     'escrow_less_fee': None,
                     'fee': fee
                 }
-                sql='insert into bet_match_resolutions values(:bet_match_id, :bet_match_type_id, :block_index, :settled, :bull_credit, :bear_credit, :winner, :escrow_less_fee, :fee)'
-                cursor.execute(sql, bindings)
 
         # Equal[/NotEqual] bet.
         elif bet_match_type_id == equal_type_id and timestamp >= bet_match['deadline']:
@@ -270,20 +275,20 @@ def parse (db, tx, message):
             if value == bet_match['target_value']:
                 winner = 'Equal'
                 bet_match_status = 'settled: for equal'
-                util.credit(db, tx['block_index'], equal_address, config.XPT, escrow_less_fee, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
+                credits.append((equal_address, escrow_less_fee, 'bet {}'.format(bet_match_status)))
             else:
                 winner = 'NotEqual'
                 bet_match_status = 'settled: for notequal'
-                util.credit(db, tx['block_index'], notequal_address, config.XPT, escrow_less_fee, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])   
+                credits.append((notequal_address, escrow_less_fee, 'bet {}'.format(bet_match_status)))
 
             # Pay fee to feed.
-            util.credit(db, tx['block_index'], bet_match['feed_address'], config.XPT, fee, action='feed fee', event=tx['tx_hash'])
+            credits.append((bet_match['feed_address'], fee, 'feed fee'))
 
             # For logging purposes.
-            bindings = {
+            resolution = {
                 'bet_match_id': bet_match_id,
                 'bet_match_type_id': bet_match_type_id,
-                'block_index': tx['block_index'],
+                'block_index': block_index,
                 'settled': None,
                 'bull_credit': None,
                 'bear_credit': None,
@@ -291,21 +296,27 @@ def parse (db, tx, message):
                 'escrow_less_fee': escrow_less_fee,
                 'fee': fee
             }
-            sql='insert into bet_match_resolutions values(:bet_match_id, :bet_match_type_id, :block_index, :settled, :bull_credit, :bear_credit, :winner, :escrow_less_fee, :fee)'
-            cursor.execute(sql, bindings)
 
-        # Update the bet match’s status.
-        if bet_match_status:
-            bindings = {
-                'status': bet_match_status,
-                'bet_match_id': bet_match['tx0_hash'] + bet_match['tx1_hash']
-            }
-            sql='update bet_matches set status = :status where id = :bet_match_id'
-            cursor.execute(sql, bindings)
-            util.message(db, tx['block_index'], 'update', 'bet_matches', bindings)
+        settlements.append((bet_match, bet_match_status, credits, resolution))
 
-        broadcast_bet_match_cursor.close()
+    return settlements
 
-    cursor.close()
+def settle (db, tx, value, timestamp, fee_fraction_int, bet_matches):
+    """Settle `bet_matches` with the broadcast `tx`: compute the payouts of
+    every match first (`settlements()`), then write the credits, the
+    resolutions and the new statuses in bulk (`ledger.Batch`), in the order
+    in which they have always been made, match by match.
+    """
+    batch = ledger.Batch(db)
+    for bet_match, bet_match_status, credits, resolution in settlements(bet_matches, tx['block_index'], value, timestamp, fee_fraction_int):
+        if not bet_match_status:
+            continue
+        for address, quantity, action in credits:
+            batch.credit(tx['block_index'], address, config.XPT, quantity, action=action, event=tx['tx_hash'])
+        batch.insert('bet_match_resolutions', resolution, fields=RESOLUTION_FIELDS)
+
+        # Update the bet match’s status.
+        batch.update('bet_matches', {'id': bet_match['tx0_hash'] + bet_match['tx1_hash']}, {'status': bet_match_status}, tx['block_index'])
+    batch.flush()
 
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -5,7 +5,7 @@ import decimal
 D = decimal.Decimal
 from fractions import Fraction
 
-from . import (util, config, exceptions, litecoin, util)
+from . import (util, config, exceptions, litecoin, util, ledger)
 
 """Burn {} to earn {} during a special period of time.""".format(config.LTC, config.XPT)
 
@@ -94,8 +94,7 @@ def parse (db, tx, message=None):
         'earned': earned,
         'status': status,
     }
-    sql='insert into burns values(:tx_index, :tx_hash, :block_index, :source, :burned, :earned, :status)'
-    burn_parse_cursor.execute(sql, bindings)
+    ledger.insert(db, 'burns', bindings)
 
 
     burn_parse_cursor.close()
@@ -6,7 +6,7 @@ import struct
 import decimal
 D = decimal.Decimal
 
-from . import (util, config, exceptions, litecoin, util)
+from . import (util, config, exceptions, litecoin, util, ledger, assets, payouts)
 from . import order
 
 FORMAT = '>dQ'
@@ -29,24 +29,22 @@ def validate (db, source, fraction, asset, block_time, block_index, parse):
     elif fraction <= 0:
         problems.append('non‐positive fraction')
 
-    issuances = list(cursor.execute('''SELECT * FROM issuances WHERE (status = ? AND asset = ?)''', ('valid', asset)))
-    if not issuances:
+    record = assets.get(db, asset)
+    if not record:
         problems.append('no such asset, {}.'.format(asset))
         return None, None, None, problems
     else:
-        last_issuance = issuances[-1]
-
-        if last_issuance['issuer'] != source:
+        if record['issuer'] != source:
             problems.append('not asset owner')
             return None, None, None, problems
 
-        if not last_issuance['callable']:
+        if not record['callable']:
             problems.append('uncallable asset')
             return None, None, None, problems
-        elif last_issuance['call_date'] > block_time: problems.append('before call date')
+        elif record['call_date'] > block_time: problems.append('before call date')
 
-        call_price = round(last_issuance['call_price'], 6)  # TODO: arbitrary
-        divisible = last_issuance['divisible']
+        call_price = round(record['call_price'], 6)  # TODO: arbitrary
+        divisible = record['divisible']
 
     if not divisible:   # Pay per output unit.
         call_price *= config.UNIT
@@ -69,29 +67,13 @@ def validate (db, source, fraction, asset, block_time, block_index, parse):
 
     # Calculate callback quantities.
     holders = util.holders(db, asset)
-    outputs = []
-    for holder in holders:
-
-        # If composing (and not parsing), predict funds to be returned from
-        # escrow (instead of cancelling open offers, etc.), by *not* skipping
-        # listing escrowed funds here.
-        if parse and holder['escrow']:
-            continue
-
-        address = holder['address']
-        address_quantity = holder['address_quantity']
-        if address == source or address_quantity == 0: continue
-
-        callback_quantity = int(address_quantity * fraction)   # Round down.
-        fraction_actual = callback_quantity / address_quantity
-
-        outputs.append({'address': address, 'address_quantity': address_quantity, 'callback_quantity': callback_quantity, 'fraction_actual': fraction_actual})
+    outputs = payouts.callback_outputs(holders, source, fraction, parse)
 
     callback_total = sum([output['callback_quantity'] for output in outputs])
     if not callback_total: problems.append('nothing called back')
 
-    balances = list(cursor.execute('''SELECT * FROM balances WHERE (address = ? AND asset = ?)''', (source, config.XPT)))
-    if not balances or balances[0]['quantity'] < (call_price * callback_total):
+    balance = util.get_balance(db, source, config.XPT)
+    if balance is None or balance < (call_price * callback_total):
         problems.append('insufficient funds')
 
     cursor.close()
@@ -126,16 +108,23 @@ def parse (db, tx, message):
         if problems: status = 'invalid: ' + '; '.join(problems)
 
     if status == 'valid':
+        batch = ledger.Batch(db)
+        addresses = [output['address'] for output in outputs]
+        util.load_balances(db, asset, addresses)
+        util.load_balances(db, config.XPT, addresses)
+
         # Issuer.
         assert call_price * callback_total == int(call_price * callback_total)
-        util.debit(db, tx['block_index'], tx['source'], config.XPT, int(call_price * callback_total), action='callback', event=tx['tx_hash'])
-        util.credit(db, tx['block_index'], tx['source'], asset, callback_total, action='callback', event=tx['tx_hash'])
+        batch.debit(tx['block_index'], tx['source'], config.XPT, int(call_price * callback_total), action='callback', event=tx['tx_hash'])
+        batch.credit(tx['block_index'], tx['source'], asset, callback_total, action='callback', event=tx['tx_hash'])
 
         # Holders.
         for output in outputs:
             assert call_price * output['callback_quantity'] == int(call_price * output['callback_quantity'])
-            util.debit(db, tx['block_index'], output['address'], asset, output['callback_quantity'], action='callback', event=tx['tx_hash'])
-            util.credit(db, tx['block_index'], output['address'], config.XPT, int(call_price * output['callback_quantity']), action='callback', event=tx['tx_hash'])
+            batch.debit(tx['block_index'], output['address'], asset, output['callback_quantity'], action='callback', event=tx['tx_hash'])
+            batch.credit(tx['block_index'], output['address'], config.XPT, int(call_price * output['callback_quantity']), action='callback', event=tx['tx_hash'])
+
+        batch.flush()
 
     # Add parsed transaction to message-type–specific table.
     bindings = {
@@ -147,8 +136,7 @@ def parse (db, tx, message):
         'asset': asset,
         'status': status,
     }
-    sql='insert into callbacks values(:tx_index, :tx_hash, :block_index, :source, :fraction, :asset, :status)'
-    callback_parse_cursor.execute(sql, bindings)
+    ledger.insert(db, 'callbacks', bindings)
 
     callback_parse_cursor.close()
 
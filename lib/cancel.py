@@ -7,7 +7,7 @@ offer_hash is the hash of either a bet or an order.
 import binascii
 import struct
 
-from . import (util, config, exceptions, litecoin, util)
+from . import (util, config, exceptions, litecoin, util, ledger)
 from . import (order, bet, rps)
 
 FORMAT = '>32s'
@@ -97,8 +97,7 @@ def parse (db, tx, message):
         'offer_hash': offer_hash,
         'status': status,
     }
-    sql='INSERT INTO cancels VALUES (:tx_index, :tx_hash, :block_index, :source, :offer_hash, :status)'
-    cursor.execute(sql, bindings)
+    ledger.insert(db, 'cancels', bindings)
 
     cursor.close()
 
@@ -90,6 +90,22 @@ DEFAULT_OP_RETURN_VALUE = 0 		  # LTC.
 DEFAULT_FEE_PER_KB = 100000            # LTC.
 
 
+# Ingestion defaults
+DEFAULT_PREFETCH_DEPTH = 10     # Blocks fetched and decoded ahead of the one being parsed.
+PREFETCH_THREADS = 4
+DEFAULT_RPC_BATCH_SIZE = 100    # Calls per JSON‐RPC batch request to the backend.
+DEFAULT_UNDOLOG_DEPTH = 100     # Blocks that can be rolled back without a full reparse (0 to disable).
+DEFAULT_SNAPSHOT_INTERVAL = 10000  # Blocks between snapshots of the parsed state (0 to disable).
+DEFAULT_SNAPSHOT_RETENTION = 3      # Snapshots kept on disk.
+DEFAULT_CATCH_UP_BLOCKS = 1000   # Blocks per commit while far behind the backend (0 to commit every block).
+DEFAULT_CATCH_UP_SECONDS = 30    # Seconds between commits while far behind the backend.
+CATCH_UP_DISTANCE = 10           # Blocks from the tip at which to go back to committing every block.
+DEFAULT_AUDIT_INTERVAL = 0       # Blocks between full checks for conservation of assets (0 to disable).
+DEFAULT_DECODE_WORKERS = 0      # Processes decoding transactions (0 to decode inline).
+DEFAULT_PREVOUT_CACHE_SIZE = 100000     # Transaction outputs kept in memory.
+PREVOUT_CACHE_DISK_SIZE = 10000000      # Transaction outputs kept on disk.
+
+
 # UI defaults
 DEFAULT_FEE_FRACTION_REQUIRED = .009   # 0.90%
 DEFAULT_FEE_FRACTION_PROVIDED = .01    # 1.00%
@@ -0,0 +1,80 @@
+#! /usr/bin/python3
+
+"""
+Incremental checking of the conservation of assets.
+
+While a block is parsed, with `config.CAREFULNESS` set, the changes to the
+quantity of each asset that has been issued (by burns and issuances, less
+fees) and to the quantity that is held (in balances, and in escrow in open
+orders, bets and RPS, and in their pending matches) are added up from the
+credits, the debits and the writes to the ledger. An asset has been
+conserved since the last check if both have changed by as much, so a check
+costs as much as the number of assets that have changed, rather than a
+count of every holding of every asset (`blocks.check_conservation()`, which
+remains as an audit).
+
+The escrow of a row is that of the table of escrows (`escrow`), and its
+supply that of the running totals of supplies (`supply`).
+"""
+
+import collections
+
+from . import (config, blockstate, escrow, supply)
+
+PENDING = None      # Set while a block is being parsed.
+
+class Changes (blockstate.BlockState):
+    """Changes to the quantities issued and held, since the last check."""
+    def __init__(self):
+        super().__init__()
+        self.issued = collections.defaultdict(int)
+        self.held = collections.defaultdict(int)
+
+    def hold(self, escrows, sign):
+        for kind, side, asset, address, quantity, escrow_id in escrows:
+            if asset != config.LTC:    # (Orders may give LTC, which is never held.)
+                self.held[asset] += sign * quantity
+
+    def unbalanced(self):
+        """Return the assets of which as much hasn’t been issued as is held,
+        with both quantities.
+        """
+        assets = set(self.issued) | set(self.held)
+        return [(asset, self.issued[asset], self.held[asset]) for asset in sorted(assets) if self.issued[asset] != self.held[asset]]
+
+    def clear(self):
+        self.issued.clear()
+        self.held.clear()
+
+def credit (asset, quantity):
+    changes = blockstate.current(PENDING)
+    if changes is not None:
+        changes.held[asset] += quantity
+
+def debit (asset, quantity):
+    changes = blockstate.current(PENDING)
+    if changes is not None:
+        changes.held[asset] -= quantity
+
+def insert (table, row):
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        return
+    if table in escrow.ESCROWS:
+        changes.hold(escrow.get_escrows(table, row), 1)
+    elif table in supply.SUPPLIES:
+        for asset, issued, burned, fees_paid in supply.get_supplies(table, row):
+            changes.issued[asset] += issued + burned - fees_paid
+
+def update (table, rows, columns):
+    """Count the changes of `columns` to `rows`, as they were."""
+    changes = blockstate.current(PENDING)
+    if changes is None or table not in escrow.ESCROWS:
+        return
+    for row in rows:
+        new_row = dict(row)
+        new_row.update(columns)
+        changes.hold(escrow.get_escrows(table, row), -1)
+        changes.hold(escrow.get_escrows(table, new_row), 1)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
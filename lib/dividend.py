@@ -6,7 +6,7 @@ import struct
 import decimal
 D = decimal.Decimal
 
-from . import (util, config, exceptions, litecoin, util)
+from . import (util, config, exceptions, litecoin, util, ledger, assets, payouts)
 
 FORMAT_1 = '>QQ'
 LENGTH_1 = 8 + 8
@@ -28,57 +28,38 @@ def validate (db, source, quantity_per_unit, asset, dividend_asset, block_index)
     if quantity_per_unit <= 0: problems.append('non‐positive quantity per unit')
 
     # Examine asset.
-    issuances = list(cursor.execute('''SELECT * FROM issuances WHERE (status = ? AND asset = ?) ORDER BY tx_index ASC''', ('valid', asset)))
-    if not issuances:
+    record = assets.get(db, asset)
+    if not record:
         problems.append('no such asset, {}.'.format(asset))
         return None, None, problems, 0
-    divisible = issuances[0]['divisible']
+    divisible = record['divisible']
 
     # Only issuer can pay dividends.
     if block_index >= 320000 or config.TESTNET:   # Protocol change.
-        if issuances[-1]['issuer'] != source:
+        if record['issuer'] != source:
             problems.append('only issuer can pay dividends')
 
     # Examine dividend asset.
     if dividend_asset in (config.LTC, config.XPT):
         dividend_divisible = True
     else:
-        issuances = list(cursor.execute('''SELECT * FROM issuances WHERE (status = ? AND asset = ?)''', ('valid', dividend_asset)))
-        if not issuances:
+        dividend_record = assets.get(db, dividend_asset)
+        if not dividend_record:
             problems.append('no such dividend asset, {}.'.format(dividend_asset))
             return None, None, problems, 0
-        dividend_divisible = issuances[0]['divisible']
+        dividend_divisible = dividend_record['divisible']
 
     # Calculate dividend quantities.
     holders = util.holders(db, asset)
-    outputs = []
-    addresses = []
-    dividend_total = 0
-    for holder in holders:
-
-        if block_index < 294500 and not config.TESTNET: # Protocol change.
-            if holder['escrow']: continue
-
-        address = holder['address']
-        address_quantity = holder['address_quantity']
-        if block_index >= 296000 or config.TESTNET: # Protocol change.
-            if address == source: continue
-
-        dividend_quantity = address_quantity * quantity_per_unit
-        if divisible: dividend_quantity /= config.UNIT
-        if not dividend_divisible: dividend_quantity /= config.UNIT
-        if dividend_asset == config.LTC and dividend_quantity < config.DEFAULT_MULTISIG_DUST_SIZE: continue    # A bit hackish.
-        dividend_quantity = int(dividend_quantity)
-
-        outputs.append({'address': address, 'address_quantity': address_quantity, 'dividend_quantity': dividend_quantity})
-        addresses.append(address)
-        dividend_total += dividend_quantity
+    outputs = payouts.dividend_outputs(holders, source, quantity_per_unit, divisible, dividend_divisible, dividend_asset, block_index)
+    addresses = [output['address'] for output in outputs]
+    dividend_total = sum([output['dividend_quantity'] for output in outputs])
 
     if not dividend_total: problems.append('zero dividend')
 
     if dividend_asset != config.LTC:
-        balances = list(cursor.execute('''SELECT * FROM balances WHERE (address = ? AND asset = ?)''', (source, dividend_asset)))
-        if not balances or balances[0]['quantity'] < dividend_total:
+        balance = util.get_balance(db, source, dividend_asset)
+        if balance is None or balance < dividend_total:
             problems.append('insufficient funds ({})'.format(dividend_asset))
 
     fee = 0
@@ -87,8 +68,8 @@ def validate (db, source, quantity_per_unit, asset, dividend_asset, block_index)
         if block_index >= 330000 or config.TESTNET: # Protocol change.
             fee = int(0.0002 * config.UNIT * holder_count)
         if fee:
-            balances = list(cursor.execute('''SELECT * FROM balances WHERE (address = ? AND asset = ?)''', (source, config.XPT)))
-            if not balances or balances[0]['quantity'] < fee:
+            balance = util.get_balance(db, source, config.XPT)
+            if balance is None or balance < fee:
                 problems.append('insufficient funds ({})'.format(config.XPT))
 
     cursor.close()
@@ -141,14 +122,17 @@ def parse (db, tx, message):
         if problems: status = 'invalid: ' + '; '.join(problems)
 
     if status == 'valid':
+        batch = ledger.Batch(db)
+
         # Debit.
-        util.debit(db, tx['block_index'], tx['source'], dividend_asset, dividend_total, action='dividend', event=tx['tx_hash'])
+        batch.debit(tx['block_index'], tx['source'], dividend_asset, dividend_total, action='dividend', event=tx['tx_hash'])
         if tx['block_index'] >= 330000 or config.TESTNET: # Protocol change.
-            util.debit(db, tx['block_index'], tx['source'], config.XPT, fee, action='dividend fee', event=tx['tx_hash'])
+            batch.debit(tx['block_index'], tx['source'], config.XPT, fee, action='dividend fee', event=tx['tx_hash'])
 
         # Credit.
-        for output in outputs:
-            util.credit(db, tx['block_index'], output['address'], dividend_asset, output['dividend_quantity'], action='dividend', event=tx['tx_hash'])
+        batch.credits(tx['block_index'], dividend_asset, [(output['address'], output['dividend_quantity']) for output in outputs], action='dividend', event=tx['tx_hash'])
+
+        batch.flush()
 
     # Add parsed transaction to message-type–specific table.
     bindings = {
@@ -162,8 +146,7 @@ def parse (db, tx, message):
         'fee_paid': fee,
         'status': status,
     }
-    sql='insert into dividends values(:tx_index, :tx_hash, :block_index, :source, :asset, :dividend_asset, :quantity_per_unit, :fee_paid, :status)'
-    dividend_parse_cursor.execute(sql, bindings)
+    ledger.insert(db, 'dividends', bindings)
 
     dividend_parse_cursor.close()
 
@@ -0,0 +1,126 @@
+#! /usr/bin/python3
+
+"""
+The funds held in escrow by open orders, bets and RPS, and by their pending
+matches, in a table of their own (`escrows`), so that `util.holders()` finds
+those of an asset with one indexed range scan.
+
+The table is derived from the others, and kept up to date by
+`ledger.insert()` and `ledger.update()`. Its rows are sorted (by `kind`,
+`status`, `row_id` and `side`) in the order in which `util.holders()` has
+always listed escrowed funds, which matters for dividends: by table, then
+by rowid, except that RPS matches are sorted by status first.
+"""
+
+import logging
+
+from . import config
+
+ORDER, ORDER_MATCH_FORWARD, ORDER_MATCH_BACKWARD, BET, BET_MATCH, RPS, RPS_MATCH = range(7)
+
+RPS_MATCH_ESCROW_STATUSES = ('pending', 'pending and resolved', 'resolved and pending')
+ESCROW_STATUSES = ('open',) + RPS_MATCH_ESCROW_STATUSES
+
+def order_escrows (order):
+    if order['status'] == 'open':
+        return [(ORDER, 0, order['give_asset'], order['source'], order['give_remaining'], order['tx_hash'])]
+    return []
+
+def order_match_escrows (order_match):
+    if order_match['status'] == 'pending':
+        return [(ORDER_MATCH_FORWARD, 0, order_match['forward_asset'], order_match['tx0_address'], order_match['forward_quantity'], order_match['id']),
+                (ORDER_MATCH_BACKWARD, 1, order_match['backward_asset'], order_match['tx1_address'], order_match['backward_quantity'], order_match['id'])]
+    return []
+
+def bet_escrows (bet):
+    if bet['status'] == 'open':
+        return [(BET, 0, config.XPT, bet['source'], bet['wager_remaining'], bet['tx_hash'])]
+    return []
+
+def bet_match_escrows (bet_match):
+    if bet_match['status'] == 'pending':
+        return [(BET_MATCH, 0, config.XPT, bet_match['tx0_address'], bet_match['forward_quantity'], bet_match['id']),
+                (BET_MATCH, 1, config.XPT, bet_match['tx1_address'], bet_match['backward_quantity'], bet_match['id'])]
+    return []
+
+def rps_escrows (rps):
+    if rps['status'] == 'open':
+        return [(RPS, 0, config.XPT, rps['source'], rps['wager'], rps['tx_hash'])]
+    return []
+
+def rps_match_escrows (rps_match):
+    if rps_match['status'] in RPS_MATCH_ESCROW_STATUSES:
+        return [(RPS_MATCH, 0, config.XPT, rps_match['tx0_address'], rps_match['wager'], rps_match['id']),
+                (RPS_MATCH, 1, config.XPT, rps_match['tx1_address'], rps_match['wager'], rps_match['id'])]
+    return []
+
+# table -> (kinds of escrow, function of a row that returns its escrows, as
+# (kind, side, asset, address, quantity, escrow_id)).
+ESCROWS = {
+    'orders': ((ORDER,), order_escrows),
+    'order_matches': ((ORDER_MATCH_FORWARD, ORDER_MATCH_BACKWARD), order_match_escrows),
+    'bets': ((BET,), bet_escrows),
+    'bet_matches': ((BET_MATCH,), bet_match_escrows),
+    'rps': ((RPS,), rps_escrows),
+    'rps_matches': ((RPS_MATCH,), rps_match_escrows),
+}
+
+def get_escrows (table, row):
+    return ESCROWS[table][1](row)
+
+def add (db, table, row_id, row):
+    """Record the escrows of a new row."""
+    escrows = get_escrows(table, row)
+    if not escrows:
+        return
+    cursor = db.cursor()
+    cursor.executemany('''INSERT INTO escrows VALUES(?,?,?,?,?,?,?,?)''',
+                       [(asset, address, quantity, escrow_id, kind, row['status'], row_id, side) for kind, side, asset, address, quantity, escrow_id in escrows])
+    cursor.close()
+
+def replace (db, table, row_id, old_row, new_row):
+    """Record the escrows of a row that has changed, if they have."""
+    if get_escrows(table, old_row) == get_escrows(table, new_row) and old_row['status'] == new_row['status']:
+        return
+    kinds = ESCROWS[table][0]
+    cursor = db.cursor()
+    cursor.execute('''DELETE FROM escrows WHERE (kind IN ({}) AND row_id = ?)'''.format(', '.join(['?'] * len(kinds))), kinds + (row_id,))
+    cursor.close()
+    add(db, table, row_id, new_row)
+
+def rebuild (db):
+    """Derive the table from scratch."""
+    logging.debug('Status: Building the table of escrows.')
+    cursor = db.cursor()
+    cursor.execute('''DELETE FROM escrows''')
+    for table in sorted(ESCROWS, key=lambda table: ESCROWS[table][0]):
+        rows = cursor.execute('''SELECT rowid AS row_id, * FROM {} WHERE status IN ({}) ORDER BY rowid'''.format(table, ', '.join(['?'] * len(ESCROW_STATUSES))), ESCROW_STATUSES)
+        for row in list(rows):
+            add(db, table, row['row_id'], row)
+    cursor.close()
+
+def initialise (db):
+    cursor = db.cursor()
+    exists = list(cursor.execute('''SELECT name FROM sqlite_master WHERE (type = ? AND name = ?)''', ('table', 'escrows')))
+    cursor.execute('''CREATE TABLE IF NOT EXISTS escrows(
+                      asset TEXT,
+                      address TEXT,
+                      quantity INTEGER,
+                      escrow_id TEXT,
+                      kind INTEGER,
+                      status TEXT,
+                      row_id INTEGER,
+                      side INTEGER)
+                   ''')
+    cursor.close()
+    if not exists:
+        rebuild(db)
+
+def holders (db, asset):
+    """Return the funds of `asset` held in escrow."""
+    cursor = db.cursor()
+    escrows = list(cursor.execute('''SELECT * FROM escrows WHERE asset = ? ORDER BY kind, status, row_id, side''', (asset,)))
+    cursor.close()
+    return [{'address': escrow['address'], 'address_quantity': escrow['quantity'], 'escrow': escrow['escrow_id']} for escrow in escrows]
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
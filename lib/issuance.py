@@ -8,7 +8,7 @@ import struct
 import decimal
 D = decimal.Decimal
 
-from . import (config, util, exceptions, litecoin, util)
+from . import (config, util, exceptions, litecoin, util, ledger, assets)
 
 FORMAT_1 = '>QQ?'
 LENGTH_1 = 8 + 8 + 1
@@ -57,29 +57,23 @@ def validate (db, source, destination, asset, quantity, divisible, callable_, ca
                 problems.append('call price for non‐callable asset')
 
     # Valid re-issuance?
-    cursor = db.cursor()
-    cursor.execute('''SELECT * FROM issuances \
-                      WHERE (status = ? AND asset = ?)
-                      ORDER BY tx_index ASC''', ('valid', asset))
-    issuances = cursor.fetchall()
-    cursor.close()
-    if issuances:
+    record = assets.get(db, asset)
+    if record:
         reissuance = True
-        last_issuance = issuances[-1]
         if call_date is None: call_date = 0
         if call_price is None: call_price = 0.0
 
-        if last_issuance['issuer'] != source:
+        if record['issuer'] != source:
             problems.append('issued by another address')
-        if bool(last_issuance['divisible']) != bool(divisible):
+        if bool(record['divisible']) != bool(divisible):
             problems.append('cannot change divisibility')
-        if bool(last_issuance['callable']) != bool(callable_):
+        if bool(record['callable']) != bool(callable_):
             problems.append('cannot change callability')
-        if last_issuance['call_date'] > call_date and (call_date != 0 or (block_index < 312500 and not config.TESTNET)):
+        if record['call_date'] > call_date and (call_date != 0 or (block_index < 312500 and not config.TESTNET)):
             problems.append('cannot advance call date')
-        if last_issuance['call_price'] > call_price:
+        if record['call_price'] > call_price:
             problems.append('cannot reduce call price')
-        if last_issuance['locked'] and quantity:
+        if record['locked'] and quantity:
             problems.append('locked asset and non‐zero quantity')
     else:
         reissuance = False
@@ -91,18 +85,14 @@ def validate (db, source, destination, asset, quantity, divisible, callable_, ca
     # Check for existence of fee funds.
     if quantity or (block_index >= 315000 or config.TESTNET):   # Protocol change.
         if not reissuance or (block_index < 310000 and not config.TESTNET):  # Pay fee only upon first issuance. (Protocol change.)
-            cursor = db.cursor()
-            cursor.execute('''SELECT * FROM balances \
-                              WHERE (address = ? AND asset = ?)''', (source, config.XPT))
-            balances = cursor.fetchall()
-            cursor.close()
+            balance = util.get_balance(db, source, config.XPT)
             if block_index >= 291700 or config.TESTNET:     # Protocol change.
                 fee = int(config.DEFAULT_ISSUANCE_FEE * config.UNIT)
             elif block_index >= 286000 or config.TESTNET:   # Protocol change.
                 fee = 5 * config.UNIT
             elif block_index > 281236 or config.TESTNET:    # Protocol change.
                 fee = 5
-            if fee and (not balances or balances[0]['quantity'] < fee):
+            if fee and (balance is None or balance < fee):
                 problems.append('insufficient funds')
 
     if not (block_index >= 317500 or config.TESTNET):  # Protocol change.
@@ -111,7 +101,7 @@ def validate (db, source, destination, asset, quantity, divisible, callable_, ca
 
     # For SQLite3
     call_date = min(call_date, config.MAX_INT)
-    total = sum([issuance['quantity'] for issuance in issuances])
+    total = record['supply'] if record else 0
     assert isinstance(quantity, int)
     if total + quantity > config.MAX_INT:
         problems.append('total quantity overflow')
@@ -195,12 +185,7 @@ def parse (db, tx, message):
     if status == 'valid':
         if description and description.lower() == 'lock':
             lock = True
-            cursor = db.cursor()
-            issuances = list(cursor.execute('''SELECT * FROM issuances \
-                                               WHERE (status = ? AND asset = ?)
-                                               ORDER BY tx_index ASC''', ('valid', asset)))
-            cursor.close()
-            description = issuances[-1]['description']  # Use last description. (Assume previous issuance exists because tx is valid.)
+            description = assets.get(db, asset)['description']  # Use last description. (Assume previous issuance exists because tx is valid.)
             timestamp, value_int, fee_fraction_int = None, None, None
 
     # Add parsed transaction to message-type–specific table.
@@ -222,8 +207,9 @@ def parse (db, tx, message):
         'locked': lock,
         'status': status,
     }
-    sql='insert into issuances values(:tx_index, :tx_hash, :block_index, :asset, :quantity, :divisible, :source, :issuer, :transfer, :callable, :call_date, :call_price, :description, :fee_paid, :locked, :status)'
-    issuance_parse_cursor.execute(sql, bindings)
+    if status == 'valid':
+        assets.issue(db, bindings)
+    ledger.insert(db, 'issuances', bindings)
 
     # Credit.
     if status == 'valid' and quantity:
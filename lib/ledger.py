@@ -0,0 +1,208 @@
+#! /usr/bin/python3
+
+"""
+Writes to the tables of the ledger, listed in the message feed.
+
+`insert()` and `update()` list each change with `util.message()` directly,
+with the bindings that they were given, instead of guessing the command and
+the table from the SQL of every statement executed. They also keep the
+table of escrows (`escrow`), the running totals of supplies (`supply`), the
+books of open orders and bets (`orderbook`, `betbook`) and the pairs of
+transactions matched (`pairs`) up to date, and count the changes to the
+quantities of assets issued and held (`conservation`).
+
+A `Batch` makes the same writes, and credits and debits, in bulk.
+"""
+
+import collections
+
+from . import (config, util, conservation, escrow, supply, orderbook, betbook, pairs)
+
+# Names of the keys of some tables in the message feed.
+KEY_NAMES = {'order_matches': 'order_match_id', 'bet_matches': 'bet_match_id', 'rps_matches': 'rps_match_id'}
+
+COLUMNS = {}    # table -> names of columns, in order.
+
+def get_columns (db, table):
+    if table not in COLUMNS:
+        cursor = db.cursor()
+        COLUMNS[table] = [column['name'] for column in cursor.execute('''PRAGMA table_info({})'''.format(table))]
+        cursor.close()
+    return COLUMNS[table]
+
+def insert (db, table, row, fields=None):
+    """Insert `row` into `table`, and list it in the message feed.
+
+    Values are inserted in the order of `fields`, the names of the entries of
+    `row`, which is by default that of the columns of the table.
+    """
+    if fields is None:
+        fields = get_columns(db, table)
+    cursor = db.cursor()
+    cursor.execute('''INSERT INTO {} VALUES({})'''.format(table, ', '.join([':' + field for field in fields])), row)
+    cursor.close()
+    if table in escrow.ESCROWS:
+        escrow.add(db, table, db.last_insert_rowid(), row)
+        if table == 'orders':
+            orderbook.add(db, row)
+        elif table == 'bets':
+            betbook.add(db, row)
+    elif table in supply.SUPPLIES:
+        supply.add(db, table, row)
+    if table in pairs.TABLES:
+        pairs.add(table, row)
+    conservation.insert(table, row)
+    util.message(db, row['block_index'], 'insert', table, row)
+
+def replace (db, table, rows, changes):
+    """Note that the columns `changes` of `rows` have been set."""
+    for row in rows:
+        new_row = dict(row)
+        new_row.update(changes)
+        escrow.replace(db, table, row['row_id'], row, new_row)
+        if table == 'orders':
+            orderbook.replace(db, row, new_row)
+        elif table == 'bets':
+            betbook.replace(db, row, new_row)
+
+def update (db, table, key, changes, block_index=None):
+    """Set the columns `changes` of the rows of `table` that match `key`. If
+    `block_index` is set, list the update in the message feed, with both.
+    """
+    cursor = db.cursor()
+    bindings = dict(changes)
+    assignments = []
+    for column in changes:
+        assignments.append('{0} = :{0}'.format(column))
+    conditions = []
+    for column, value in key.items():
+        name = KEY_NAMES.get(table, column) if column == 'id' else column
+        conditions.append('{} = :{}'.format(column, name))
+        bindings[name] = value
+    if table in escrow.ESCROWS:
+        rows = list(cursor.execute('''SELECT rowid AS row_id, * FROM {} WHERE ({})'''.format(table, ' AND '.join(conditions)), bindings))
+        conservation.update(table, rows, changes)
+    cursor.execute('''UPDATE {} SET {} WHERE ({})'''.format(table, ', '.join(assignments), ' AND '.join(conditions)), bindings)
+    if table in escrow.ESCROWS:
+        replace(db, table, rows, changes)
+    cursor.close()
+    if block_index is not None:
+        util.message(db, block_index, 'update', table, bindings)
+
+class Batch (object):
+    """Credits, debits, inserts and updates made one by one, and written in
+    bulk.
+
+    Each is counted, and listed in the message feed (and, for a credit or a
+    debit, in the ledger of the block), as it is made, as by `util.credit()`,
+    `util.debit()`, `insert()` and `update()`, so that everything is in the
+    same order; but the rows themselves are written by `flush()`, with one
+    `executemany` for each table and statement. The tables written mustn’t
+    be read in between, nor a row updated twice. Rows are updated by a key of
+    one column, and those of the tables with escrows are inserted only by
+    `insert()`, which needs their rowids. (What is written is a copy of what
+    is listed, from which `util.message()` drops some fields in the mempool.)
+    """
+    def __init__(self, db):
+        self.db = db
+        self.inserts = collections.OrderedDict()    # (table, fields) -> rows.
+        self.updates = collections.OrderedDict()    # (table, key column, changed columns) -> bindings.
+
+    def record(self, table, block_index, address, asset, quantity, action, event):
+        """Record a credit or a debit."""
+        bindings = {
+            'block_index': block_index,
+            'address': address,
+            'asset': asset,
+            'quantity': quantity,
+            'action': action,
+            'event': event
+        }
+        self.inserts.setdefault((table, ('block_index', 'address', 'asset', 'quantity', 'action', 'event')), []).append(dict(bindings))
+        util.message(self.db, block_index, 'insert', table, bindings)
+
+        util.BLOCK_LEDGER.append('{}{}{}{}'.format(block_index, address, asset, quantity))
+
+    def credit(self, block_index, address, asset, quantity, action=None, event=None):
+        assert asset != config.LTC # Never LTC.
+        assert type(quantity) == int
+        assert quantity >= 0
+
+        util.credit_balance(self.db, address, asset, quantity)
+        conservation.credit(asset, quantity)
+        self.record('credits', block_index, address, asset, quantity, action, event)
+
+    def debit(self, block_index, address, asset, quantity, action=None, event=None):
+        assert asset != config.LTC # Never LTC.
+        assert type(quantity) == int
+        assert quantity >= 0
+
+        util.debit_balance(self.db, address, asset, quantity)
+        conservation.debit(asset, quantity)
+        self.record('debits', block_index, address, asset, quantity, action, event)
+
+    def credits(self, block_index, asset, postings, action=None, event=None):
+        """Credit each (address, quantity) of `postings`, in order."""
+        util.load_balances(self.db, asset, [address for address, quantity in postings])
+        for address, quantity in postings:
+            self.credit(block_index, address, asset, quantity, action=action, event=event)
+
+    def debits(self, block_index, asset, postings, action=None, event=None):
+        """Debit each (address, quantity) of `postings`, in order."""
+        util.load_balances(self.db, asset, [address for address, quantity in postings])
+        for address, quantity in postings:
+            self.debit(block_index, address, asset, quantity, action=action, event=event)
+
+    def insert(self, table, row, fields=None):
+        assert table not in escrow.ESCROWS
+        if fields is None:
+            fields = get_columns(self.db, table)
+        self.inserts.setdefault((table, tuple(fields)), []).append(dict(row))
+        if table in supply.SUPPLIES:
+            supply.add(self.db, table, row)
+        if table in pairs.TABLES:
+            pairs.add(table, row)
+        conservation.insert(table, row)
+        util.message(self.db, row['block_index'], 'insert', table, row)
+
+    def update(self, table, key, changes, block_index=None):
+        assert len(key) == 1
+        (column, value), = key.items()
+        name = KEY_NAMES.get(table, column) if column == 'id' else column
+        bindings = dict(changes)
+        bindings[name] = value
+        self.updates.setdefault((table, column, tuple(changes)), []).append(dict(bindings))
+        if block_index is not None:
+            util.message(self.db, block_index, 'update', table, bindings)
+
+    def select(self, cursor, table, column, values):
+        """Return the rows of `table` of which `column` is one of `values`,
+        by value.
+        """
+        rows = collections.defaultdict(list)
+        for start in range(0, len(values), 500):    # (SQLite takes up to 999 parameters.)
+            chunk = values[start:start + 500]
+            for row in cursor.execute('''SELECT rowid AS row_id, * FROM {} WHERE {} IN ({})'''.format(table, column, ', '.join(['?'] * len(chunk))), chunk):
+                rows[row[column]].append(row)
+        return rows
+
+    def flush(self):
+        """Write the rows."""
+        cursor = self.db.cursor()
+        for (table, fields), rows in self.inserts.items():
+            cursor.executemany('''INSERT INTO {} VALUES({})'''.format(table, ', '.join([':' + field for field in fields])), rows)
+        for (table, column, columns), bindings_list in self.updates.items():
+            name = KEY_NAMES.get(table, column) if column == 'id' else column
+            if table in escrow.ESCROWS:
+                rows = self.select(cursor, table, column, [bindings[name] for bindings in bindings_list])
+                for bindings in bindings_list:
+                    conservation.update(table, rows[bindings[name]], dict([(changed, bindings[changed]) for changed in columns]))
+            cursor.executemany('''UPDATE {} SET {} WHERE ({} = :{})'''.format(table, ', '.join(['{0} = :{0}'.format(changed) for changed in columns]), column, name), bindings_list)
+            if table in escrow.ESCROWS:
+                for bindings in bindings_list:
+                    replace(self.db, table, rows[bindings[name]], dict([(changed, bindings[changed]) for changed in columns]))
+        cursor.close()
+        self.inserts.clear()
+        self.updates.clear()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -81,8 +81,14 @@ def get_raw_transaction (tx_hash):
     return rpc('getrawtransaction', [tx_hash, 1])
 def get_block (block_hash):
     return rpc('getblock', [block_hash])
+def get_raw_block (block_hash):
+    return rpc('getblock', [block_hash, False])
 def get_block_hash (block_index):
     return rpc('getblockhash', [block_index])
+def get_raw_transactions (tx_hashes):
+    return rpc_batch([('getrawtransaction', [tx_hash, 1]) for tx_hash in tx_hashes])
+def get_block_hashes (block_indexes):
+    return rpc_batch([('getblockhash', [block_index]) for block_index in block_indexes])
 def decode_raw_transaction (unsigned_tx_hex):
     return rpc('decoderawtransaction', [unsigned_tx_hex])
 def get_info():
@@ -148,20 +154,7 @@ def wallet_unlock ():
     else:
         return True    # Wallet is unencrypted.
 
-def rpc (method, params):
-    # Treefunder : Uncomment to view rpc calls
-    #print(method)
-    #print(params)
-    starttime = time.time()
-    headers = {'content-type': 'application/json'}
-    payload = {
-        "method": method,
-        "params": params,
-        "jsonrpc": "2.0",
-        "id": 0,
-    }
-
-    response = connect(config.BACKEND_RPC, payload, headers)
+def check_response (response):
     if response == None:
         if config.TESTNET: network = 'testnet'
         else: network = 'mainnet'
@@ -169,8 +162,8 @@ def rpc (method, params):
     elif response.status_code not in (200, 500):
         raise exceptions.LitecoindRPCError(str(response.status_code) + ' ' + response.reason)
 
+def get_result (response_json, method, params):
     # Return result, with error handling.
-    response_json = response.json()
     if 'error' not in response_json.keys() or response_json['error'] == None:
         return response_json['result']
     elif response_json['error']['code'] == -5:   # RPC_INVALID_ADDRESS_OR_KEY
@@ -191,6 +184,61 @@ def rpc (method, params):
     else:
         raise exceptions.LitecoindError('{}'.format(response_json['error']))
 
+def rpc (method, params):
+    # Treefunder : Uncomment to view rpc calls
+    #print(method)
+    #print(params)
+    starttime = time.time()
+    headers = {'content-type': 'application/json'}
+    payload = {
+        "method": method,
+        "params": params,
+        "jsonrpc": "2.0",
+        "id": 0,
+    }
+
+    response = connect(config.BACKEND_RPC, payload, headers)
+    check_response(response)
+    return get_result(response.json(), method, params)
+
+def rpc_batch (calls, chunk_size=None):
+    """Send `calls`, a list of (method, params), as JSON‐RPC 2.0 batches of at
+    most `chunk_size` requests. Return the results in the order of the calls;
+    the first call which failed raises the error that `rpc()` would raise.
+    """
+    if not chunk_size:
+        chunk_size = config.RPC_BATCH_SIZE
+    headers = {'content-type': 'application/json'}
+
+    results = []
+    for start in range(0, len(calls), chunk_size):
+        chunk = calls[start:start + chunk_size]
+        payload = [{
+            "method": method,
+            "params": params,
+            "jsonrpc": "2.0",
+            "id": call_id,
+        } for call_id, (method, params) in enumerate(chunk)]
+
+        response = connect(config.BACKEND_RPC, payload, headers)
+        check_response(response)
+        response_json = response.json()
+        if not isinstance(response_json, list):     # The whole batch was rejected.
+            method, params = chunk[0]
+            get_result(response_json, method, params)
+            raise exceptions.LitecoindRPCError('Invalid response to batch request.')
+
+        # Responses may come in any order.
+        responses = {}
+        for call_response in response_json:
+            responses[call_response['id']] = call_response
+        for call_id, (method, params) in enumerate(chunk):
+            if call_id not in responses:
+                raise exceptions.LitecoindRPCError('No response to `{}` in batch request.'.format(method))
+            results.append(get_result(responses[call_id], method, params))
+
+    return results
+
 def validate_address(address, block_index):
     addresses = address.split('_')
     multisig = len(addresses) > 1
@@ -293,6 +341,147 @@ def op_push (i):
     else:
         return b'\x4e' + (i).to_bytes(4, byteorder='little')    # OP_PUSHDATA4
 
+# Names of the opcodes that are looked for in `asm` strings. (Anything else
+# is only ever compared for inequality.)
+OPCODE_NAMES = {
+    0x4f: '-1',
+    0x6a: 'OP_RETURN',
+    0x76: 'OP_DUP',
+    0x87: 'OP_EQUAL',
+    0x88: 'OP_EQUALVERIFY',
+    0xa9: 'OP_HASH160',
+    0xac: 'OP_CHECKSIG',
+    0xad: 'OP_CHECKSIGVERIFY',
+    0xae: 'OP_CHECKMULTISIG',
+    0xaf: 'OP_CHECKMULTISIGVERIFY',
+}
+for i in range(1, 17):
+    OPCODE_NAMES[0x50 + i] = str(i)
+
+class Deserialiser (object):
+    """Read fields from serialised blocks and transactions."""
+    def __init__(self, raw):
+        self.raw = raw
+        self.offset = 0
+
+    def read(self, length):
+        if self.offset + length > len(self.raw):
+            raise exceptions.DecodeError('truncated serialisation')
+        chunk = self.raw[self.offset:self.offset + length]
+        self.offset += length
+        return chunk
+
+    def read_int(self, length):
+        return int.from_bytes(self.read(length), byteorder='little')
+
+    def read_var_int(self):
+        i = self.read_int(1)
+        if i == 0xfd: return self.read_int(2)
+        elif i == 0xfe: return self.read_int(4)
+        elif i == 0xff: return self.read_int(8)
+        else: return i
+
+    def read_var_str(self):
+        return self.read(self.read_var_int())
+
+def script_to_asm (script):
+    """Render a script the way the backend does in `scriptPubKey['asm']`."""
+    asm = []
+    i = 0
+    while i < len(script):
+        opcode = script[i]
+        i += 1
+        if opcode > 0x4e:
+            asm.append(OPCODE_NAMES.get(opcode, 'OP_UNKNOWN'))
+            continue
+
+        # Pushes (OP_0 included).
+        if opcode < 0x4c: size_length = 0
+        elif opcode == 0x4c: size_length = 1    # OP_PUSHDATA1
+        elif opcode == 0x4d: size_length = 2    # OP_PUSHDATA2
+        else: size_length = 4                   # OP_PUSHDATA4
+        if i + size_length > len(script):
+            asm.append('[error]')
+            break
+        size = int.from_bytes(script[i:i + size_length], byteorder='little') if size_length else opcode
+        i += size_length
+        if i + size > len(script):
+            asm.append('[error]')
+            break
+        chunk = script[i:i + size]
+        i += size
+
+        # Short pushes are rendered as (signed, little‐endian) numbers.
+        if len(chunk) <= 4:
+            number = int.from_bytes(chunk, byteorder='little')
+            if chunk and chunk[-1] & 0x80:
+                number = -(number & ~(0x80 << (8 * (len(chunk) - 1))))
+            asm.append(str(number))
+        else:
+            asm.append(binascii.hexlify(chunk).decode('utf-8'))
+    return ' '.join(asm)
+
+def deserialise_transaction (deserialiser):
+    """Read one transaction, in the form of the output of `getrawtransaction
+    <tx_hash> 1` (only the fields that are used here).
+    """
+    start = deserialiser.offset
+    version = deserialiser.read(4)
+
+    # Segregated witness: marker and flag.
+    witness = deserialiser.raw[deserialiser.offset:deserialiser.offset + 2]
+    segwit = len(witness) == 2 and witness[0] == 0 and witness[1] != 0
+    if segwit:
+        if witness[1] != 1: raise exceptions.DecodeError('unsupported transaction flag')
+        deserialiser.read(2)
+
+    body_start = deserialiser.offset
+    vin = []
+    for i in range(deserialiser.read_var_int()):
+        prevout_hash = deserialiser.read(32)
+        prevout_n = deserialiser.read_int(4)
+        script_sig = deserialiser.read_var_str()
+        deserialiser.read(4)    # nSequence
+        if prevout_hash == bytes(32) and prevout_n == 0xffffffff:
+            vin.append({'coinbase': binascii.hexlify(script_sig).decode('utf-8')})
+        else:
+            vin.append({'txid': binascii.hexlify(prevout_hash[::-1]).decode('utf-8'), 'vout': prevout_n})
+    vout = []
+    for n in range(deserialiser.read_var_int()):
+        value = deserialiser.read_int(8)
+        script = deserialiser.read_var_str()
+        vout.append({'value': value / config.UNIT,
+                     'n': n,
+                     'scriptPubKey': {'asm': script_to_asm(script), 'hex': binascii.hexlify(script).decode('utf-8')}})
+    body = deserialiser.raw[body_start:deserialiser.offset]
+
+    if segwit:
+        for i in range(len(vin)):
+            for j in range(deserialiser.read_var_int()):
+                deserialiser.read_var_str()
+    lock_time = deserialiser.read(4)
+
+    txid = dhash(version + body + lock_time)[::-1]
+    return {'txid': binascii.hexlify(txid).decode('utf-8'),
+            'hex': binascii.hexlify(deserialiser.raw[start:deserialiser.offset]).decode('utf-8'),
+            'vin': vin,
+            'vout': vout}
+
+def deserialise_block (block_hex):
+    """Parse the output of `getblock <block_hash> false`. Return the block, in
+    the form of the output of `getblock <block_hash>` (only the fields that are
+    used here), and its transactions, in the form of the output of
+    `getrawtransaction <tx_hash> 1`.
+    """
+    deserialiser = Deserialiser(binascii.unhexlify(bytes(block_hex, 'utf-8')))
+    header = deserialiser.read(80)
+    block = {'hash': binascii.hexlify(dhash(header)[::-1]).decode('utf-8'),
+             'previousblockhash': binascii.hexlify(header[4:36][::-1]).decode('utf-8'),
+             'time': int.from_bytes(header[68:72], byteorder='little')}
+    txs = [deserialise_transaction(deserialiser) for i in range(deserialiser.read_var_int())]
+    block['tx'] = [tx['txid'] for tx in txs]
+    return block, txs
+
 def serialise (block_index, encoding, inputs, destination_outputs, data_output=None, change_output=None, source=None, self_public_key=None):
     s  = (1).to_bytes(4, byteorder='little')                # Version
 
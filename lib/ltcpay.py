@@ -3,7 +3,7 @@
 import binascii
 import struct
 
-from . import (util, config, exceptions, litecoin, util)
+from . import (util, config, exceptions, litecoin, util, ledger)
 
 FORMAT = '>32s32s'
 LENGTH = 32 + 32
@@ -105,13 +105,7 @@ def parse (db, tx, message):
             status = 'valid'
 
             # Update order match.
-            bindings = {
-                'status': 'completed',
-                'order_match_id': order_match_id
-            }
-            sql='update order_matches set status = :status where id = :order_match_id'
-            cursor.execute(sql, bindings)
-            util.message(db, tx['block_index'], 'update', 'order_matches', bindings)
+            ledger.update(db, 'order_matches', {'id': order_match_id}, {'status': 'completed'}, tx['block_index'])
 
     # Add parsed transaction to message-type–specific table.
     bindings = {
@@ -124,8 +118,7 @@ def parse (db, tx, message):
         'order_match_id': order_match_id,
         'status': status,
     }
-    sql='insert into ltcpays values(:tx_index, :tx_hash, :block_index, :source, :destination, :ltc_amount, :order_match_id, :status)'
-    cursor.execute(sql, bindings)
+    ledger.insert(db, 'ltcpays', bindings)
 
 
     cursor.close()
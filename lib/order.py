@@ -8,7 +8,7 @@ import decimal
 D = decimal.Decimal
 import logging
 
-from . import (util, config, exceptions, litecoin, util, blockchain)
+from . import (util, config, exceptions, litecoin, util, blockchain, ledger, assets, orderbook, pairs)
 
 FORMAT = '>QQQQHQ'
 LENGTH = 8 + 8 + 8 + 8 + 2 + 8
@@ -42,13 +42,7 @@ def cancel_order (db, order, status, block_index):
     cursor = db.cursor()
 
     # Update status of order.
-    bindings = {
-        'status': status,
-        'tx_hash': order['tx_hash']
-    }
-    sql='update orders set status = :status where tx_hash = :tx_hash'
-    cursor.execute(sql, bindings)
-    util.message(db, block_index, 'update', 'orders', bindings)
+    ledger.update(db, 'orders', {'tx_hash': order['tx_hash']}, {'status': status}, block_index)
 
     if order['give_asset'] != config.LTC:    # Can’t credit LTC.
         util.credit(db, block_index, order['source'], order['give_asset'], order['give_remaining'], action='cancel order', event=order['tx_hash'])
@@ -61,8 +55,7 @@ def cancel_order (db, order, status, block_index):
             'source': order['source'],
             'block_index': block_index
         }
-        sql='insert into order_expirations values(:order_index, :order_hash, :source, :block_index)'
-        cursor.execute(sql, bindings)
+        ledger.insert(db, 'order_expirations', bindings)
 
     cursor.close()
 
@@ -82,13 +75,7 @@ def cancel_order_match (db, order_match, status, block_index):
             return
 
     # Update status of order match.
-    bindings = {
-        'status': status,
-        'order_match_id': order_match['id']
-    }
-    sql='update order_matches set status = :status where id = :order_match_id'
-    cursor.execute(sql, bindings)
-    util.message(db, block_index, 'update', 'order_matches', bindings)
+    ledger.update(db, 'order_matches', {'id': order_match['id']}, {'status': status}, block_index)
 
     order_match_id = order_match['tx0_hash'] + order_match['tx1_hash']
 
@@ -112,16 +99,13 @@ def cancel_order_match (db, order_match, status, block_index):
         else:
             tx0_fee_required_remaining = tx0_order['fee_required_remaining']
         tx0_order_status = tx0_order['status']
-        bindings = {
+        changes = {
             'give_remaining': tx0_give_remaining,
             'get_remaining': tx0_get_remaining,
             'status': tx0_order_status,
-            'fee_required_remaining': tx0_fee_required_remaining,
-            'tx_hash': order_match['tx0_hash']
+            'fee_required_remaining': tx0_fee_required_remaining
         }
-        sql='update orders set give_remaining = :give_remaining, get_remaining = :get_remaining, fee_required_remaining = :fee_required_remaining where tx_hash = :tx_hash'
-        cursor.execute(sql, bindings)
-        util.message(db, block_index, 'update', 'orders', bindings)
+        ledger.update(db, 'orders', {'tx_hash': order_match['tx0_hash']}, changes, block_index)
 
     # If tx1 is dead, credit address directly; if not, replenish give remaining, get remaining, and fee required remaining.
     orders = list(cursor.execute('''SELECT * FROM orders \
@@ -143,16 +127,13 @@ def cancel_order_match (db, order_match, status, block_index):
         else:
             tx1_fee_required_remaining = tx1_order['fee_required_remaining']
         tx1_order_status = tx1_order['status']
-        bindings = {
+        changes = {
             'give_remaining': tx1_give_remaining,
             'get_remaining': tx1_get_remaining,
             'status': tx1_order_status,
-            'fee_required_remaining': tx1_fee_required_remaining,
-            'tx_hash': order_match['tx1_hash']
+            'fee_required_remaining': tx1_fee_required_remaining
         }
-        sql='update orders set give_remaining = :give_remaining, get_remaining = :get_remaining, fee_required_remaining = :fee_required_remaining where tx_hash = :tx_hash'
-        cursor.execute(sql, bindings)
-        util.message(db, block_index, 'update', 'orders', bindings)
+        ledger.update(db, 'orders', {'tx_hash': order_match['tx1_hash']}, changes, block_index)
 
     if block_index < 286500:    # Protocol change.
         # Sanity check: one of the two must have expired.
@@ -185,8 +166,7 @@ def cancel_order_match (db, order_match, status, block_index):
             'tx1_address': order_match['tx1_address'],
             'block_index': block_index
         }
-        sql='insert into order_match_expirations values(:order_match_id, :tx0_address, :tx1_address, :block_index)'
-        cursor.execute(sql, bindings)
+        ledger.insert(db, 'order_match_expirations', bindings)
 
     cursor.close()
 
@@ -220,11 +200,9 @@ def validate (db, source, give_asset, give_quantity, get_asset, get_quantity, ex
 
     if not give_quantity or not get_quantity:
         problems.append('zero give or zero get')
-    cursor.execute('select * from issuances where (status = ? and asset = ?)', ('valid', give_asset))
-    if give_asset not in (config.LTC, config.XPT) and not cursor.fetchall():
+    if give_asset not in (config.LTC, config.XPT) and not assets.get(db, give_asset):
         problems.append('no such asset to give ({})'.format(give_asset))
-    cursor.execute('select * from issuances where (status = ? and asset = ?)', ('valid', get_asset))
-    if get_asset not in (config.LTC, config.XPT) and not cursor.fetchall():
+    if get_asset not in (config.LTC, config.XPT) and not assets.get(db, get_asset):
         problems.append('no such asset to get ({})'.format(get_asset))
     if expiration > config.MAX_EXPIRATION:
         problems.append('expiration overflow')
@@ -244,8 +222,8 @@ def compose (db, source, give_asset, give_quantity, get_asset, get_quantity, exp
         if sum(out['amount'] for out in litecoin.get_unspent_txouts(source)) * config.UNIT < give_quantity:
             print('WARNING: insufficient funds for {}pay.'.format(config.LTC))
     else:
-        balances = list(cursor.execute('''SELECT * FROM balances WHERE (address = ? AND asset = ?)''', (source, give_asset)))
-        if (not balances or balances[0]['quantity'] < give_quantity):
+        balance = util.get_balance(db, source, give_asset)
+        if (balance is None or balance < give_quantity):
             raise exceptions.OrderError('insufficient funds')
 
     problems = validate(db, source, give_asset, give_quantity, get_asset, get_quantity, expiration, fee_required, util.last_block(db)['block_index'])
@@ -282,14 +260,11 @@ def parse (db, tx, message):
             price = 0
 
         # Overorder
-        order_parse_cursor.execute('''SELECT * FROM balances \
-                                      WHERE (address = ? AND asset = ?)''', (tx['source'], give_asset))
-        balances = list(order_parse_cursor)
         if give_asset != config.LTC:
-            if not balances:
+            balance = util.get_balance(db, tx['source'], give_asset)
+            if balance is None:
                 give_quantity = 0
             else:
-                balance = balances[0]['quantity']
                 if balance < give_quantity:
                     give_quantity = balance
                     get_quantity = int(price * give_quantity)
@@ -322,8 +297,7 @@ def parse (db, tx, message):
         'fee_provided_remaining': tx['fee'],
         'status': status,
     }
-    sql='insert into orders values(:tx_index, :tx_hash, :block_index, :source, :give_asset, :give_quantity, :give_remaining, :get_asset, :get_quantity, :get_remaining, :expiration, :expire_index, :fee_required, :fee_required_remaining, :fee_provided, :fee_provided_remaining, :status)'
-    order_parse_cursor.execute(sql, bindings)
+    ledger.insert(db, 'orders', bindings)
 
     # Match.
     if status == 'open' and tx['block_index'] != config.MEMPOOL_BLOCK_INDEX:
@@ -345,17 +319,22 @@ def match (db, tx, block_index=None):
         assert len(orders) == 1
     tx1 = orders[0]
 
-    cursor.execute('''SELECT * FROM orders \
-                      WHERE (give_asset=? AND get_asset=? AND status=? AND tx_hash != ?)''',
-                   (tx1['get_asset'], tx1['give_asset'], 'open', tx1['tx_hash']))
-
     tx1_give_remaining = tx1['give_remaining']
     tx1_get_remaining = tx1['get_remaining']
 
-    order_matches = cursor.fetchall()
-    if tx['block_index'] > 284500 or config.TESTNET:  # Protocol change.
-        order_matches = sorted(order_matches, key=lambda x: x['tx_index'])                              # Sort by tx index second.
-        order_matches = sorted(order_matches, key=lambda x: util.price(x['get_quantity'], x['give_quantity'], tx1['block_index']))   # Sort by price first.
+    # From the book of orders, if prices are exact, and within a block.
+    order_matches = None
+    if tx1['block_index'] >= 294500 or config.TESTNET:    # Protocol change.
+        order_matches = orderbook.orders(db, tx1['get_asset'], tx1['give_asset'], tx1['tx_index'])
+    from_book = order_matches is not None
+    if order_matches is None:
+        cursor.execute('''SELECT * FROM orders \
+                          WHERE (give_asset=? AND get_asset=? AND status=? AND tx_hash != ?)''',
+                       (tx1['get_asset'], tx1['give_asset'], 'open', tx1['tx_hash']))
+        order_matches = cursor.fetchall()
+        if tx['block_index'] > 284500 or config.TESTNET:  # Protocol change.
+            order_matches = sorted(order_matches, key=lambda x: x['tx_index'])                              # Sort by tx index second.
+            order_matches = sorted(order_matches, key=lambda x: util.price(x['get_quantity'], x['give_quantity'], tx1['block_index']))   # Sort by price first.
 
     # Get fee remaining.
     tx1_fee_required_remaining = tx1['fee_required_remaining']
@@ -373,14 +352,7 @@ def match (db, tx, block_index=None):
         tx0_get_remaining = tx0['get_remaining']
 
         # Ignore previous matches. (Both directions, just to be sure.)
-        cursor.execute('''SELECT * FROM order_matches
-                          WHERE id = ? ''', (tx0['tx_hash'] + tx1['tx_hash'], ))
-        if list(cursor):
-            logging.debug('Skipping: previous match')
-            continue
-        cursor.execute('''SELECT * FROM order_matches
-                          WHERE id = ? ''', (tx1['tx_hash'] + tx0['tx_hash'], ))
-        if list(cursor):
+        if pairs.matched(db, 'order_matches', tx0['tx_hash'], tx1['tx_hash']):
             logging.debug('Skipping: previous match')
             continue
 
@@ -424,6 +396,8 @@ def match (db, tx, block_index=None):
         logging.debug('Tx0 Price: {}; Tx1 Inverse Price: {}'.format(float(tx0_price), float(tx1_inverse_price)))
         if tx0_price > tx1_inverse_price:
             logging.debug('Skipping: price mismatch.')
+            if from_book:
+                break   # (None of the orders that follow is cheaper.)
         else:
             logging.debug('Potential forward quantities: {}, {}'.format(tx0_give_remaining, int(util.price(tx1_give_remaining, tx0_price, block_index))))
             forward_quantity = int(min(tx0_give_remaining, int(util.price(tx1_give_remaining, tx0_price, block_index))))
@@ -514,34 +488,28 @@ def match (db, tx, block_index=None):
                     # Fill order, and recredit give_remaining.
                     tx0_status = 'filled'
                     util.credit(db, block_index, tx0['source'], tx0['give_asset'], tx0_give_remaining, event=tx1['tx_hash'], action='filled')
-            bindings = {
+            changes = {
                 'give_remaining': tx0_give_remaining,
                 'get_remaining': tx0_get_remaining,
                 'fee_required_remaining': tx0_fee_required_remaining,
                 'fee_provided_remaining': tx0_fee_provided_remaining,
-                'status': tx0_status,
-                'tx_hash': tx0['tx_hash']
+                'status': tx0_status
             }
-            sql='update orders set give_remaining = :give_remaining, get_remaining = :get_remaining, fee_required_remaining = :fee_required_remaining, fee_provided_remaining = :fee_provided_remaining, status = :status where tx_hash = :tx_hash'
-            cursor.execute(sql, bindings)
-            util.message(db, block_index, 'update', 'orders', bindings)
+            ledger.update(db, 'orders', {'tx_hash': tx0['tx_hash']}, changes, block_index)
             # tx1
             if tx1_give_remaining <= 0 or (tx1_get_remaining <= 0 and (block_index >= 292000 or config.TESTNET)):    # Protocol change
                 if tx1['give_asset'] != config.LTC and tx1['get_asset'] != config.LTC:
                     # Fill order, and recredit give_remaining.
                     tx1_status = 'filled'
                     util.credit(db, block_index, tx1['source'], tx1['give_asset'], tx1_give_remaining, event=tx0['tx_hash'], action='filled')
-            bindings = {
+            changes = {
                 'give_remaining': tx1_give_remaining,
                 'get_remaining': tx1_get_remaining,
                 'fee_required_remaining': tx1_fee_required_remaining,
                 'fee_provided_remaining': tx1_fee_provided_remaining,
-                'status': tx1_status,
-                'tx_hash': tx1['tx_hash']
+                'status': tx1_status
             }
-            sql='update orders set give_remaining = :give_remaining, get_remaining = :get_remaining, fee_required_remaining = :fee_required_remaining, fee_provided_remaining = :fee_provided_remaining, status = :status where tx_hash = :tx_hash'
-            cursor.execute(sql, bindings)
-            util.message(db, block_index, 'update', 'orders', bindings)
+            ledger.update(db, 'orders', {'tx_hash': tx1['tx_hash']}, changes, block_index)
 
             # Calculate when the match will expire.
             if block_index >= 308000 or config.TESTNET:      # Protocol change.
@@ -573,8 +541,7 @@ def match (db, tx, block_index=None):
                 'fee_paid': fee,
                 'status': status,
             }
-            sql='insert into order_matches values(:id, :tx0_index, :tx0_hash, :tx0_address, :tx1_index, :tx1_hash, :tx1_address, :forward_asset, :forward_quantity, :backward_asset, :backward_quantity, :tx0_block_index, :tx1_block_index, :block_index, :tx0_expiration, :tx1_expiration, :match_expire_index, :fee_paid, :status)'
-            cursor.execute(sql, bindings)
+            ledger.insert(db, 'order_matches', bindings)
 
             if tx1_status == 'filled':
                 break
@@ -0,0 +1,118 @@
+#! /usr/bin/python3
+
+"""
+Books of the open orders, for `order.match()` to consider them in order
+without selecting and sorting every open order for a pair of assets for
+each new order.
+
+There is a book for each pair of assets (`give_asset`, `get_asset`), which
+lists the open orders that give the one for the other by price (exactly, as
+`fractions.Fraction`, as `util.price()` computes it since block 294500),
+then by `tx_index`, which is the order in which `order.match()` considers
+them. The orders themselves are read from the database as they are needed.
+
+A book is read from the `orders` table the first time that it is needed,
+and then kept current by `ledger.insert()` and `ledger.update()`, as orders
+are opened, filled, cancelled and expired; the books that a block changes
+are pending until it has been parsed (`blockstate`). Outside of a block,
+the books are not used, and those of the orders written are forgotten.
+"""
+
+import bisect
+import fractions
+
+from . import blockstate
+
+BOOKS = {}          # (give_asset, get_asset) -> sorted list of (price, tx_index).
+PENDING = None      # Set while a block is being parsed.
+
+class Changes (blockstate.BlockState):
+    """Books changed by the block being parsed."""
+    def __init__(self):
+        super().__init__()
+        self.books = {}
+
+def get_key (order):
+    return (fractions.Fraction(order['get_quantity'], order['give_quantity']), order['tx_index'])
+
+def load (db, pair):
+    cursor = db.cursor()
+    orders = list(cursor.execute('''SELECT tx_index, give_quantity, get_quantity FROM orders \
+                                    WHERE (give_asset = ? AND get_asset = ? AND status = ?)''', pair + ('open',)))
+    cursor.close()
+    return sorted([get_key(order) for order in orders])
+
+def get_book (db, changes, pair):
+    if pair in changes.books:
+        return changes.books[pair]
+    if pair not in BOOKS:
+        BOOKS[pair] = load(db, pair)    # (The block hasn’t changed these orders.)
+    return BOOKS[pair]
+
+def orders (db, give_asset, get_asset, tx_index):
+    """Return an iterator over the open orders that give `give_asset` for
+    `get_asset`, other than that of `tx_index`, by price then by `tx_index`,
+    or `None` outside of a block.
+    """
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        return None
+    return iterate(db, get_book(db, changes, (give_asset, get_asset)), tx_index)
+
+def iterate (db, book, tx_index):
+    # The book may lose the orders already considered on the way, as they
+    # are filled.
+    position = 0
+    while position < len(book):
+        key = book[position]
+        position += 1
+        if key[1] == tx_index:
+            continue
+        cursor = db.cursor()
+        order = list(cursor.execute('''SELECT * FROM orders WHERE tx_index = ?''', (key[1],)))[0]
+        cursor.close()
+        yield order
+        position = bisect.bisect_right(book, key)
+
+def change (db, order, opened):
+    """Note that `order` has been opened, or closed, after the fact."""
+    pair = (order['give_asset'], order['get_asset'])
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        BOOKS.pop(pair, None)
+        return
+
+    if pair not in changes.books:
+        if pair not in BOOKS:
+            changes.books[pair] = load(db, pair)    # (With the change.)
+            return
+        changes.books[pair] = list(BOOKS[pair])
+    book = changes.books[pair]
+    key = get_key(order)
+    if opened:
+        bisect.insort(book, key)
+    else:
+        position = bisect.bisect_left(book, key)
+        assert book[position] == key
+        del book[position]
+
+def add (db, order):
+    if order['status'] == 'open':
+        change(db, order, True)
+
+def replace (db, old_order, new_order):
+    if (old_order['status'] == 'open') != (new_order['status'] == 'open'):
+        change(db, new_order, new_order['status'] == 'open')
+
+def commit ():
+    """Publish the books changed by the block just parsed."""
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        return
+    BOOKS.update(changes.books)
+    changes.books = {}
+
+def clear ():
+    BOOKS.clear()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,82 @@
+#! /usr/bin/python3
+
+"""
+Pairs of transactions that have been matched, as orders (`order_matches`)
+or as RPS (`rps_matches`), so that `order.match()` and `rps.match()` can
+tell whether two transactions have been matched before without a query for
+each candidate.
+
+The pairs of a table are read from it the first time that they are needed,
+and then kept current by `ledger.insert()`; those that a block matches are
+pending until it has been parsed (`blockstate`). Outside of a block (for
+the mempool, whose matches are never written), the table is queried instead,
+and the pairs are left as they are.
+"""
+
+import collections
+
+from . import blockstate
+
+TABLES = ('order_matches', 'rps_matches')
+
+PAIRS = {}          # table -> set of (tx0_hash, tx1_hash).
+PENDING = None      # Set while a block is being parsed.
+
+class Changes (blockstate.BlockState):
+    """Pairs matched by the block being parsed."""
+    def __init__(self):
+        super().__init__()
+        self.pairs = collections.defaultdict(set)
+
+def load (db, table):
+    cursor = db.cursor()
+    pairs = set([(match['tx0_hash'], match['tx1_hash']) for match in cursor.execute('''SELECT tx0_hash, tx1_hash FROM {}'''.format(table))])
+    cursor.close()
+    return pairs
+
+def query (db, table, tx0_hash, tx1_hash):
+    cursor = db.cursor()
+    matches = list(cursor.execute('''SELECT tx0_hash FROM {} \
+                                     WHERE ((tx0_hash = ? AND tx1_hash = ?) OR (tx0_hash = ? AND tx1_hash = ?))'''.format(table),
+                                  (tx0_hash, tx1_hash, tx1_hash, tx0_hash)))
+    cursor.close()
+    return bool(matches)
+
+def matched (db, table, tx0_hash, tx1_hash):
+    """Return whether the transactions `tx0_hash` and `tx1_hash` have been
+    matched, either way round, in `table`.
+    """
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        return query(db, table, tx0_hash, tx1_hash)
+
+    pending = changes.pairs[table]
+    if (tx0_hash, tx1_hash) in pending or (tx1_hash, tx0_hash) in pending:
+        return True
+    if table not in PAIRS:
+        if pending:     # (The table has pairs of this block.)
+            return query(db, table, tx0_hash, tx1_hash)
+        PAIRS[table] = load(db, table)
+    return (tx0_hash, tx1_hash) in PAIRS[table] or (tx1_hash, tx0_hash) in PAIRS[table]
+
+def add (table, match):
+    """Note a new match."""
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        return
+    changes.pairs[table].add((match['tx0_hash'], match['tx1_hash']))
+
+def commit ():
+    """Publish the pairs matched by the block just parsed."""
+    changes = blockstate.current(PENDING)
+    if changes is None:
+        return
+    for table, pairs in changes.pairs.items():
+        if table in PAIRS:
+            PAIRS[table] |= pairs
+    changes.pairs.clear()
+
+def clear ():
+    PAIRS.clear()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,139 @@
+#! /usr/bin/python3
+
+"""
+Payouts to the holders of an asset, of a dividend (`dividend.validate()`)
+or of a callback (`callback.validate()`).
+
+They are computed holder by holder, or, when NumPy is installed, for every
+holder at once, with arrays of 64‐bit integers and floats. This gives the
+same floats, and so the same quantities, as long as every quantity involved
+is an integer that a float represents exactly, which it does up to 2**53;
+otherwise, the payouts are computed holder by holder.
+"""
+
+try:
+    import numpy
+except ImportError:     # (NumPy is optional.)
+    numpy = None
+
+from . import config
+
+EXACT = 2 ** 53     # Every integer up to this is exactly a float.
+
+def dividend_outputs_loop (holders, source, quantity_per_unit, divisible, dividend_divisible, dividend_asset, block_index):
+    outputs = []
+    for holder in holders:
+
+        if block_index < 294500 and not config.TESTNET: # Protocol change.
+            if holder['escrow']: continue
+
+        address = holder['address']
+        address_quantity = holder['address_quantity']
+        if block_index >= 296000 or config.TESTNET: # Protocol change.
+            if address == source: continue
+
+        dividend_quantity = address_quantity * quantity_per_unit
+        if divisible: dividend_quantity /= config.UNIT
+        if not dividend_divisible: dividend_quantity /= config.UNIT
+        if dividend_asset == config.LTC and dividend_quantity < config.DEFAULT_MULTISIG_DUST_SIZE: continue    # A bit hackish.
+        dividend_quantity = int(dividend_quantity)
+
+        outputs.append({'address': address, 'address_quantity': address_quantity, 'dividend_quantity': dividend_quantity})
+    return outputs
+
+def dividend_outputs_numpy (holders, source, quantity_per_unit, divisible, dividend_divisible, dividend_asset, block_index):
+    """Return the outputs of `dividend_outputs_loop()`, or `None` if they
+    mightn’t be exactly the same.
+    """
+    skip_escrow = block_index < 294500 and not config.TESTNET   # Protocol change.
+    skip_source = block_index >= 296000 or config.TESTNET       # Protocol change.
+    holdings = [(holder['address'], holder['address_quantity']) for holder in holders
+                if not (skip_escrow and holder['escrow']) and not (skip_source and holder['address'] == source)]
+    if not holdings:
+        return []
+    addresses, address_quantities = zip(*holdings)
+    address_quantities = numpy.array(address_quantities, dtype=numpy.int64)
+    if type(quantity_per_unit) != int or int(numpy.abs(address_quantities).max()) * abs(quantity_per_unit) > EXACT:
+        return None
+
+    # (`address_quantity * quantity_per_unit` is an integer, which, divided
+    # by `config.UNIT`, gives the float nearest to the quotient.)
+    dividend_quantities = address_quantities * quantity_per_unit
+    if divisible or not dividend_divisible:
+        dividend_quantities = dividend_quantities.astype(numpy.float64)
+        if divisible: dividend_quantities /= config.UNIT
+        if not dividend_divisible: dividend_quantities /= config.UNIT
+    if dividend_asset == config.LTC:
+        paid = numpy.flatnonzero(numpy.logical_not(dividend_quantities < config.DEFAULT_MULTISIG_DUST_SIZE))
+        addresses = [addresses[index] for index in paid.tolist()]
+        address_quantities = address_quantities[paid]
+        dividend_quantities = dividend_quantities[paid]
+    dividend_quantities = numpy.trunc(dividend_quantities).astype(numpy.int64)
+
+    return [{'address': address, 'address_quantity': address_quantity, 'dividend_quantity': dividend_quantity}
+            for address, address_quantity, dividend_quantity in zip(addresses, address_quantities.tolist(), dividend_quantities.tolist())]
+
+def dividend_outputs (holders, source, quantity_per_unit, divisible, dividend_divisible, dividend_asset, block_index):
+    """Return the dividends of `holders`, in order: for each holder paid, its
+    address, the quantity of the asset that it holds and its dividend.
+    """
+    outputs = None
+    if numpy is not None:
+        outputs = dividend_outputs_numpy(holders, source, quantity_per_unit, divisible, dividend_divisible, dividend_asset, block_index)
+    if outputs is None:
+        outputs = dividend_outputs_loop(holders, source, quantity_per_unit, divisible, dividend_divisible, dividend_asset, block_index)
+    return outputs
+
+def callback_outputs_loop (holders, source, fraction, parse):
+    outputs = []
+    for holder in holders:
+
+        # If composing (and not parsing), predict funds to be returned from
+        # escrow (instead of cancelling open offers, etc.), by *not* skipping
+        # listing escrowed funds here.
+        if parse and holder['escrow']:
+            continue
+
+        address = holder['address']
+        address_quantity = holder['address_quantity']
+        if address == source or address_quantity == 0: continue
+
+        callback_quantity = int(address_quantity * fraction)   # Round down.
+        fraction_actual = callback_quantity / address_quantity
+
+        outputs.append({'address': address, 'address_quantity': address_quantity, 'callback_quantity': callback_quantity, 'fraction_actual': fraction_actual})
+    return outputs
+
+def callback_outputs_numpy (holders, source, fraction, parse):
+    """Return the outputs of `callback_outputs_loop()`, or `None` if they
+    mightn’t be exactly the same.
+    """
+    holdings = [(holder['address'], holder['address_quantity']) for holder in holders
+                if not (parse and holder['escrow']) and holder['address'] != source and holder['address_quantity'] != 0]
+    if not holdings:
+        return []
+    addresses, address_quantities = zip(*holdings)
+    address_quantities = numpy.array(address_quantities, dtype=numpy.int64)
+    # (A fraction greater than one is invalid.)
+    if type(fraction) != float or not abs(fraction) <= 1 or int(numpy.abs(address_quantities).max()) > EXACT:
+        return None
+
+    callback_quantities = numpy.trunc(address_quantities.astype(numpy.float64) * fraction).astype(numpy.int64)    # Round down.
+    fractions_actual = callback_quantities.astype(numpy.float64) / address_quantities.astype(numpy.float64)
+
+    return [{'address': address, 'address_quantity': address_quantity, 'callback_quantity': callback_quantity, 'fraction_actual': fraction_actual}
+            for address, address_quantity, callback_quantity, fraction_actual in zip(addresses, address_quantities.tolist(), callback_quantities.tolist(), fractions_actual.tolist())]
+
+def callback_outputs (holders, source, fraction, parse):
+    """Return the quantities called back from `holders`, in order: for each
+    holder, its address, the quantity of the asset that it holds, the
+    quantity called back and the fraction of its holding that that is.
+    """
+    outputs = None
+    if numpy is not None:
+        outputs = callback_outputs_numpy(holders, source, fraction, parse)
+    if outputs is None:
+        outputs = callback_outputs_loop(holders, source, fraction, parse)
+    return outputs
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
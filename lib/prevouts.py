@@ -0,0 +1,143 @@
+#! /usr/bin/python3
+
+"""
+Cache of transaction outputs, `(txid, vout) -> (value, scriptPubKey)`, for
+resolving the sources and fees of transactions without fetching the parents
+of their inputs from the backend.
+
+Recently used outputs are kept in memory (LRU); every output that is seen is
+also written to a small SQLite database next to the main one, which is pruned
+to a fixed number of rows. Nothing here is consensus‐critical: a miss simply
+means a call to the backend.
+"""
+
+import binascii
+import collections
+import threading
+import logging
+import apsw
+
+from . import config
+
+BUSY_TIMEOUT = 10000    # Milliseconds.
+
+class PrevoutCache (object):
+    def __init__(self, path, size, disk_size):
+        self.size = size
+        self.disk_size = disk_size
+        self.memory = collections.OrderedDict()     # (txid, vout) -> (value, script), least recently used first.
+        self.lock = threading.RLock()               # Blocks are prefetched (and decoded) on worker threads.
+        self.hits, self.disk_hits, self.misses = 0, 0, 0
+
+        self.db = apsw.Connection(path)
+        self.db.setbusytimeout(BUSY_TIMEOUT)      # Each decoding process writes to it too.
+        cursor = self.db.cursor()
+        cursor.execute('''PRAGMA synchronous = OFF''')
+        cursor.execute('''PRAGMA journal_mode = WAL''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS prevouts(
+                          txid TEXT,
+                          vout INTEGER,
+                          value INTEGER,
+                          script BLOB,
+                          PRIMARY KEY (txid, vout))
+                       ''')
+        cursor.close()
+
+    def remember(self, key, output):
+        self.memory[key] = output
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def get(self, txid, vout):
+        """Return `(value, script)` of an output, in satoshis and bytes, or `None`."""
+        key = (txid, vout)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+
+            cursor = self.db.cursor()
+            rows = list(cursor.execute('''SELECT value, script FROM prevouts WHERE (txid = ? AND vout = ?)''', key))
+            cursor.close()
+            if rows:
+                output = (rows[0][0], bytes(rows[0][1]))
+                self.remember(key, output)
+                self.disk_hits += 1
+                return output
+
+            self.misses += 1
+            return None
+
+    def add(self, outputs):
+        """Add outputs, in the form `((txid, vout), (value, script))`."""
+        outputs = list(outputs)
+        if not outputs: return
+        with self.lock:
+            for key, output in outputs:
+                self.remember(key, output)
+            cursor = self.db.cursor()
+            try:
+                with self.db:
+                    cursor.executemany('''INSERT OR REPLACE INTO prevouts VALUES (?,?,?,?)''',
+                                       [(txid, vout, value, script) for (txid, vout), (value, script) in outputs])
+                    # Oldest rows go first.
+                    last_rowid = list(cursor.execute('''SELECT MAX(rowid) FROM prevouts'''))[0][0]
+                    if last_rowid > self.disk_size:
+                        cursor.execute('''DELETE FROM prevouts WHERE rowid <= ?''', (last_rowid - self.disk_size,))
+            except apsw.BusyError:
+                # Still locked by another process: the outputs are only kept in memory.
+                logging.debug('Status: Prevout cache busy; not writing {} outputs.'.format(len(outputs)))
+            cursor.close()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {'size': len(self.memory),
+                    'hits': self.hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else None}
+
+CACHE = None
+CACHE_LOCK = threading.Lock()
+
+def get_cache ():
+    global CACHE
+    with CACHE_LOCK:
+        if CACHE is None and config.PREVOUT_CACHE_SIZE:
+            logging.debug('Status: Opening prevout cache `{}`.'.format(config.PREVOUT_DATABASE.split('/').pop()))
+            CACHE = PrevoutCache(config.PREVOUT_DATABASE, config.PREVOUT_CACHE_SIZE, config.PREVOUT_CACHE_DISK_SIZE)
+        return CACHE
+
+def get (txid, vout):
+    cache = get_cache()
+    if not cache: return None
+    return cache.get(txid, vout)
+
+def add_transaction (tx):
+    """Add every output of a transaction, in the form of the output of
+    `getrawtransaction <tx_hash> 1`.
+    """
+    add_transactions([tx])
+
+def add_transactions (txs):
+    cache = get_cache()
+    if not cache: return
+    cache.add([((tx['txid'], vout['n']),
+                (round(vout['value'] * config.UNIT), binascii.unhexlify(bytes(vout['scriptPubKey']['hex'], 'utf-8'))))
+               for tx in txs for vout in tx['vout']])
+
+def add_ctransaction (txid, ctx):
+    """Add every output of a deserialised `CTransaction`."""
+    cache = get_cache()
+    if not cache: return
+    cache.add([((txid, n), (vout.nValue, bytes(vout.scriptPubKey))) for n, vout in enumerate(ctx.vout)])
+
+def stats ():
+    cache = get_cache()
+    if not cache: return None
+    return cache.stats()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
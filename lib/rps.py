@@ -26,7 +26,7 @@ import time
 import binascii
 import string
 
-from . import (util, config, litecoin, exceptions, util)
+from . import (util, config, litecoin, exceptions, util, ledger, pairs)
 # possible_moves wager move_random_hash expiration
 FORMAT = '>HQ32sI'
 LENGTH = 2 + 8 + 32 + 4
@@ -36,13 +36,7 @@ def cancel_rps (db, rps, status, block_index):
     cursor = db.cursor()
 
     # Update status of rps.
-    bindings = {
-        'status': status,
-        'tx_hash': rps['tx_hash']
-    }
-    sql='''UPDATE rps SET status = :status WHERE tx_hash = :tx_hash'''
-    cursor.execute(sql, bindings)
-    util.message(db, block_index, 'update', 'rps', bindings)
+    ledger.update(db, 'rps', {'tx_hash': rps['tx_hash']}, {'status': status}, block_index)
 
     util.credit(db, block_index, rps['source'], 'XPT', rps['wager'], action='recredit wager', event=rps['tx_hash'])
 
@@ -65,13 +59,7 @@ def update_rps_match_status (db, rps_match, status, block_index):
                     2 * rps_match['wager'], action='wins', event=rps_match['id'])
 
     # Update status of rps match.
-    bindings = {
-        'status': status,
-        'rps_match_id': rps_match['id']
-    }
-    sql='UPDATE rps_matches SET status = :status WHERE id = :rps_match_id'
-    cursor.execute(sql, bindings)
-    util.message(db, block_index, 'update', 'rps_matches', bindings)
+    ledger.update(db, 'rps_matches', {'id': rps_match['id']}, {'status': status}, block_index)
 
     cursor.close()
 
@@ -135,13 +123,10 @@ def parse(db, tx, message):
     if status == 'open':
         move_random_hash = binascii.hexlify(move_random_hash).decode('utf8')
         # Overbet
-        rps_parse_cursor.execute('''SELECT * FROM balances \
-                                    WHERE (address = ? AND asset = ?)''', (tx['source'], 'XPT'))
-        balances = list(rps_parse_cursor)
-        if not balances:
+        balance = util.get_balance(db, tx['source'], 'XPT')
+        if balance is None:
             wager = 0
         else:
-            balance = balances[0]['quantity']
             if balance < wager:
                 wager = balance
 
@@ -165,8 +150,7 @@ def parse(db, tx, message):
         'expire_index': tx['block_index'] + expiration,
         'status': status,
     }
-    sql = '''INSERT INTO rps VALUES (:tx_index, :tx_hash, :block_index, :source, :possible_moves, :wager, :move_random_hash, :expiration, :expire_index, :status)'''
-    rps_parse_cursor.execute(sql, bindings)
+    ledger.insert(db, 'rps', bindings)
 
     # Match.
     if status == 'open':
@@ -191,31 +175,20 @@ def match (db, tx, block_index):
 
     # Get rps match
     bindings = (possible_moves, 'open', wager, tx1['source'])
-    # dont match twice same RPS
-    already_matched = []
-    old_rps_matches = cursor.execute('''SELECT * FROM rps_matches WHERE tx0_hash = ? OR tx1_hash = ?''', (tx1['tx_hash'], tx1['tx_hash']))
-    for old_rps_match in old_rps_matches:
-        counter_tx_hash = old_rps_match['tx1_hash'] if tx1['tx_hash'] == old_rps_match['tx0_hash'] else old_rps_match['tx0_hash']
-        already_matched.append(counter_tx_hash)
-    already_matched_cond = ''
-    if already_matched:
-        already_matched_cond = '''AND tx_hash NOT IN ({})'''.format(','.join(['?' for e in range(0, len(already_matched))]))
-        bindings += tuple(already_matched)
-
-    sql = '''SELECT * FROM rps WHERE (possible_moves = ? AND status = ? AND wager = ? AND source != ? {}) ORDER BY tx_index LIMIT 1'''.format(already_matched_cond)
-    rps_matches = list(cursor.execute(sql, bindings))
+    rps_matches = []
+    sql = '''SELECT * FROM rps WHERE (possible_moves = ? AND status = ? AND wager = ? AND source != ?) ORDER BY tx_index'''
+    for rps in cursor.execute(sql, bindings):
+        # dont match twice same RPS
+        if not pairs.matched(db, 'rps_matches', rps['tx_hash'], tx1['tx_hash']):
+            rps_matches.append(rps)
+            break
 
     if rps_matches:
         tx0 = rps_matches[0]
 
         # update status
         for txn in [tx0, tx1]:
-            bindings = {
-                'status': 'matched',
-                'tx_index': txn['tx_index']
-            }
-            cursor.execute('''UPDATE rps SET status = :status WHERE tx_index = :tx_index''', bindings)
-            util.message(db, block_index, 'update', 'rps', bindings)
+            ledger.update(db, 'rps', {'tx_index': txn['tx_index']}, {'status': 'matched'}, block_index)
 
         bindings = {
             'id': tx0['tx_hash'] + tx1['tx_hash'],
@@ -237,11 +210,7 @@ def match (db, tx, block_index):
             'match_expire_index': block_index + 20,
             'status': 'pending'
         }
-        sql = '''INSERT INTO rps_matches VALUES (:id, :tx0_index, :tx0_hash, :tx0_address, :tx1_index, :tx1_hash, :tx1_address,
-                                                 :tx0_move_random_hash, :tx1_move_random_hash, :wager, :possible_moves,
-                                                 :tx0_block_index, :tx1_block_index, :block_index, :tx0_expiration, :tx1_expiration,
-                                                 :match_expire_index, :status)'''
-        cursor.execute(sql, bindings)
+        ledger.insert(db, 'rps_matches', bindings)
 
     cursor.close()
 
@@ -260,8 +229,7 @@ def expire (db, block_index):
             'source': rps['source'],
             'block_index': block_index
         }
-        sql = '''INSERT INTO rps_expirations VALUES (:rps_index, :rps_hash, :source, :block_index)'''
-        cursor.execute(sql, bindings)
+        ledger.insert(db, 'rps_expirations', bindings)
 
     # Expire rps matches
     expire_bindings = ('pending', 'pending and resolved', 'resolved and pending', block_index)
@@ -283,8 +251,7 @@ def expire (db, block_index):
             'tx1_address': rps_match['tx1_address'],
             'block_index': block_index
         }
-        sql = '''INSERT INTO rps_match_expirations VALUES (:rps_match_id, :tx0_address, :tx1_address, :block_index)'''
-        cursor.execute(sql, bindings)
+        ledger.insert(db, 'rps_match_expirations', bindings)
         
         # Rematch not expired and not resolved RPS
         if new_rps_match_status == 'expired':
@@ -292,7 +259,7 @@ def expire (db, block_index):
             bindings = (rps_match['tx0_hash'], rps_match['tx1_hash'], 'matched', block_index)
             matched_rps = list(cursor.execute(sql, bindings))
             for rps in matched_rps:
-                cursor.execute('''UPDATE rps SET status = ? WHERE tx_index = ?''', ('open', rps['tx_index']))
+                ledger.update(db, 'rps', {'tx_index': rps['tx_index']}, {'status': 'open'})
                 # Re-debit XPT refund by close_rps_match.
                 util.debit(db, block_index, rps['source'], 'XPT', rps['wager'], action='reopen RPS after matching expiration', event=rps_match['id'])
                 # Rematch
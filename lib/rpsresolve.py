@@ -4,7 +4,7 @@ import binascii
 import struct
 import string
 
-from . import (util, config, exceptions, litecoin, util, rps)
+from . import (util, config, exceptions, litecoin, util, rps, ledger)
 # move random rps_match_id
 FORMAT = '>H16s32s32s'
 LENGTH = 2 + 16 + 32 + 32
@@ -149,8 +149,7 @@ def parse (db, tx, message):
 
         rps.update_rps_match_status(db, rps_match, rps_match_status, tx['block_index'])
 
-    sql = '''INSERT INTO rpsresolves VALUES (:tx_index, :tx_hash, :block_index, :source, :move, :random, :rps_match_id, :status)'''
-    cursor.execute(sql, rpsresolves_bindings)
+    ledger.insert(db, 'rpsresolves', rpsresolves_bindings)
 
     cursor.close()
 
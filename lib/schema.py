@@ -0,0 +1,227 @@
+#! /usr/bin/python3
+
+"""
+Versioned schema for the secondary indexes of the database.
+
+Index names are global to an SQLite database, so every index is qualified with
+the name of its table. `migrate()` builds missing indexes and replaces
+misnamed ones on an existing database, without a reparse.
+"""
+
+import logging
+
+from . import exceptions
+
+SCHEMA_VERSION = 1
+
+# (table, suffix, columns); the name of the index is `<table>_<suffix>`.
+INDEXES = [
+    ('blocks', 'block_index_idx', ('block_index',)),
+    ('blocks', 'index_hash_idx', ('block_index', 'block_hash')),
+
+    ('transactions', 'block_index_idx', ('block_index',)),
+    ('transactions', 'tx_index_idx', ('tx_index',)),
+    ('transactions', 'tx_hash_idx', ('tx_hash',)),
+    ('transactions', 'index_index_idx', ('block_index', 'tx_index')),
+    ('transactions', 'index_hash_index_idx', ('tx_index', 'tx_hash', 'block_index')),
+
+    ('debits', 'address_idx', ('address',)),
+    ('debits', 'asset_idx', ('asset',)),
+
+    ('credits', 'address_idx', ('address',)),
+    ('credits', 'asset_idx', ('asset',)),
+
+    ('balances', 'address_asset_idx', ('address', 'asset')),
+    ('balances', 'address_idx', ('address',)),
+    ('balances', 'asset_idx', ('asset',)),
+
+    ('sends', 'block_index_idx', ('block_index',)),
+    ('sends', 'source_idx', ('source',)),
+    ('sends', 'destination_idx', ('destination',)),
+    ('sends', 'asset_idx', ('asset',)),
+
+    ('orders', 'block_index_idx', ('block_index',)),
+    ('orders', 'index_hash_idx', ('tx_index', 'tx_hash')),
+    ('orders', 'expire_idx', ('expire_index', 'status')),
+    ('orders', 'give_status_idx', ('give_asset', 'status')),
+    ('orders', 'source_give_status_idx', ('source', 'give_asset', 'status')),
+    ('orders', 'give_get_status_idx', ('get_asset', 'give_asset', 'status')),
+    ('orders', 'source_idx', ('source',)),
+    ('orders', 'give_asset_idx', ('give_asset',)),
+
+    ('order_matches', 'match_expire_idx', ('status', 'match_expire_index')),
+    ('order_matches', 'forward_status_idx', ('forward_asset', 'status')),
+    ('order_matches', 'backward_status_idx', ('backward_asset', 'status')),
+    ('order_matches', 'id_idx', ('id',)),
+    ('order_matches', 'tx0_address_idx', ('tx0_address',)),
+    ('order_matches', 'tx1_address_idx', ('tx1_address',)),
+
+    ('ltcpays', 'block_index_idx', ('block_index',)),
+    ('ltcpays', 'source_idx', ('source',)),
+    ('ltcpays', 'destination_idx', ('destination',)),
+
+    ('issuances', 'block_index_idx', ('block_index',)),
+    ('issuances', 'valid_asset_idx', ('asset', 'status')),
+    ('issuances', 'status_idx', ('status',)),
+    ('issuances', 'source_idx', ('source',)),
+
+    ('broadcasts', 'block_index_idx', ('block_index',)),
+    ('broadcasts', 'status_source_idx', ('status', 'source')),
+    ('broadcasts', 'status_source_index_idx', ('status', 'source', 'tx_index')),
+    ('broadcasts', 'timestamp_idx', ('timestamp',)),
+
+    ('bets', 'block_index_idx', ('block_index',)),
+    ('bets', 'index_hash_idx', ('tx_index', 'tx_hash')),
+    ('bets', 'expire_idx', ('status', 'expire_index')),
+    ('bets', 'feed_valid_bettype_idx', ('feed_address', 'status', 'bet_type')),
+    ('bets', 'source_idx', ('source',)),
+    ('bets', 'status_idx', ('status',)),
+
+    ('bet_matches', 'match_expire_idx', ('status', 'match_expire_index')),
+    ('bet_matches', 'valid_feed_idx', ('feed_address', 'status')),
+    ('bet_matches', 'id_idx', ('id',)),
+    ('bet_matches', 'tx0_address_idx', ('tx0_address',)),
+    ('bet_matches', 'tx1_address_idx', ('tx1_address',)),
+    ('bet_matches', 'status_idx', ('status',)),
+
+    ('dividends', 'block_index_idx', ('block_index',)),
+    ('dividends', 'source_idx', ('source',)),
+    ('dividends', 'asset_idx', ('asset',)),
+
+    ('burns', 'status_idx', ('status',)),
+    ('burns', 'address_idx', ('source',)),
+
+    ('cancels', 'block_index_idx', ('block_index',)),
+    ('cancels', 'source_idx', ('source',)),
+
+    ('callbacks', 'block_index_idx', ('block_index',)),
+    ('callbacks', 'source_idx', ('source',)),
+    ('callbacks', 'asset_idx', ('asset',)),
+
+    ('rps', 'source_idx', ('source',)),
+    ('rps', 'matching_idx', ('wager', 'possible_moves')),
+    ('rps', 'status_idx', ('status',)),
+
+    ('rps_matches', 'match_expire_idx', ('status', 'match_expire_index')),
+    ('rps_matches', 'tx0_address_idx', ('tx0_address',)),
+    ('rps_matches', 'tx1_address_idx', ('tx1_address',)),
+    ('rps_matches', 'status_idx', ('status',)),
+
+    ('escrows', 'asset_idx', ('asset', 'kind', 'status', 'row_id', 'side')),
+    ('escrows', 'row_idx', ('kind', 'row_id')),
+
+    ('rpsresolves', 'block_index_idx', ('block_index',)),
+    ('rpsresolves', 'source_idx', ('source',)),
+    ('rpsresolves', 'rps_match_id_idx', ('rps_match_id',)),
+
+    ('order_expirations', 'block_index_idx', ('block_index',)),
+    ('order_expirations', 'source_idx', ('source',)),
+
+    ('bet_expirations', 'block_index_idx', ('block_index',)),
+    ('bet_expirations', 'source_idx', ('source',)),
+
+    ('rps_expirations', 'block_index_idx', ('block_index',)),
+    ('rps_expirations', 'source_idx', ('source',)),
+
+    ('order_match_expirations', 'block_index_idx', ('block_index',)),
+    ('order_match_expirations', 'tx0_address_idx', ('tx0_address',)),
+    ('order_match_expirations', 'tx1_address_idx', ('tx1_address',)),
+
+    ('bet_match_expirations', 'block_index_idx', ('block_index',)),
+    ('bet_match_expirations', 'tx0_address_idx', ('tx0_address',)),
+    ('bet_match_expirations', 'tx1_address_idx', ('tx1_address',)),
+
+    ('rps_match_expirations', 'block_index_idx', ('block_index',)),
+    ('rps_match_expirations', 'tx0_address_idx', ('tx0_address',)),
+    ('rps_match_expirations', 'tx1_address_idx', ('tx1_address',)),
+
+    ('messages', 'block_index_idx', ('block_index',)),
+    ('messages', 'block_index_message_index_idx', ('block_index', 'message_index')),
+]
+
+def index_name (table, suffix):
+    return '{}_{}'.format(table, suffix)
+
+def expected_indexes ():
+    """Return {name: (table, columns)} for every index the code declares."""
+    expected = {}
+    for table, suffix, columns in INDEXES:
+        name = index_name(table, suffix)
+        assert name not in expected
+        expected[name] = (table, tuple(columns))
+    return expected
+
+def existing_indexes (db):
+    """Return {name: (table, columns)} for every explicit index in the database."""
+    cursor = db.cursor()
+    existing = {}
+    # Automatic indexes (for UNIQUE and PRIMARY KEY constraints) have no SQL.
+    rows = list(cursor.execute('''SELECT name, tbl_name FROM sqlite_master WHERE type = ? AND sql IS NOT NULL''', ('index',)))
+    for row in rows:
+        columns = [(column['seqno'], column['name']) for column in cursor.execute('''PRAGMA index_info({})'''.format(row['name']))]
+        existing[row['name']] = (row['tbl_name'], tuple(name for seqno, name in sorted(columns)))
+    cursor.close()
+    return existing
+
+def report (db):
+    """Compare the indexes in the database with those the code expects.
+
+    Each entry has a `status` of `ok`, `missing` (not built, or built on the
+    wrong columns), `misnamed` (the right columns under a legacy name) or
+    `unknown` (not declared by the code).
+    """
+    expected = expected_indexes()
+    existing = existing_indexes(db)
+    by_definition = {definition: name for name, definition in expected.items()}
+
+    entries = []
+    for name in sorted(expected):
+        table, columns = expected[name]
+        status = 'ok' if existing.get(name) == (table, columns) else 'missing'
+        entries.append({'table': table, 'index': name, 'columns': columns, 'status': status})
+    for name in sorted(existing):
+        if name in expected: continue
+        table, columns = existing[name]
+        status = 'misnamed' if (table, columns) in by_definition else 'unknown'
+        entries.append({'table': table, 'index': name, 'columns': columns, 'status': status})
+    return entries
+
+def get_version (db):
+    cursor = db.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS schema_version(
+                      version INTEGER)
+                   ''')
+    versions = list(cursor.execute('''SELECT version FROM schema_version'''))
+    cursor.close()
+    return versions[0]['version'] if versions else 0
+
+def set_version (db, version):
+    cursor = db.cursor()
+    cursor.execute('''DELETE FROM schema_version''')
+    cursor.execute('''INSERT INTO schema_version VALUES (?)''', (version,))
+    cursor.close()
+
+def migrate (db):
+    """Bring the schema of an existing database up to date, without a reparse."""
+    version = get_version(db)
+    if version > SCHEMA_VERSION:
+        raise exceptions.DatabaseError('Database schema version {} is newer than this client’s ({}).'.format(version, SCHEMA_VERSION))
+
+    cursor = db.cursor()
+    tables = [row['name'] for row in cursor.execute('''SELECT name FROM sqlite_master WHERE type = ?''', ('table',))]
+    for entry in report(db):
+        if entry['table'] not in tables:
+            continue
+        if entry['status'] == 'misnamed':
+            logging.debug('Status: Dropping misnamed index `{}`.'.format(entry['index']))
+            cursor.execute('''DROP INDEX IF EXISTS {}'''.format(entry['index']))
+        elif entry['status'] == 'missing':
+            logging.debug('Status: Building index `{}`.'.format(entry['index']))
+            cursor.execute('''DROP INDEX IF EXISTS {}'''.format(entry['index']))
+            cursor.execute('''CREATE INDEX {} ON {} ({})'''.format(entry['index'], entry['table'], ', '.join(entry['columns'])))
+    cursor.close()
+
+    if version != SCHEMA_VERSION:
+        set_version(db, SCHEMA_VERSION)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -4,7 +4,7 @@
 
 import struct
 
-from . import (util, config, exceptions, litecoin, util)
+from . import (util, config, exceptions, litecoin, util, ledger)
 
 FORMAT = '>QQ'
 LENGTH = 8 + 8
@@ -36,8 +36,8 @@ def compose (db, source, destination, asset, quantity):
         raise exceptions.SendError('quantity must be an int (in satoshi)')
 
     # Only for outgoing (incoming will overburn).
-    balances = list(cursor.execute('''SELECT * FROM balances WHERE (address = ? AND asset = ?)''', (source, asset)))
-    if not balances or balances[0]['quantity'] < quantity:
+    balance = util.get_balance(db, source, asset)
+    if balance is None or balance < quantity:
         raise exceptions.SendError('insufficient funds')
 
     problems = validate(db, source, destination, asset, quantity)
@@ -66,13 +66,11 @@ def parse (db, tx, message):
 
     if status == 'valid':
         # Oversend
-        cursor.execute('''SELECT * FROM balances \
-                                     WHERE (address = ? AND asset = ?)''', (tx['source'], asset))
-        balances = cursor.fetchall()
-        if not balances:
+        balance = util.get_balance(db, tx['source'], asset)
+        if balance is None:
             status = 'invalid: insufficient funds'
-        elif balances[0]['quantity'] < quantity:
-            quantity = min(balances[0]['quantity'], quantity)
+        elif balance < quantity:
+            quantity = min(balance, quantity)
 
     if status == 'valid':
         # For SQLite3
@@ -95,8 +93,7 @@ def parse (db, tx, message):
         'quantity': quantity,
         'status': status,
     }
-    sql='insert into sends values(:tx_index, :tx_hash, :block_index, :source, :destination, :asset, :quantity, :status)'
-    cursor.execute(sql, bindings)
+    ledger.insert(db, 'sends', bindings)
 
 
     cursor.close()
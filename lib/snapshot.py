@@ -0,0 +1,133 @@
+#! /usr/bin/python3
+
+"""
+Periodic snapshots of the tables that are derived from parsing, so that a
+rollback (`blocks.reparse()` to a given block) needs only replay the blocks
+after the nearest one. A full reparse never uses them.
+
+A snapshot is a copy of the derived tables alone, in a database of its own,
+tagged with the height, the consensus hashes and the minor version number
+of the block it was taken at. It is used only if those hashes are still
+those of the block in the database and the minor version is the current
+one.
+"""
+
+import os
+import logging
+import apsw
+
+from . import config
+
+def get_path (block_index):
+    return os.path.join(config.SNAPSHOT_DIR, '{:010d}.db'.format(block_index))
+
+def list_snapshots ():
+    """Return the heights of the snapshots on disk, newest first."""
+    if not config.SNAPSHOT_DIR or not os.path.isdir(config.SNAPSHOT_DIR):
+        return []
+    heights = []
+    for filename in os.listdir(config.SNAPSHOT_DIR):
+        name, extension = os.path.splitext(filename)
+        if extension == '.db' and name.isdigit():
+            heights.append(int(name))
+    return sorted(heights, reverse=True)
+
+def is_due (block_index):
+    return bool(config.SNAPSHOT_INTERVAL and config.SNAPSHOT_DIR and not block_index % config.SNAPSHOT_INTERVAL)
+
+def take (db, block_index, tables):
+    """Snapshot `tables`, as committed at the end of a block."""
+    if not is_due(block_index):
+        return
+    cursor = db.cursor()
+    block = list(cursor.execute('''SELECT * FROM blocks WHERE block_index = ?''', (block_index,)))[0]
+
+    logging.info('Status: Taking snapshot at block {}.'.format(block_index))
+    if not os.path.isdir(config.SNAPSHOT_DIR):
+        os.makedirs(config.SNAPSHOT_DIR)
+    path = get_path(block_index)
+    temporary_path = path + '.tmp'
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+
+    # (Not possible inside a transaction.)
+    cursor.execute('''ATTACH DATABASE ? AS new_snapshot''', (temporary_path,))
+    try:
+        with db:
+            # (Without the constraints, which refer to tables left out.)
+            for table in tables:
+                cursor.execute('''CREATE TABLE new_snapshot.{0} AS SELECT * FROM main.{0} ORDER BY rowid'''.format(table))
+            cursor.execute('''CREATE TABLE new_snapshot.snapshot(
+                              block_index INTEGER,
+                              ledger_hash TEXT,
+                              txlist_hash TEXT,
+                              minor_version INTEGER)
+                           ''')
+            cursor.execute('''INSERT INTO new_snapshot.snapshot VALUES(?,?,?,?)''', (block_index, block['ledger_hash'], block['txlist_hash'], config.VERSION_MINOR))
+    finally:
+        cursor.execute('''DETACH DATABASE new_snapshot''')
+        cursor.close()
+    os.replace(temporary_path, path)
+
+    prune()
+
+def prune (block_index=None):
+    """Keep only the newest `config.SNAPSHOT_RETENTION` snapshots, and none
+    after `block_index`, if it is set.
+    """
+    for i, height in enumerate(list_snapshots()):
+        if (block_index is not None and height > block_index) or i >= config.SNAPSHOT_RETENTION:
+            logging.debug('Status: Removing snapshot at block {}.'.format(height))
+            os.remove(get_path(height))
+
+def find (db, block_index):
+    """Return the height of the newest usable snapshot at or below
+    `block_index`, or `None`.
+    """
+    cursor = db.cursor()
+    for height in list_snapshots():
+        if height > block_index:
+            continue
+        try:
+            snapshot_db = apsw.Connection(get_path(height), flags=apsw.SQLITE_OPEN_READONLY)
+            snapshot_cursor = snapshot_db.cursor()
+            tag = list(snapshot_cursor.execute('''SELECT block_index, ledger_hash, txlist_hash, minor_version FROM snapshot'''))[0]
+            snapshot_db.close()
+        except (apsw.Error, IndexError) as e:
+            logging.warning('Status: Ignoring unreadable snapshot at block {} ({}).'.format(height, e))
+            continue
+        blocks = list(cursor.execute('''SELECT * FROM blocks WHERE block_index = ?''', (height,)))
+        if tag[3] != config.VERSION_MINOR or not blocks or (tag[1], tag[2]) != (blocks[0]['ledger_hash'], blocks[0]['txlist_hash']):
+            logging.debug('Status: Snapshot at block {} is stale.'.format(height))
+            continue
+        cursor.close()
+        return height
+    cursor.close()
+    return None
+
+def attach (db, block_index):
+    # (Not possible inside a transaction.)
+    cursor = db.cursor()
+    cursor.execute('''ATTACH DATABASE ? AS snapshot''', (get_path(block_index),))
+    cursor.close()
+
+def detach (db):
+    cursor = db.cursor()
+    cursor.execute('''DETACH DATABASE snapshot''')
+    cursor.close()
+
+def restore (db, tables):
+    """Replace the contents of `tables` with those of the attached snapshot.
+
+    (`tables` are in the order of `blocks.TABLES`, that in which they may be
+    deleted: they are filled in the reverse order.)
+    """
+    cursor = db.cursor()
+    for table in tables:
+        cursor.execute('''DELETE FROM main.{}'''.format(table))
+    for table in reversed(tables):
+        columns = ', '.join([column['name'] for column in cursor.execute('''PRAGMA main.table_info({})'''.format(table))])
+        cursor.execute('''INSERT INTO main.{0}({1}) SELECT {1} FROM snapshot.{0} ORDER BY rowid'''.format(table, columns))
+    cursor.close()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,108 @@
+#! /usr/bin/python3
+
+"""
+Running totals of the supply of each asset, in a table of their own
+(`supplies`), so that `util.supplies()` and `util.xpt_supply()` read them
+instead of summing every valid burn, issuance and dividend.
+
+The table is derived from the others, and kept up to date by
+`ledger.insert()`: for each asset, `issued` is the sum of the quantities of
+its valid issuances; for XPT, `burned` is what valid burns have earned, and
+`fees_paid` what has been paid for valid issuances and dividends. Assets
+are listed in the order of their first valid issuance. `verify()`
+recomputes every total from scratch.
+"""
+
+import logging
+
+from . import (config, exceptions)
+
+def burn_supplies (burn):
+    return [(config.XPT, 0, burn['earned'], 0)]
+
+def issuance_supplies (issuance):
+    return [(issuance['asset'], issuance['quantity'], 0, 0), (config.XPT, 0, 0, issuance['fee_paid'])]
+
+def dividend_supplies (dividend):
+    return [(config.XPT, 0, 0, dividend['fee_paid'])]
+
+# table -> function of a valid row that returns the changes to the supply of
+# assets that it records, as (asset, issued, burned, fees_paid).
+SUPPLIES = {
+    'issuances': issuance_supplies,
+    'burns': burn_supplies,
+    'dividends': dividend_supplies,
+}
+
+def get_supplies (table, row):
+    if row['status'] != 'valid':
+        return []
+    return SUPPLIES[table](row)
+
+def add (db, table, row):
+    """Add the changes to the supply of assets recorded by a new row."""
+    supplies = get_supplies(table, row)
+    if not supplies:
+        return
+    cursor = db.cursor()
+    for asset, issued, burned, fees_paid in supplies:
+        cursor.execute('''INSERT OR IGNORE INTO supplies VALUES(?,?,?,?)''', (asset, 0, 0, 0))
+        cursor.execute('''UPDATE supplies SET issued = issued + ?, burned = burned + ?, fees_paid = fees_paid + ? \
+                          WHERE asset = ?''', (issued, burned, fees_paid, asset))
+    cursor.close()
+
+def get (db):
+    """Return the totals of every asset, in order, as (asset, (issued,
+    burned, fees_paid)).
+    """
+    cursor = db.cursor()
+    supplies = [(row['asset'], (row['issued'], row['burned'], row['fees_paid'])) for row in cursor.execute('''SELECT * FROM supplies ORDER BY rowid''')]
+    cursor.close()
+    return supplies
+
+def rebuild (db):
+    """Derive the table from scratch."""
+    logging.debug('Status: Building the table of supplies.')
+    cursor = db.cursor()
+    cursor.execute('''DELETE FROM supplies''')
+    for table in SUPPLIES:
+        for row in list(cursor.execute('''SELECT * FROM {} WHERE status = ? ORDER BY rowid'''.format(table), ('valid',))):
+            add(db, table, row)
+    cursor.close()
+
+def verify (db):
+    """Recompute every total from the burns, issuances and dividends, and
+    check them against the table.
+    """
+    logging.debug('Status: Checking the table of supplies.')
+    cursor = db.cursor()
+    expected = {config.XPT: [0, 0, 0]}
+    for table in SUPPLIES:
+        for row in cursor.execute('''SELECT * FROM {} WHERE status = ?'''.format(table), ('valid',)):
+            for asset, issued, burned, fees_paid in SUPPLIES[table](row):
+                totals = expected.setdefault(asset, [0, 0, 0])
+                totals[0] += issued
+                totals[1] += burned
+                totals[2] += fees_paid
+    cursor.close()
+
+    recorded = dict([(asset, list(totals)) for asset, totals in get(db)])
+    recorded.setdefault(config.XPT, [0, 0, 0])
+    for asset in sorted(set(expected) | set(recorded)):
+        if expected.get(asset) != recorded.get(asset):
+            raise exceptions.SanityError('supply of {} recorded as {} (issued, burned, fees paid), not {}'.format(asset, recorded.get(asset), expected.get(asset)))
+
+def initialise (db):
+    cursor = db.cursor()
+    exists = list(cursor.execute('''SELECT name FROM sqlite_master WHERE (type = ? AND name = ?)''', ('table', 'supplies')))
+    cursor.execute('''CREATE TABLE IF NOT EXISTS supplies(
+                      asset TEXT PRIMARY KEY,
+                      issued INTEGER,
+                      burned INTEGER,
+                      fees_paid INTEGER)
+                   ''')
+    cursor.close()
+    if not exists:
+        rebuild(db)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,124 @@
+#! /usr/bin/python3
+
+"""
+Undo journal, for rolling back the last few blocks after a chain
+reorganisation without reparsing everything.
+
+Triggers on every table record, for each insert, update and delete, the SQL
+statement that reverses it. `start_block()` notes where in the journal each
+block begins, so that rolling back to the end of a block is a matter of
+running that block’s successors’ statements in reverse order. The journal
+only goes back `config.UNDOLOG_DEPTH` blocks.
+"""
+
+import logging
+
+from . import config
+
+# Tables that are never rolled back.
+UNJOURNALED_TABLES = ['undolog', 'undolog_block', 'mempool', 'schema_version']
+
+def get_tables (db):
+    cursor = db.cursor()
+    tables = [row['name'] for row in cursor.execute('''SELECT name FROM sqlite_master WHERE type = ? ORDER BY name''', ('table',))]
+    cursor.close()
+    return [table for table in tables if table not in UNJOURNALED_TABLES and not table.startswith('sqlite_')]
+
+def create_triggers (db):
+    cursor = db.cursor()
+    for table in get_tables(db):
+        columns = [column['name'] for column in cursor.execute('''PRAGMA table_info({})'''.format(table))]
+        drop_table_triggers(cursor, table)
+
+        # Insert: delete the row.
+        cursor.execute('''CREATE TRIGGER undolog_{0}_insert AFTER INSERT ON {0} BEGIN
+                          INSERT INTO undolog(sql) VALUES('DELETE FROM {0} WHERE rowid = ' || NEW.rowid);
+                          END'''.format(table))
+
+        # Update: restore the columns that changed, if any did.
+        changes = ' || '.join(['''CASE WHEN OLD.{0} IS NOT NEW.{0} THEN '{0} = ' || quote(OLD.{0}) || ', ' ELSE '' END'''.format(column) for column in columns])
+        changed = ' OR '.join(['OLD.{0} IS NOT NEW.{0}'.format(column) for column in columns])
+        cursor.execute('''CREATE TRIGGER undolog_{0}_update AFTER UPDATE ON {0} WHEN {2} BEGIN
+                          INSERT INTO undolog(sql) VALUES('UPDATE {0} SET ' || rtrim({1}, ', ') || ' WHERE rowid = ' || OLD.rowid);
+                          END'''.format(table, changes, changed))
+
+        # Delete: insert the row again, with the same rowid.
+        values = ' || \', \' || '.join(['quote(OLD.{})'.format(column) for column in columns])
+        cursor.execute('''CREATE TRIGGER undolog_{0}_delete AFTER DELETE ON {0} BEGIN
+                          INSERT INTO undolog(sql) VALUES('INSERT INTO {0}(rowid, {1}) VALUES(' || OLD.rowid || ', ' || {2} || ')');
+                          END'''.format(table, ', '.join(columns), values))
+    cursor.close()
+
+def drop_table_triggers (cursor, table):
+    for action in ('insert', 'update', 'delete'):
+        cursor.execute('''DROP TRIGGER IF EXISTS undolog_{}_{}'''.format(table, action))
+
+def clear (db):
+    """Stop journaling, and forget the journal (e.g. for a full reparse)."""
+    cursor = db.cursor()
+    for table in get_tables(db):
+        drop_table_triggers(cursor, table)
+    cursor.execute('''DELETE FROM undolog''')
+    cursor.execute('''DELETE FROM undolog_block''')
+    cursor.close()
+
+def initialise (db):
+    cursor = db.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS undolog(
+                      undo_index INTEGER PRIMARY KEY,
+                      sql TEXT)
+                   ''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS undolog_block(
+                      block_index INTEGER PRIMARY KEY,
+                      first_undo_index INTEGER)
+                   ''')
+    cursor.close()
+
+    if config.UNDOLOG_DEPTH:
+        create_triggers(db)
+    else:
+        clear(db)
+
+def start_block (db, block_index):
+    """Mark the beginning of the changes made by a block, and prune the journal."""
+    if not config.UNDOLOG_DEPTH:
+        return
+    cursor = db.cursor()
+    cursor.execute('''INSERT OR REPLACE INTO undolog_block VALUES(?, (SELECT IFNULL(MAX(undo_index), 0) + 1 FROM undolog))''', (block_index,))
+    oldest = list(cursor.execute('''SELECT first_undo_index FROM undolog_block WHERE block_index = ?''', (block_index - config.UNDOLOG_DEPTH,)))
+    if oldest:
+        cursor.execute('''DELETE FROM undolog WHERE undo_index < ?''', (oldest[0]['first_undo_index'],))
+        cursor.execute('''DELETE FROM undolog_block WHERE block_index < ?''', (block_index - config.UNDOLOG_DEPTH,))
+    cursor.close()
+
+def rollback (db, block_index):
+    """Undo every change made after the end of block `block_index`. Return
+    `False`, without changing anything, if the journal doesn’t go back that
+    far.
+    """
+    cursor = db.cursor()
+    if not list(cursor.execute('''SELECT name FROM sqlite_master WHERE (type = ? AND name = ?)''', ('table', 'undolog_block'))):
+        cursor.close()
+        return False
+    last_block_index = list(cursor.execute('''SELECT MAX(block_index) AS block_index FROM blocks'''))[0]['block_index']
+    if last_block_index is None or last_block_index <= block_index:
+        cursor.close()
+        return True
+    marks = list(cursor.execute('''SELECT * FROM undolog_block WHERE block_index > ? ORDER BY block_index''', (block_index,)))
+    if not marks or [mark['block_index'] for mark in marks] != list(range(block_index + 1, last_block_index + 1)):
+        cursor.close()
+        return False
+
+    logging.warning('Status: Rolling back to block {} with the undo journal.'.format(block_index))
+    first_undo_index = marks[0]['first_undo_index']
+    with db:
+        statements = list(cursor.execute('''SELECT sql FROM undolog WHERE undo_index >= ? ORDER BY undo_index DESC''', (first_undo_index,)))
+        for statement in statements:
+            cursor.execute(statement['sql'])
+        # (Including what the triggers recorded for the statements just run.)
+        cursor.execute('''DELETE FROM undolog WHERE undo_index >= ?''', (first_undo_index,))
+        cursor.execute('''DELETE FROM undolog_block WHERE block_index > ?''', (block_index,))
+    cursor.close()
+    return True
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
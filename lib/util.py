@@ -15,7 +15,7 @@ import warnings
 import binascii
 import hashlib
 
-from . import (config, exceptions)
+from . import (config, exceptions, blockstate, assets, conservation, escrow, supply)
 
 D = decimal.Decimal
 b26_digits = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
@@ -25,6 +25,8 @@ BET_TYPE_NAME = {0: 'BullCFD', 1: 'BearCFD', 2: 'Equal', 3: 'NotEqual'}
 BET_TYPE_ID = {'BullCFD': 0, 'BearCFD': 1, 'Equal': 2, 'NotEqual': 3}
 
 BLOCK_LEDGER = []
+BALANCE_CACHE = None    # Set while a block is being parsed.
+MESSAGE_BUFFER = None   # Set while a block is being parsed.
 
 # TODO: This doesn’t timeout properly. (If server hangs, then unhangs, no result.)
 def api (method, params):
@@ -61,187 +63,191 @@ def price (numerator, denominator, block_index):
         denominator = D(denominator)
         return D(numerator / denominator)
 
-def log (db, command, category, bindings):
-    cursor = db.cursor()
-
-    # Slow?!
-    def output (quantity, asset):
+def log_quantity (db, quantity, asset):
+    try:
+        if asset not in ('fraction', 'leverage'):
+            return str(devise(db, quantity, asset, 'output')) + ' ' + asset
+        else:
+            return str(devise(db, quantity, asset, 'output'))
+    except exceptions.AssetError:
+        return '<AssetError>'
+    except decimal.DivisionByZero:
+        return '<DivisionByZero>'
+
+def log_issuance (db, bindings):
+    if bindings['transfer']:
+        return 'Issuance: {} transfered asset {} to {} ({}) [{}]'.format(bindings['source'], bindings['asset'], bindings['issuer'], bindings['tx_hash'], bindings['status'])
+    elif bindings['locked']:
+        return 'Issuance: {} locked asset {} ({}) [{}]'.format(bindings['issuer'], bindings['asset'], bindings['tx_hash'], bindings['status'])
+    else:
+        if bindings['divisible']:
+            divisibility = 'divisible'
+            unit = config.UNIT
+        else:
+            divisibility = 'indivisible'
+            unit = 1
+        if bindings['callable'] and (bindings['block_index'] > 283271 or config.TESTNET):   # Protocol change.
+            callability = 'callable from {} for {} XPT/{}'.format(isodt(bindings['call_date']), bindings['call_price'], bindings['asset'])
+        else:
+            callability = 'uncallable'
         try:
-            if asset not in ('fraction', 'leverage'):
-                return str(devise(db, quantity, asset, 'output')) + ' ' + asset
-            else:
-                return str(devise(db, quantity, asset, 'output'))
-        except exceptions.AssetError:
-            return '<AssetError>'
-        except decimal.DivisionByZero:
-            return '<DivisionByZero>'
-
-    if command == 'update':
-        if category == 'order':
-            logging.debug('Database: set status of order {} to {}.'.format(bindings['tx_hash'], bindings['status']))
-        elif category == 'bet':
-            logging.debug('Database: set status of bet {} to {}.'.format(bindings['tx_hash'], bindings['status']))
-        elif category == 'order_matches':
-            logging.debug('Database: set status of order_match {} to {}.'.format(bindings['order_match_id'], bindings['status']))
-        elif category == 'bet_matches':
-            logging.debug('Database: set status of bet_match {} to {}.'.format(bindings['bet_match_id'], bindings['status']))
-        # TODO: elif category == 'balances':
-            # logging.debug('Database: set balance of {} in {} to {}.'.format(bindings['address'], bindings['asset'], output(bindings['quantity'], bindings['asset']).split(' ')[0]))
-
-    elif command == 'insert':
-
-        if category == 'credits':
-            logging.debug('Credit: {} to {} #{}# <{}>'.format(output(bindings['quantity'], bindings['asset']), bindings['address'], bindings['action'], bindings['event']))
-
-        elif category == 'debits':
-            logging.debug('Debit: {} from {} #{}# <{}>'.format(output(bindings['quantity'], bindings['asset']), bindings['address'], bindings['action'], bindings['event']))
-
-        elif category == 'sends':
-            logging.info('Send: {} from {} to {} ({}) [{}]'.format(output(bindings['quantity'], bindings['asset']), bindings['source'], bindings['destination'], bindings['tx_hash'], bindings['status']))
-
-        elif category == 'orders':
-            logging.info('Order: {} ordered {} for {} in {} blocks, with a provided fee of {} {} and a required fee of {} {} ({}) [{}]'.format(bindings['source'], output(bindings['give_quantity'], bindings['give_asset']), output(bindings['get_quantity'], bindings['get_asset']), bindings['expiration'], bindings['fee_provided'] / config.UNIT, config.LTC, bindings['fee_required'] / config.UNIT, config.LTC, bindings['tx_hash'], bindings['status']))
-
-        elif category == 'order_matches':
-            logging.info('Order Match: {} for {} ({}) [{}]'.format(output(bindings['forward_quantity'], bindings['forward_asset']), output(bindings['backward_quantity'], bindings['backward_asset']), bindings['id'], bindings['status']))
-
-        elif category == 'ltcpays':
-            logging.info('{} Payment: {} paid {} to {} for order match {} ({}) [{}]'.format(config.LTC, bindings['source'], output(bindings['ltc_amount'], config.LTC), bindings['destination'], bindings['order_match_id'], bindings['tx_hash'], bindings['status']))
-
-        elif category == 'issuances':
-            if bindings['transfer']:
-                logging.info('Issuance: {} transfered asset {} to {} ({}) [{}]'.format(bindings['source'], bindings['asset'], bindings['issuer'], bindings['tx_hash'], bindings['status']))
-            elif bindings['locked']:
-                logging.info('Issuance: {} locked asset {} ({}) [{}]'.format(bindings['issuer'], bindings['asset'], bindings['tx_hash'], bindings['status']))
-            else:
-                if bindings['divisible']:
-                    divisibility = 'divisible'
-                    unit = config.UNIT
-                else:
-                    divisibility = 'indivisible'
-                    unit = 1
-                if bindings['callable'] and (bindings['block_index'] > 283271 or config.TESTNET):   # Protocol change.
-                    callability = 'callable from {} for {} XPT/{}'.format(isodt(bindings['call_date']), bindings['call_price'], bindings['asset'])
-                else:
-                    callability = 'uncallable'
-                try:
-                    quantity = devise(db, bindings['quantity'], None, dest='output', divisible=bindings['divisible'])
-                except Exception as e:
-                    quantity = '?'
-                logging.info('Issuance: {} created {} of asset {}, which is {} and {}, with description ‘{}’ ({}) [{}]'.format(bindings['issuer'], quantity, bindings['asset'], divisibility, callability, bindings['description'], bindings['tx_hash'], bindings['status']))
-
-        elif category == 'broadcasts':
-            if bindings['locked']:
-                logging.info('Broadcast: {} locked his feed ({}) [{}]'.format(bindings['source'], bindings['tx_hash'], bindings['status']))
-            else:
-                if not bindings['value']: infix = '‘{}’'.format(bindings['text'])
-                else: infix = '‘{}’ = {}'.format(bindings['text'], bindings['value'])
-                suffix = ' from ' + bindings['source'] + ' at ' + isodt(bindings['timestamp']) + ' with a fee of {}%'.format(output(D(bindings['fee_fraction_int'] / 1e8) * D(100), 'fraction')) + ' (' + bindings['tx_hash'] + ')' + ' [{}]'.format(bindings['status'])
-                logging.info('Broadcast: {}'.format(infix + suffix))
-
-        elif category == 'bets':
-            # Last text
-            broadcasts = list(cursor.execute('''SELECT * FROM broadcasts WHERE (status = ? AND source = ?) ORDER BY tx_index ASC''', ('valid', bindings['feed_address'])))
-            try:
-                last_broadcast = broadcasts[-1]
-                text = last_broadcast['text']
-            except IndexError:
-                text = '<Text>'
-
-            # Suffix
-            end = 'in {} blocks ({}) [{}]'.format(bindings['expiration'], bindings['tx_hash'], bindings['status'])
-
-            if 'CFD' not in BET_TYPE_NAME[bindings['bet_type']]:
-                log_message = 'Bet: {} against {}, by {}, on {} that ‘{}’ will {} {} at {}, {}'.format(output(bindings['wager_quantity'], config.XPT), output(bindings['counterwager_quantity'], config.XPT), bindings['source'], bindings['feed_address'], text, BET_TYPE_NAME[bindings['bet_type']], str(output(bindings['target_value'], 'value').split(' ')[0]), isodt(bindings['deadline']), end)
-            else:
-                log_message = 'Bet: {}, by {}, on {} for {} against {}, leveraged {}x, {}'.format(BET_TYPE_NAME[bindings['bet_type']], bindings['source'], bindings['feed_address'],output(bindings['wager_quantity'], config.XPT), output(bindings['counterwager_quantity'], config.XPT), output(bindings['leverage']/ 5040, 'leverage'), end)
-
-            logging.info(log_message)
-
-        elif category == 'bet_matches':
-            placeholder = ''
-            if bindings['target_value'] >= 0:    # Only non‐negative values are valid.
-                placeholder = ' that ' + str(output(bindings['target_value'], 'value'))
-            if bindings['leverage']:
-                placeholder += ', leveraged {}x'.format(output(bindings['leverage'] / 5040, 'leverage'))
-            logging.info('Bet Match: {} for {} against {} for {} on {} at {}{} ({}) [{}]'.format(BET_TYPE_NAME[bindings['tx0_bet_type']], output(bindings['forward_quantity'], config.XPT), BET_TYPE_NAME[bindings['tx1_bet_type']], output(bindings['backward_quantity'], config.XPT), bindings['feed_address'], isodt(bindings['deadline']), placeholder, bindings['id'], bindings['status']))
-
-        elif category == 'dividends':
-            logging.info('Dividend: {} paid {} per unit of {} ({}) [{}]'.format(bindings['source'], output(bindings['quantity_per_unit'], bindings['dividend_asset']), bindings['asset'], bindings['tx_hash'], bindings['status']))
-
-        elif category == 'burns':
-            logging.info('Burn: {} burned {} for {} ({}) [{}]'.format(bindings['source'], output(bindings['burned'], config.LTC), output(bindings['earned'], config.XPT), bindings['tx_hash'], bindings['status']))
-
-        elif category == 'cancels':
-            logging.info('Cancel: {} ({}) [{}]'.format(bindings['offer_hash'], bindings['tx_hash'], bindings['status']))
-
-        elif category == 'callbacks':
-            logging.info('Callback: {} called back {}% of {} ({}) [{}]'.format(bindings['source'], float(D(bindings['fraction']) * D(100)), bindings['asset'], bindings['tx_hash'], bindings['status']))
-
-        elif category == 'rps':
-            log_message = 'RPS: {} opens game with {} possible moves and a wager of {}'.format(bindings['source'], bindings['possible_moves'], output(bindings['wager'], 'XPT'))
-            logging.info(log_message)
-
-        elif category == 'rps_matches':
-            log_message = 'RPS Match: {} is playing a {}-moves game with {} with a wager of {} ({}) [{}]'.format(bindings['tx0_address'], bindings['possible_moves'], bindings['tx1_address'], output(bindings['wager'], 'XPT'), bindings['id'], bindings['status'])
-            logging.info(log_message)
-
-        elif category == 'rpsresolves':
-            
-            if bindings['status'] == 'valid':
-                rps_matches = list(cursor.execute('''SELECT * FROM rps_matches WHERE id = ?''', (bindings['rps_match_id'],)))
-                assert len(rps_matches) == 1
-                rps_match = rps_matches[0]
-                log_message = 'RPS Resolved: {} is playing {} on a {}-moves game with {} with a wager of {} ({}) [{}]'.format(rps_match['tx0_address'], bindings['move'], rps_match['possible_moves'], rps_match['tx1_address'], output(rps_match['wager'], 'XPT'), rps_match['id'], rps_match['status'])
-            else:
-                log_message = 'RPS Resolved: {} [{}]'.format(bindings['tx_hash'], bindings['status'])
-            logging.info(log_message)
-
-        elif category == 'order_expirations':
-            logging.info('Expired order: {}'.format(bindings['order_hash']))
-
-        elif category == 'order_match_expirations':
-            logging.info('Expired Order Match awaiting payment: {}'.format(bindings['order_match_id']))
-
-        elif category == 'bet_expirations':
-            logging.info('Expired bet: {}'.format(bindings['bet_hash']))
+            quantity = devise(db, bindings['quantity'], None, dest='output', divisible=bindings['divisible'])
+        except Exception as e:
+            quantity = '?'
+        return 'Issuance: {} created {} of asset {}, which is {} and {}, with description ‘{}’ ({}) [{}]'.format(bindings['issuer'], quantity, bindings['asset'], divisibility, callability, bindings['description'], bindings['tx_hash'], bindings['status'])
+
+def log_broadcast (db, bindings):
+    if bindings['locked']:
+        return 'Broadcast: {} locked his feed ({}) [{}]'.format(bindings['source'], bindings['tx_hash'], bindings['status'])
+    else:
+        if not bindings['value']: infix = '‘{}’'.format(bindings['text'])
+        else: infix = '‘{}’ = {}'.format(bindings['text'], bindings['value'])
+        suffix = ' from ' + bindings['source'] + ' at ' + isodt(bindings['timestamp']) + ' with a fee of {}%'.format(log_quantity(db, D(bindings['fee_fraction_int'] / 1e8) * D(100), 'fraction')) + ' (' + bindings['tx_hash'] + ')' + ' [{}]'.format(bindings['status'])
+        return 'Broadcast: {}'.format(infix + suffix)
+
+def log_bet (db, bindings):
+    # Last text
+    broadcast = last_broadcast(db, bindings['feed_address'])
+    if broadcast:
+        text = broadcast['text']
+    else:
+        text = '<Text>'
 
-        elif category == 'bet_match_expirations':
-            logging.info('Expired Bet Match: {}'.format(bindings['bet_match_id']))
+    # Suffix
+    end = 'in {} blocks ({}) [{}]'.format(bindings['expiration'], bindings['tx_hash'], bindings['status'])
 
-        elif category == 'bet_match_resolutions':
-            # DUPE
-            cfd_type_id = BET_TYPE_ID['BullCFD'] + BET_TYPE_ID['BearCFD']
-            equal_type_id = BET_TYPE_ID['Equal'] + BET_TYPE_ID['NotEqual']
+    if 'CFD' not in BET_TYPE_NAME[bindings['bet_type']]:
+        return 'Bet: {} against {}, by {}, on {} that ‘{}’ will {} {} at {}, {}'.format(log_quantity(db, bindings['wager_quantity'], config.XPT), log_quantity(db, bindings['counterwager_quantity'], config.XPT), bindings['source'], bindings['feed_address'], text, BET_TYPE_NAME[bindings['bet_type']], str(log_quantity(db, bindings['target_value'], 'value').split(' ')[0]), isodt(bindings['deadline']), end)
+    else:
+        return 'Bet: {}, by {}, on {} for {} against {}, leveraged {}x, {}'.format(BET_TYPE_NAME[bindings['bet_type']], bindings['source'], bindings['feed_address'],log_quantity(db, bindings['wager_quantity'], config.XPT), log_quantity(db, bindings['counterwager_quantity'], config.XPT), log_quantity(db, bindings['leverage']/ 5040, 'leverage'), end)
+
+def log_bet_match (db, bindings):
+    placeholder = ''
+    if bindings['target_value'] >= 0:    # Only non‐negative values are valid.
+        placeholder = ' that ' + str(log_quantity(db, bindings['target_value'], 'value'))
+    if bindings['leverage']:
+        placeholder += ', leveraged {}x'.format(log_quantity(db, bindings['leverage'] / 5040, 'leverage'))
+    return 'Bet Match: {} for {} against {} for {} on {} at {}{} ({}) [{}]'.format(BET_TYPE_NAME[bindings['tx0_bet_type']], log_quantity(db, bindings['forward_quantity'], config.XPT), BET_TYPE_NAME[bindings['tx1_bet_type']], log_quantity(db, bindings['backward_quantity'], config.XPT), bindings['feed_address'], isodt(bindings['deadline']), placeholder, bindings['id'], bindings['status'])
+
+def log_rpsresolve (db, bindings):
+    if bindings['status'] == 'valid':
+        cursor = db.cursor()
+        rps_matches = list(cursor.execute('''SELECT * FROM rps_matches WHERE id = ?''', (bindings['rps_match_id'],)))
+        cursor.close()
+        assert len(rps_matches) == 1
+        rps_match = rps_matches[0]
+        return 'RPS Resolved: {} is playing {} on a {}-moves game with {} with a wager of {} ({}) [{}]'.format(rps_match['tx0_address'], bindings['move'], rps_match['possible_moves'], rps_match['tx1_address'], log_quantity(db, rps_match['wager'], 'XPT'), rps_match['id'], rps_match['status'])
+    else:
+        return 'RPS Resolved: {} [{}]'.format(bindings['tx_hash'], bindings['status'])
 
-            if bindings['bet_match_type_id'] == cfd_type_id:
-                if bindings['settled']:
-                    logging.info('Bet Match Settled: {} credited to the bull, {} credited to the bear, and {} credited to the feed address ({})'.format(output(bindings['bull_credit'], config.XPT), output(bindings['bear_credit'], config.XPT), output(bindings['fee'], config.XPT), bindings['bet_match_id']))
-                else:
-                    logging.info('Bet Match Force‐Liquidated: {} credited to the bull, {} credited to the bear, and {} credited to the feed address ({})'.format(output(bindings['bull_credit'], config.XPT), output(bindings['bear_credit'], config.XPT), output(bindings['fee'], config.XPT), bindings['bet_match_id']))
+def log_bet_match_resolution (db, bindings):
+    # DUPE
+    cfd_type_id = BET_TYPE_ID['BullCFD'] + BET_TYPE_ID['BearCFD']
+    equal_type_id = BET_TYPE_ID['Equal'] + BET_TYPE_ID['NotEqual']
 
-            elif bindings['bet_match_type_id'] == equal_type_id:
-                logging.info('Bet Match Settled: {} won the pot of {}; {} credited to the feed address ({})'.format(bindings['winner'], output(bindings['escrow_less_fee'], config.XPT), output(bindings['fee'], config.XPT), bindings['bet_match_id']))
+    if bindings['bet_match_type_id'] == cfd_type_id:
+        if bindings['settled']:
+            return 'Bet Match Settled: {} credited to the bull, {} credited to the bear, and {} credited to the feed address ({})'.format(log_quantity(db, bindings['bull_credit'], config.XPT), log_quantity(db, bindings['bear_credit'], config.XPT), log_quantity(db, bindings['fee'], config.XPT), bindings['bet_match_id'])
+        else:
+            return 'Bet Match Force‐Liquidated: {} credited to the bull, {} credited to the bear, and {} credited to the feed address ({})'.format(log_quantity(db, bindings['bull_credit'], config.XPT), log_quantity(db, bindings['bear_credit'], config.XPT), log_quantity(db, bindings['fee'], config.XPT), bindings['bet_match_id'])
 
-        elif category == 'rps_expirations':
-            logging.info('Expired RPS: {}'.format(bindings['rps_hash']))
+    else:
+        assert bindings['bet_match_type_id'] == equal_type_id
+        return 'Bet Match Settled: {} won the pot of {}; {} credited to the feed address ({})'.format(bindings['winner'], log_quantity(db, bindings['escrow_less_fee'], config.XPT), log_quantity(db, bindings['fee'], config.XPT), bindings['bet_match_id'])
+
+# (command, category) -> (level, function of the database and the bindings
+# that returns the message).
+LOG_FORMATS = {
+    ('update', 'order'): (logging.DEBUG, lambda db, b: 'Database: set status of order {} to {}.'.format(b['tx_hash'], b['status'])),
+    ('update', 'bet'): (logging.DEBUG, lambda db, b: 'Database: set status of bet {} to {}.'.format(b['tx_hash'], b['status'])),
+    ('update', 'order_matches'): (logging.DEBUG, lambda db, b: 'Database: set status of order_match {} to {}.'.format(b['order_match_id'], b['status'])),
+    ('update', 'bet_matches'): (logging.DEBUG, lambda db, b: 'Database: set status of bet_match {} to {}.'.format(b['bet_match_id'], b['status'])),
+    # TODO: ('update', 'balances'): (logging.DEBUG, lambda db, b: 'Database: set balance of {} in {} to {}.'.format(b['address'], b['asset'], log_quantity(db, b['quantity'], b['asset']).split(' ')[0])),
+
+    ('insert', 'credits'): (logging.DEBUG, lambda db, b: 'Credit: {} to {} #{}# <{}>'.format(log_quantity(db, b['quantity'], b['asset']), b['address'], b['action'], b['event'])),
+    ('insert', 'debits'): (logging.DEBUG, lambda db, b: 'Debit: {} from {} #{}# <{}>'.format(log_quantity(db, b['quantity'], b['asset']), b['address'], b['action'], b['event'])),
+    ('insert', 'sends'): (logging.INFO, lambda db, b: 'Send: {} from {} to {} ({}) [{}]'.format(log_quantity(db, b['quantity'], b['asset']), b['source'], b['destination'], b['tx_hash'], b['status'])),
+    ('insert', 'orders'): (logging.INFO, lambda db, b: 'Order: {} ordered {} for {} in {} blocks, with a provided fee of {} {} and a required fee of {} {} ({}) [{}]'.format(b['source'], log_quantity(db, b['give_quantity'], b['give_asset']), log_quantity(db, b['get_quantity'], b['get_asset']), b['expiration'], b['fee_provided'] / config.UNIT, config.LTC, b['fee_required'] / config.UNIT, config.LTC, b['tx_hash'], b['status'])),
+    ('insert', 'order_matches'): (logging.INFO, lambda db, b: 'Order Match: {} for {} ({}) [{}]'.format(log_quantity(db, b['forward_quantity'], b['forward_asset']), log_quantity(db, b['backward_quantity'], b['backward_asset']), b['id'], b['status'])),
+    ('insert', 'ltcpays'): (logging.INFO, lambda db, b: '{} Payment: {} paid {} to {} for order match {} ({}) [{}]'.format(config.LTC, b['source'], log_quantity(db, b['ltc_amount'], config.LTC), b['destination'], b['order_match_id'], b['tx_hash'], b['status'])),
+    ('insert', 'issuances'): (logging.INFO, log_issuance),
+    ('insert', 'broadcasts'): (logging.INFO, log_broadcast),
+    ('insert', 'bets'): (logging.INFO, log_bet),
+    ('insert', 'bet_matches'): (logging.INFO, log_bet_match),
+    ('insert', 'dividends'): (logging.INFO, lambda db, b: 'Dividend: {} paid {} per unit of {} ({}) [{}]'.format(b['source'], log_quantity(db, b['quantity_per_unit'], b['dividend_asset']), b['asset'], b['tx_hash'], b['status'])),
+    ('insert', 'burns'): (logging.INFO, lambda db, b: 'Burn: {} burned {} for {} ({}) [{}]'.format(b['source'], log_quantity(db, b['burned'], config.LTC), log_quantity(db, b['earned'], config.XPT), b['tx_hash'], b['status'])),
+    ('insert', 'cancels'): (logging.INFO, lambda db, b: 'Cancel: {} ({}) [{}]'.format(b['offer_hash'], b['tx_hash'], b['status'])),
+    ('insert', 'callbacks'): (logging.INFO, lambda db, b: 'Callback: {} called back {}% of {} ({}) [{}]'.format(b['source'], float(D(b['fraction']) * D(100)), b['asset'], b['tx_hash'], b['status'])),
+    ('insert', 'rps'): (logging.INFO, lambda db, b: 'RPS: {} opens game with {} possible moves and a wager of {}'.format(b['source'], b['possible_moves'], log_quantity(db, b['wager'], 'XPT'))),
+    ('insert', 'rps_matches'): (logging.INFO, lambda db, b: 'RPS Match: {} is playing a {}-moves game with {} with a wager of {} ({}) [{}]'.format(b['tx0_address'], b['possible_moves'], b['tx1_address'], log_quantity(db, b['wager'], 'XPT'), b['id'], b['status'])),
+    ('insert', 'rpsresolves'): (logging.INFO, log_rpsresolve),
+    ('insert', 'order_expirations'): (logging.INFO, lambda db, b: 'Expired order: {}'.format(b['order_hash'])),
+    ('insert', 'order_match_expirations'): (logging.INFO, lambda db, b: 'Expired Order Match awaiting payment: {}'.format(b['order_match_id'])),
+    ('insert', 'bet_expirations'): (logging.INFO, lambda db, b: 'Expired bet: {}'.format(b['bet_hash'])),
+    ('insert', 'bet_match_expirations'): (logging.INFO, lambda db, b: 'Expired Bet Match: {}'.format(b['bet_match_id'])),
+    ('insert', 'bet_match_resolutions'): (logging.INFO, log_bet_match_resolution),
+    ('insert', 'rps_expirations'): (logging.INFO, lambda db, b: 'Expired RPS: {}'.format(b['rps_hash'])),
+    ('insert', 'rps_match_expirations'): (logging.INFO, lambda db, b: 'Expired RPS Match: {}'.format(b['rps_match_id'])),
+}
+
+class LogMessage (object):
+    """Message of the log, formatted (and its quantities looked up) only if
+    a handler emits it.
+    """
+    def __init__(self, format_message, db, bindings):
+        self.format_message = format_message
+        self.db = db
+        self.bindings = bindings
 
-        elif category == 'rps_match_expirations':
-            logging.info('Expired RPS Match: {}'.format(bindings['rps_match_id']))
+    def __str__(self):
+        return self.format_message(self.db, self.bindings)
 
-    cursor.close()
+def log (db, command, category, bindings):
+    if (command, category) not in LOG_FORMATS:
+        return
+    level, format_message = LOG_FORMATS[(command, category)]
+    logging.log(level, LogMessage(format_message, db, bindings))
 
-def message (db, block_index, command, category, bindings, tx_hash=None):
+def next_message_index (db):
     cursor = db.cursor()
-
-    # Get last message index.
     messages = list(cursor.execute('''SELECT * FROM messages
                                       WHERE message_index = (SELECT MAX(message_index) from messages)'''))
+    cursor.close()
     if messages:
         assert len(messages) == 1
-        message_index = messages[0]['message_index'] + 1
+        return messages[0]['message_index'] + 1
     else:
-        message_index = 0
+        return 0
+
+class MessageBuffer (blockstate.BlockState):
+    """Messages of the block being parsed. They are numbered from a counter,
+    seeded from the database when the block starts, and inserted with one
+    `executemany` when it ends.
+    """
+    def __init__(self, db):
+        super().__init__()
+        self.next_index = next_message_index(db)
+        self.messages = []
+
+    def add(self, block_index, command, category, bindings_string, timestamp):
+        self.messages.append((self.next_index, block_index, command, category, bindings_string, timestamp))
+        self.next_index += 1
+
+    def flush(self, db):
+        if not self.messages:
+            return
+        cursor = db.cursor()
+        cursor.executemany('''INSERT INTO messages VALUES(?, ?, ?, ?, ?, ?)''', self.messages)
+        cursor.close()
+        self.messages = []
+
+def flush_messages (db):
+    message_buffer = blockstate.current(MESSAGE_BUFFER)
+    if message_buffer is not None:
+        message_buffer.flush(db)
+
+def message (db, block_index, command, category, bindings, tx_hash=None):
+    cursor = db.cursor()
 
     # Not to be misleading…
     if block_index == config.MEMPOOL_BLOCK_INDEX:
@@ -253,8 +259,12 @@ def message (db, block_index, command, category, bindings, tx_hash=None):
             pass
 
     bindings_string = json.dumps(collections.OrderedDict(sorted(bindings.items())))
-    cursor.execute('insert into messages values(:message_index, :block_index, :command, :category, :bindings, :timestamp)',
-                   (message_index, block_index, command, category, bindings_string, curr_time()))
+    message_buffer = blockstate.current(MESSAGE_BUFFER)
+    if message_buffer is not None:
+        message_buffer.add(block_index, command, category, bindings_string, curr_time())
+    else:
+        cursor.execute('insert into messages values(:message_index, :block_index, :command, :category, :bindings, :timestamp)',
+                       (next_message_index(db), block_index, command, category, bindings_string, curr_time()))
 
     # Log only real transactions.
     if block_index != config.MEMPOOL_BLOCK_INDEX:
@@ -270,33 +280,6 @@ def rowtracer(cursor, sql):
         dictionary[name] = sql[index]
     return dictionary
 
-def exectracer(cursor, sql, bindings):
-    # This means that all changes to database must use a very simple syntax.
-        # TODO: Need sanity checks here.
-    sql = sql.lower()
-
-    # Parse SQL.
-    array = sql.split('(')[0].split(' ')
-    if 'insert' in sql:
-        command, category = array[0], array[2]
-    elif 'update' in sql:
-        command, category = array[0], array[1]
-    else:
-        return True
-
-    db = cursor.getconnection()
-    dictionary = {'command': command, 'category': category, 'bindings': bindings}
-
-    # Skip blocks, transactions.
-    if 'blocks' in sql or 'transactions' in sql: return True
-
-    # Record alteration in database.
-    if category not in ('balances', 'messages', 'mempool'):
-        if not (command in ('update') and category in ('orders', 'bets', 'rps', 'order_matches', 'bet_matches', 'rps_matches')):    # List message manually.
-            message(db, bindings['block_index'], command, category, bindings)
-
-    return True
-
 def connect_to_db(flags=None):
     """Connects to the SQLite database, returning a db Connection object"""
     logging.debug('Status: Creating connection to `{}`.'.format(config.DATABASE.split('/').pop()))
@@ -348,7 +331,6 @@ def connect_to_db(flags=None):
     cursor.close()
 
     db.setrowtrace(rowtracer)
-    db.setexectrace(exectracer)
 
     return db
 
@@ -424,6 +406,15 @@ def last_block (db):
     cursor.close()
     return last_block
 
+def last_broadcast (db, source):
+    """Return the last valid broadcast of the feed `source`, if any."""
+    cursor = db.cursor()
+    broadcasts = list(cursor.execute('''SELECT * FROM broadcasts WHERE (status = ? AND source = ?) ORDER BY tx_index DESC LIMIT 1''', ('valid', source)))
+    cursor.close()
+    if broadcasts:
+        return broadcasts[0]
+    return None
+
 def last_message (db):
     cursor = db.cursor()
     messages = list(cursor.execute('''SELECT * FROM messages WHERE message_index = (SELECT MAX(message_index) from messages)'''))
@@ -485,20 +476,100 @@ def asset_name (asset_id):
     return asset_name
 
 
-def debit (db, block_index, address, asset, quantity, action=None, event=None):
-    debit_cursor = db.cursor()
-    assert asset != config.LTC # Never LTC.
-    assert type(quantity) == int
-    assert quantity >= 0
+class BalanceCache (blockstate.BlockState):
+    """Write‐back cache of the `balances` table, for the duration of a block.
 
-    if asset == config.LTC:
-        raise exceptions.BalanceError('Cannot debit litecoins from a {} address!'.format(config.XPT_NAME))
+    Balances are read from the database at most once, changed in memory, and
+    written back with one `executemany` for the new rows and one for the
+    changed ones. Rows are inserted in the order in which they were created,
+    so that they get the same rowids as without the cache.
+    """
+    def __init__(self):
+        super().__init__()
+        self.balances = {}                      # (address, asset) -> quantity, or `None` if there is no row.
+        self.new = collections.OrderedDict()    # Keys of the rows to insert, in order.
+        self.changed = set()
+
+    def get(self, db, address, asset):
+        key = (address, asset)
+        if key not in self.balances:
+            cursor = db.cursor()
+            balances = list(cursor.execute('''SELECT * FROM balances WHERE (address = ? AND asset = ?)''', key))
+            cursor.close()
+            assert len(balances) <= 1
+            self.balances[key] = balances[0]['quantity'] if balances else None
+        return self.balances[key]
+
+    def load(self, db, asset, addresses):
+        """Read the balances in `asset` of those of `addresses` that haven’t
+        been read, with a query for (up to) 500 of them.
+        """
+        addresses = sorted(set([address for address in addresses if (address, asset) not in self.balances]))
+        cursor = db.cursor()
+        for start in range(0, len(addresses), 500):     # (SQLite takes up to 999 parameters.)
+            chunk = addresses[start:start + 500]
+            for address in chunk:
+                self.balances[(address, asset)] = None
+            for balance in cursor.execute('''SELECT address, quantity FROM balances WHERE (asset = ? AND address IN ({}))'''.format(', '.join(['?'] * len(chunk))), [asset] + chunk):
+                key = (balance['address'], asset)
+                assert self.balances[key] is None
+                self.balances[key] = balance['quantity']
+        cursor.close()
+
+    def set(self, address, asset, quantity):
+        key = (address, asset)
+        if self.balances[key] is None:
+            self.new[key] = True
+        elif key not in self.new:
+            self.changed.add(key)
+        self.balances[key] = quantity
+
+    def flush(self, db):
+        if not self.new and not self.changed:
+            return
+        cursor = db.cursor()
+        cursor.executemany('''INSERT INTO balances VALUES(?, ?, ?)''',
+                           [(address, asset, self.balances[(address, asset)]) for address, asset in self.new])
+        cursor.executemany('''UPDATE balances SET quantity = ? WHERE (address = ? AND asset = ?)''',
+                           [(self.balances[(address, asset)], address, asset) for address, asset in sorted(self.changed)])
+        cursor.close()
+        self.new.clear()
+        self.changed.clear()
+
+def get_balance (db, address, asset):
+    """Return the balance of `address` in `asset`, or `None` if it has none
+    (not even zero).
+    """
+    balance_cache = blockstate.current(BALANCE_CACHE)
+    if balance_cache is not None:
+        return balance_cache.get(db, address, asset)
+    cursor = db.cursor()
+    balances = list(cursor.execute('''SELECT * FROM balances WHERE (address = ? AND asset = ?)''', (address, asset)))
+    cursor.close()
+    return balances[0]['quantity'] if balances else None
 
-    debit_cursor.execute('''SELECT * FROM balances \
-                            WHERE (address = ? AND asset = ?)''', (address, asset))
-    balances = debit_cursor.fetchall()
-    if not len(balances) == 1: old_balance = 0
-    else: old_balance = balances[0]['quantity']
+def load_balances (db, asset, addresses):
+    """Read the balances of `addresses` in `asset` at once, while a block is
+    parsed, rather than one by one as they are credited or debited.
+    """
+    balance_cache = blockstate.current(BALANCE_CACHE)
+    if balance_cache is not None:
+        balance_cache.load(db, asset, addresses)
+
+def flush_balances (db):
+    """Write cached balances to the database, before reading it directly."""
+    balance_cache = blockstate.current(BALANCE_CACHE)
+    if balance_cache is not None:
+        balance_cache.flush(db)
+
+def debit_balance (db, address, asset, quantity):
+    """Take `quantity` from the balance of `address` in `asset`, without
+    recording the debit.
+    """
+    debit_cursor = db.cursor()
+    old_balance = get_balance(db, address, asset)
+    has_balance = old_balance is not None
+    if not has_balance: old_balance = 0
 
     if old_balance < quantity:
         raise exceptions.BalanceError('Insufficient funds.')
@@ -507,13 +578,30 @@ def debit (db, block_index, address, asset, quantity, action=None, event=None):
     balance = min(balance, config.MAX_INT)
     assert balance >= 0
 
-    bindings = {
-        'quantity': balance,
-        'address': address,
-        'asset': asset
-    }
-    sql='update balances set quantity = :quantity where (address = :address and asset = :asset)'
-    debit_cursor.execute(sql, bindings)
+    balance_cache = blockstate.current(BALANCE_CACHE)
+    if balance_cache is not None:
+        if has_balance:
+            balance_cache.set(address, asset, balance)
+    else:
+        bindings = {
+            'quantity': balance,
+            'address': address,
+            'asset': asset
+        }
+        sql='update balances set quantity = :quantity where (address = :address and asset = :asset)'
+        debit_cursor.execute(sql, bindings)
+    debit_cursor.close()
+
+def debit (db, block_index, address, asset, quantity, action=None, event=None):
+    debit_cursor = db.cursor()
+    assert asset != config.LTC # Never LTC.
+    assert type(quantity) == int
+    assert quantity >= 0
+
+    if asset == config.LTC:
+        raise exceptions.BalanceError('Cannot debit litecoins from a {} address!'.format(config.XPT_NAME))
+
+    debit_balance(db, address, asset, quantity)
 
     # Record debit.
     bindings = {
@@ -527,37 +615,37 @@ def debit (db, block_index, address, asset, quantity, action=None, event=None):
     sql='insert into debits values(:block_index, :address, :asset, :quantity, :action, :event)'
     debit_cursor.execute(sql, bindings)
     debit_cursor.close()
+    conservation.debit(asset, quantity)
+    message(db, block_index, 'insert', 'debits', bindings)
 
     BLOCK_LEDGER.append('{}{}{}{}'.format(block_index, address, asset, quantity))
 
-def credit (db, block_index, address, asset, quantity, action=None, event=None):
+def credit_balance (db, address, asset, quantity):
+    """Add `quantity` to the balance of `address` in `asset`, without
+    recording the credit.
+    """
     credit_cursor = db.cursor()
-    assert asset != config.LTC # Never LTC.
-    assert type(quantity) == int
-    assert quantity >= 0
-
-    credit_cursor.execute('''SELECT * FROM balances \
-                             WHERE (address = ? AND asset = ?)''', (address, asset))
-    balances = credit_cursor.fetchall()
-    if len(balances) == 0:
-        assert balances == []
+    old_balance = get_balance(db, address, asset)
+    if old_balance is None:
+        balance = quantity
+    else:
+        assert type(old_balance) == int
+        balance = round(old_balance + quantity)
+        balance = min(balance, config.MAX_INT)
 
+    balance_cache = blockstate.current(BALANCE_CACHE)
+    if balance_cache is not None:
+        balance_cache.set(address, asset, balance)
+    elif old_balance is None:
         #update balances table with new balance
         bindings = {
             'address': address,
             'asset': asset,
-            'quantity': quantity,
+            'quantity': balance,
         }
         sql='insert into balances values(:address, :asset, :quantity)'
         credit_cursor.execute(sql, bindings)
-    elif len(balances) > 1:
-        assert False
     else:
-        old_balance = balances[0]['quantity']
-        assert type(old_balance) == int
-        balance = round(old_balance + quantity)
-        balance = min(balance, config.MAX_INT)
-
         bindings = {
             'quantity': balance,
             'address': address,
@@ -565,6 +653,15 @@ def credit (db, block_index, address, asset, quantity, action=None, event=None):
         }
         sql='update balances set quantity = :quantity where (address = :address and asset = :asset)'
         credit_cursor.execute(sql, bindings)
+    credit_cursor.close()
+
+def credit (db, block_index, address, asset, quantity, action=None, event=None):
+    credit_cursor = db.cursor()
+    assert asset != config.LTC # Never LTC.
+    assert type(quantity) == int
+    assert quantity >= 0
+
+    credit_balance(db, address, asset, quantity)
 
     # Record credit.
     bindings = {
@@ -578,6 +675,8 @@ def credit (db, block_index, address, asset, quantity, action=None, event=None):
     sql='insert into credits values(:block_index, :address, :asset, :quantity, :action, :event)'
     credit_cursor.execute(sql, bindings)
     credit_cursor.close()
+    conservation.credit(asset, quantity)
+    message(db, block_index, 'insert', 'credits', bindings)
 
     BLOCK_LEDGER.append('{}{}{}{}'.format(block_index, address, asset, quantity))
 
@@ -610,13 +709,9 @@ def devise (db, quantity, asset, dest, divisible=None):
         if asset in (config.LTC, config.XPT):
             divisible = True
         else:
-            cursor = db.cursor()
-            cursor.execute('''SELECT * FROM issuances \
-                              WHERE (status = ? AND asset = ?)''', ('valid', asset))
-            issuances = cursor.fetchall()
-            cursor.close()
-            if not issuances: raise exceptions.AssetError('No such asset: {}'.format(asset))
-            divisible = issuances[0]['divisible']
+            record = assets.get(db, asset)
+            if not record: raise exceptions.AssetError('No such asset: {}'.format(asset))
+            divisible = record['divisible']
 
     if divisible:
         if dest == 'output':
@@ -640,6 +735,7 @@ def devise (db, quantity, asset, dest, divisible=None):
         return round(quantity)
 
 def holders(db, asset):
+    flush_balances(db)
     holders = []
     cursor = db.cursor()
     # Balances
@@ -647,81 +743,25 @@ def holders(db, asset):
                       WHERE asset = ?''', (asset,))
     for balance in list(cursor):
         holders.append({'address': balance['address'], 'address_quantity': balance['quantity'], 'escrow': None})
-    # Funds escrowed in orders. (Protocol change.)
-    cursor.execute('''SELECT * FROM orders \
-                      WHERE give_asset = ? AND status = ?''', (asset, 'open'))
-    for order in list(cursor):
-        holders.append({'address': order['source'], 'address_quantity': order['give_remaining'], 'escrow': order['tx_hash']})
-    # Funds escrowed in pending order matches. (Protocol change.)
-    cursor.execute('''SELECT * FROM order_matches \
-                      WHERE (forward_asset = ? AND status = ?)''', (asset, 'pending'))
-    for order_match in list(cursor):
-        holders.append({'address': order_match['tx0_address'], 'address_quantity': order_match['forward_quantity'], 'escrow': order_match['id']})
-    cursor.execute('''SELECT * FROM order_matches \
-                      WHERE (backward_asset = ? AND status = ?)''', (asset, 'pending'))
-    for order_match in list(cursor):
-        holders.append({'address': order_match['tx1_address'], 'address_quantity': order_match['backward_quantity'], 'escrow': order_match['id']})
-
-    # Bets and RPS (and bet/rps matches) only escrow XPT.
-    if asset == config.XPT:
-        cursor.execute('''SELECT * FROM bets \
-                          WHERE status = ?''', ('open',))
-        for bet in list(cursor):
-            holders.append({'address': bet['source'], 'address_quantity': bet['wager_remaining'], 'escrow': bet['tx_hash']})
-        cursor.execute('''SELECT * FROM bet_matches \
-                          WHERE status = ?''', ('pending',))
-        for bet_match in list(cursor):
-            holders.append({'address': bet_match['tx0_address'], 'address_quantity': bet_match['forward_quantity'], 'escrow': bet_match['id']})
-            holders.append({'address': bet_match['tx1_address'], 'address_quantity': bet_match['backward_quantity'], 'escrow': bet_match['id']})
-
-        cursor.execute('''SELECT * FROM rps \
-                          WHERE status = ?''', ('open',))
-        for rps in list(cursor):
-            holders.append({'address': rps['source'], 'address_quantity': rps['wager'], 'escrow': rps['tx_hash']})
-        cursor.execute('''SELECT * FROM rps_matches \
-                          WHERE status IN (?, ?, ?)''', ('pending', 'pending and resolved', 'resolved and pending'))
-        for rps_match in list(cursor):
-            holders.append({'address': rps_match['tx0_address'], 'address_quantity': rps_match['wager'], 'escrow': rps_match['id']})
-            holders.append({'address': rps_match['tx1_address'], 'address_quantity': rps_match['wager'], 'escrow': rps_match['id']})
+    # Funds in escrow (in orders, bets, RPS and their matches).
+    holders += escrow.holders(db, asset)
 
     cursor.close()
     return holders
 
 def xpt_supply (db):
     cursor = db.cursor()
-
-    # Add burns.
-    cursor.execute('''SELECT * FROM burns \
-                      WHERE status = ?''', ('valid',))
-    burn_total = sum([burn['earned'] for burn in cursor.fetchall()])
-
-    # Subtract issuance fees.
-    cursor.execute('''SELECT * FROM issuances\
-                      WHERE status = ?''', ('valid',))
-    issuance_fee_total = sum([issuance['fee_paid'] for issuance in cursor.fetchall()])
-
-    # Subtract dividend fees.
-    cursor.execute('''SELECT * FROM dividends\
-                      WHERE status = ?''', ('valid',))
-    dividend_fee_total = sum([dividend['fee_paid'] for dividend in cursor.fetchall()])
-
+    supplies = list(cursor.execute('''SELECT * FROM supplies WHERE asset = ?''', (config.XPT,)))
     cursor.close()
-    return burn_total - issuance_fee_total - dividend_fee_total
+    if not supplies:
+        return 0
+    return supplies[0]['burned'] - supplies[0]['fees_paid']
 
 def supplies (db):
-    cursor = db.cursor()
     supplies = {config.XPT: xpt_supply(db)}
-    cursor.execute('''SELECT * from issuances \
-                      WHERE status = ?''', ('valid',))
-    for issuance in list(cursor):
-        asset = issuance['asset']
-        quantity = issuance['quantity']
-        if asset in supplies.keys():
-            supplies[asset] += quantity
-        else:
-            supplies[asset] = quantity
-
-    cursor.close()
+    for asset, (issued, burned, fees_paid) in supply.get(db):
+        if asset != config.XPT:
+            supplies[asset] = issued
     return supplies
 
 def get_url(url, abort_on_error=False, is_json=True, fetch_timeout=5):
@@ -21,7 +21,7 @@ import appdirs
 from prettytable import PrettyTable
 from lockfile import LockFile
 
-from lib import config, api, util, exceptions, litecoin, blocks, blockchain
+from lib import config, api, util, exceptions, litecoin, blocks, blockchain, schema
 if os.name == 'nt':
     from lib import util_windows
 
@@ -226,7 +226,13 @@ def set_options (data_dir=None, backend_rpc_connect=None,
                  rpc_password=None, rpc_allow_cors=None, log_file=None,
                  config_file=None, database_file=None, testnet=False,
                  testcoin=False, carefulness=0, force=False,
-                 broadcast_tx_mainnet=None):
+                 broadcast_tx_mainnet=None, prefetch_depth=None,
+                 backend_rpc_batch_size=None, backend_raw_blocks=False,
+                 prevout_cache_size=None, check_prefilter=False,
+                 decode_workers=None, undolog_depth=None,
+                 snapshot_interval=None, snapshot_retention=None,
+                 catch_up_blocks=None, catch_up_seconds=None,
+                 audit_interval=None):
 
     if force:
         config.FORCE = force
@@ -274,6 +280,86 @@ def set_options (data_dir=None, backend_rpc_connect=None,
     else:
         config.CAREFULNESS = 0
 
+    # prefetch depth (blocks fetched and decoded ahead of the one being parsed)
+    if prefetch_depth is not None:
+        config.PREFETCH_DEPTH = prefetch_depth
+    elif has_config and 'prefetch-depth' in configfile['Default']:
+        config.PREFETCH_DEPTH = configfile['Default'].getint('prefetch-depth')
+    else:
+        config.PREFETCH_DEPTH = config.DEFAULT_PREFETCH_DEPTH
+
+    # undo journal depth (blocks that can be rolled back without a full reparse; 0 to disable)
+    if undolog_depth is not None:
+        config.UNDOLOG_DEPTH = undolog_depth
+    elif has_config and 'undolog-depth' in configfile['Default']:
+        config.UNDOLOG_DEPTH = configfile['Default'].getint('undolog-depth')
+    else:
+        config.UNDOLOG_DEPTH = config.DEFAULT_UNDOLOG_DEPTH
+
+    # snapshot interval (blocks between snapshots of the parsed state; 0 to disable)
+    if snapshot_interval is not None:
+        config.SNAPSHOT_INTERVAL = snapshot_interval
+    elif has_config and 'snapshot-interval' in configfile['Default']:
+        config.SNAPSHOT_INTERVAL = configfile['Default'].getint('snapshot-interval')
+    else:
+        config.SNAPSHOT_INTERVAL = config.DEFAULT_SNAPSHOT_INTERVAL
+
+    # snapshot retention (snapshots kept on disk)
+    if snapshot_retention is not None:
+        config.SNAPSHOT_RETENTION = snapshot_retention
+    elif has_config and 'snapshot-retention' in configfile['Default']:
+        config.SNAPSHOT_RETENTION = configfile['Default'].getint('snapshot-retention')
+    else:
+        config.SNAPSHOT_RETENTION = config.DEFAULT_SNAPSHOT_RETENTION
+
+    # catch-up blocks (blocks per commit while far behind the backend; 0 to commit every block)
+    if catch_up_blocks is not None:
+        config.CATCH_UP_BLOCKS = catch_up_blocks
+    elif has_config and 'catch-up-blocks' in configfile['Default']:
+        config.CATCH_UP_BLOCKS = configfile['Default'].getint('catch-up-blocks')
+    else:
+        config.CATCH_UP_BLOCKS = config.DEFAULT_CATCH_UP_BLOCKS
+
+    # catch-up seconds (seconds between commits while far behind the backend)
+    if catch_up_seconds is not None:
+        config.CATCH_UP_SECONDS = catch_up_seconds
+    elif has_config and 'catch-up-seconds' in configfile['Default']:
+        config.CATCH_UP_SECONDS = configfile['Default'].getint('catch-up-seconds')
+    else:
+        config.CATCH_UP_SECONDS = config.DEFAULT_CATCH_UP_SECONDS
+
+    # audit interval (blocks between full checks for conservation of assets; 0 to disable)
+    if audit_interval is not None:
+        config.AUDIT_INTERVAL = audit_interval
+    elif has_config and 'audit-interval' in configfile['Default']:
+        config.AUDIT_INTERVAL = configfile['Default'].getint('audit-interval')
+    else:
+        config.AUDIT_INTERVAL = config.DEFAULT_AUDIT_INTERVAL
+
+    # decode workers (processes decoding the transactions of upcoming blocks; 0 to decode inline)
+    if decode_workers is not None:
+        config.DECODE_WORKERS = decode_workers
+    elif has_config and 'decode-workers' in configfile['Default']:
+        config.DECODE_WORKERS = configfile['Default'].getint('decode-workers')
+    else:
+        config.DECODE_WORKERS = config.DEFAULT_DECODE_WORKERS
+
+    # prevout cache size (transaction outputs kept in memory; 0 to disable)
+    if prevout_cache_size is not None:
+        config.PREVOUT_CACHE_SIZE = prevout_cache_size
+    elif has_config and 'prevout-cache-size' in configfile['Default']:
+        config.PREVOUT_CACHE_SIZE = configfile['Default'].getint('prevout-cache-size')
+    else:
+        config.PREVOUT_CACHE_SIZE = config.DEFAULT_PREVOUT_CACHE_SIZE
+
+    # check prefilter (decode everything it rejects, and fail if any of it is valid)
+    if check_prefilter:
+        config.CHECK_PREFILTER = check_prefilter
+    elif has_config and 'check-prefilter' in configfile['Default']:
+        config.CHECK_PREFILTER = configfile['Default'].getboolean('check-prefilter')
+    else:
+        config.CHECK_PREFILTER = False
+
     ##############
     # THINGS WE CONNECT TO
 
@@ -326,6 +412,22 @@ def set_options (data_dir=None, backend_rpc_connect=None,
     else:
         raise exceptions.ConfigurationError('backend RPC password not set. (Use configuration file or --backend-rpc-password=PASSWORD)')
 
+    # Backend Core RPC batch size
+    if backend_rpc_batch_size:
+        config.RPC_BATCH_SIZE = backend_rpc_batch_size
+    elif has_config and 'backend-rpc-batch-size' in configfile['Default'] and configfile['Default']['backend-rpc-batch-size']:
+        config.RPC_BATCH_SIZE = configfile['Default'].getint('backend-rpc-batch-size')
+    else:
+        config.RPC_BATCH_SIZE = config.DEFAULT_RPC_BATCH_SIZE
+
+    # Backend Core raw blocks (`getblock <block_hash> false`, parsed locally)
+    if backend_raw_blocks:
+        config.RAW_BLOCKS = backend_raw_blocks
+    elif has_config and 'backend-raw-blocks' in configfile['Default'] and configfile['Default']['backend-raw-blocks']:
+        config.RAW_BLOCKS = configfile['Default'].getboolean('backend-raw-blocks')
+    else:
+        config.RAW_BLOCKS = False
+
     # Backend Core RPC SSL
     if backend_rpc_ssl:
         config.BACKEND_RPC_SSL= backend_rpc_ssl
@@ -461,6 +563,12 @@ def set_options (data_dir=None, backend_rpc_connect=None,
         if config.TESTCOIN:
             string += '.testcoin'
         config.DATABASE = os.path.join(config.DATA_DIR, string + '.db')
+    if config.DATABASE == ':memory:':
+        config.PREVOUT_DATABASE = ':memory:'
+        config.SNAPSHOT_DIR = None
+    else:
+        config.PREVOUT_DATABASE = os.path.splitext(config.DATABASE)[0] + '.prevouts.db'
+        config.SNAPSHOT_DIR = os.path.splitext(config.DATABASE)[0] + '.snapshots'
 
     # (more) Testnet
     if config.TESTNET:
@@ -533,7 +641,17 @@ if __name__ == '__main__':
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', help='sets log level to DEBUG instead of WARNING')
     parser.add_argument('--testnet', action='store_true', help='use {} testnet addresses and block numbers'.format(config.LTC_NAME))
     parser.add_argument('--testcoin', action='store_true', help='use the test {} network on every blockchain'.format(config.XPT_NAME))
-    parser.add_argument('--carefulness', type=int, default=0, help='check conservation of assets after every CAREFULNESS transactions (potentially slow)')
+    parser.add_argument('--carefulness', type=int, default=0, help='check conservation of assets after every CAREFULNESS transactions, and every block')
+    parser.add_argument('--audit-interval', type=int, help='check conservation of all assets, from scratch, every AUDIT_INTERVAL blocks (slow; 0 to disable)')
+    parser.add_argument('--prefetch-depth', type=int, help='the number of blocks to fetch and decode ahead of the one being parsed (0 to disable)')
+    parser.add_argument('--undolog-depth', type=int, help='the number of blocks that can be rolled back without reparsing everything (0 to disable)')
+    parser.add_argument('--snapshot-interval', type=int, help='the number of blocks between snapshots of the parsed state, from which to roll back (0 to disable)')
+    parser.add_argument('--snapshot-retention', type=int, help='the number of snapshots of the parsed state to keep')
+    parser.add_argument('--catch-up-blocks', type=int, help='the number of blocks to parse per commit while far behind the backend (0 to commit every block)')
+    parser.add_argument('--catch-up-seconds', type=int, help='the maximum number of seconds between commits while far behind the backend')
+    parser.add_argument('--decode-workers', type=int, help='the number of processes decoding the transactions of upcoming blocks (0 to decode inline)')
+    parser.add_argument('--prevout-cache-size', type=int, help='the number of transaction outputs to keep in memory for resolving sources and fees (0 to disable)')
+    parser.add_argument('--check-prefilter', action='store_true', help='fully decode every transaction that the prefilter rejects, and stop if any of them is valid (slow)')
     parser.add_argument('--unconfirmed', action='store_true', help='allow the spending of unconfirmed transaction outputs')
     parser.add_argument('--encoding', default='auto', type=str, help='data encoding method')
     parser.add_argument('--fee-per-kb', type=D, default=D(config.DEFAULT_FEE_PER_KB / config.UNIT), help='fee per kilobyte, in {}'.format(config.LTC))
@@ -551,6 +669,8 @@ if __name__ == '__main__':
     parser.add_argument('--backend-rpc-port', type=int, help='the backend JSON-RPC port to connect to')
     parser.add_argument('--backend-rpc-user', help='the username used to communicate with backend over JSON-RPC')
     parser.add_argument('--backend-rpc-password', help='the password used to communicate with backend over JSON-RPC')
+    parser.add_argument('--backend-rpc-batch-size', type=int, help='the maximum number of calls in one JSON-RPC batch request to the backend')
+    parser.add_argument('--backend-raw-blocks', action='store_true', help='fetch whole blocks as raw hex and decode them locally (default: false)')
     parser.add_argument('--backend-rpc-ssl', action='store_true', help='use SSL to connect to backend (default: false)')
     parser.add_argument('--backend-rpc-ssl-verify', action='store_true', help='verify SSL certificate of backend; disallow use of self‐signed certificates (default: false)')
 
@@ -683,6 +803,9 @@ if __name__ == '__main__':
     parser_rollback.add_argument('block_index', type=int, help='the index of the last known good block')
     parser_rollback.add_argument('--force', action='store_true', help='skip backend check, version check, lockfile check')
 
+    parser_schema = subparsers.add_parser('schema', help='compare the indexes in the database with those the code expects')
+    parser_schema.add_argument('--migrate', action='store_true', help='build missing indexes and replace misnamed ones')
+
     parser_market = subparsers.add_parser('market', help='fill the screen with an always up-to-date summary of the {} market'.format(config.XPT_NAME) )
     parser_market.add_argument('--give-asset', help='only show orders offering to sell GIVE_ASSET')
     parser_market.add_argument('--get-asset', help='only show orders offering to buy GET_ASSET')
@@ -705,6 +828,8 @@ if __name__ == '__main__':
                 backend_rpc_port=args.backend_rpc_port,
                 backend_rpc_user=args.backend_rpc_user,
                 backend_rpc_password=args.backend_rpc_password,
+                backend_rpc_batch_size=args.backend_rpc_batch_size,
+                backend_raw_blocks=args.backend_raw_blocks,
                 backend_rpc_ssl=args.backend_rpc_ssl,
                 backend_rpc_ssl_verify=args.backend_rpc_ssl_verify,
                 blockchain_service_name=args.blockchain_service_name,
@@ -714,7 +839,16 @@ if __name__ == '__main__':
                 log_file=args.log_file, config_file=args.config_file,
                 database_file=args.database_file, testnet=args.testnet,
                 testcoin=args.testcoin, carefulness=args.carefulness,
-                force=args.force)
+                force=args.force, prefetch_depth=args.prefetch_depth,
+                prevout_cache_size=args.prevout_cache_size,
+                check_prefilter=args.check_prefilter,
+                decode_workers=args.decode_workers,
+                undolog_depth=args.undolog_depth,
+                snapshot_interval=args.snapshot_interval,
+                snapshot_retention=args.snapshot_retention,
+                catch_up_blocks=args.catch_up_blocks,
+                catch_up_seconds=args.catch_up_seconds,
+                audit_interval=args.audit_interval)
 
     # Logging (to file and console).
     logger = logging.getLogger() #get root logger
@@ -1102,6 +1236,18 @@ if __name__ == '__main__':
         with lock:
             blocks.reparse(db, block_index=args.block_index)
 
+    elif args.action == 'schema':
+        if args.migrate:
+            logging.info('Status: Acquiring process lock.')
+            with lock:
+                with db:
+                    schema.migrate(db)
+        table = PrettyTable(['Table', 'Index', 'Columns', 'Status'])
+        for entry in schema.report(db):
+            table.add_row([entry['table'], entry['index'], ', '.join(entry['columns']), entry['status']])
+        print('Schema version:', schema.get_version(db), '(expected: {})'.format(schema.SCHEMA_VERSION))
+        print(table)
+
     elif args.action == 'server':
 
         logging.info('Status: Acquiring process lock.')
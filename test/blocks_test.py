@@ -0,0 +1,87 @@
+#! /usr/bin/python3
+
+"""
+Parsing blocks (`blocks.parse_block()`).
+"""
+
+import os, sys, struct
+import pytest
+
+CURR_DIR = os.path.dirname(os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__))))
+sys.path.append(os.path.normpath(os.path.join(CURR_DIR, '..')))
+
+from lib import (config, util, exceptions, blocks, assets, orderbook, pairs, issuance, order)
+import paytokensd
+
+import util_test, util_benchmark
+
+ASSET = 'BOOKS'
+
+CHECKPOINTS_TESTNET = None
+
+def setup_module():
+    global CHECKPOINTS_TESTNET
+    paytokensd.set_options(database_file=':memory:', testnet=True, **util_test.COUNTERPARTYD_OPTIONS)
+    CHECKPOINTS_TESTNET = config.CHECKPOINTS_TESTNET
+    config.CHECKPOINTS_TESTNET = {}
+
+def teardown_module(function):
+    config.CHECKPOINTS_TESTNET = CHECKPOINTS_TESTNET
+
+def test_consensus_error():
+    """A block that fails its consensus checks leaves the registry of assets
+    and the books of orders as they were.
+    """
+    issuer = 'issuer'
+    db = util_benchmark.create_database([
+        [(issuer, config.UNSPENDABLE, 1000, b'')],
+        [(issuer, None, None, struct.pack(config.TXTYPE_FORMAT, issuance.ID) + struct.pack(issuance.FORMAT_2 + '5p', util.asset_id(ASSET), 1000 * config.UNIT, True, False, 0, 0.0, b'book')),
+         (issuer, None, None, struct.pack(config.TXTYPE_FORMAT, order.ID) + struct.pack(order.FORMAT, util.asset_id(config.XPT), config.UNIT, util.asset_id(ASSET), config.UNIT, 1000, 0))],
+    ])
+    blocks.initialise(db)
+    cursor = db.cursor()
+    block, last_block = list(cursor.execute('''SELECT * FROM blocks ORDER BY block_index'''))
+    with db:
+        blocks.parse_block(db, block['block_index'], block['block_time'])
+    pair = (config.XPT, ASSET)
+    assert assets.get(db, ASSET) is None
+    orderbook.BOOKS[pair] = []
+
+    with pytest.raises(exceptions.ConsensusError):
+        with db:
+            blocks.parse_block(db, last_block['block_index'], last_block['block_time'], current_ledger_hash='wrong')
+    assert assets.get(db, ASSET) is None
+    assert orderbook.BOOKS[pair] == []
+
+    with db:
+        blocks.parse_block(db, last_block['block_index'], last_block['block_time'])
+    assert assets.get(db, ASSET)['supply'] == 1000 * config.UNIT
+    assert len(orderbook.BOOKS[pair]) == 1
+    cursor.close()
+    db.close()
+
+def test_mempool_match():
+    """A match outside of a block (as in the mempool) leaves the pairs that
+    have been read.
+    """
+    pairs.PAIRS['order_matches'] = set([('tx0', 'tx1')])
+    pairs.add('order_matches', {'tx0_hash': 'tx2', 'tx1_hash': 'tx3'})
+    assert pairs.PAIRS['order_matches'] == set([('tx0', 'tx1')])
+    pairs.clear()
+
+def test_batch_rolled_back():
+    """A batch of blocks that SQLite has rolled back is not taken as
+    committed.
+    """
+    db = util_benchmark.create_database()
+    batch = blocks.CatchUpBatch(db)
+    batch.begin()
+    cursor = db.cursor()
+    cursor.execute('''ROLLBACK''')
+    with pytest.raises(exceptions.DatabaseError):
+        batch.commit()
+    assert not batch.is_open()
+    cursor.close()
+    db.close()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,102 @@
+#! /usr/bin/python3
+
+"""
+Benchmark of the payment of a dividend, and of a callback, to the holders
+of a widely held asset: the asset is sent to many addresses, over a few
+blocks, then pays a dividend in XPT and is half called back; reparsed with
+the credits and debits written in bulk (`ledger.Batch`), and one by one,
+with `util.credit()` and `util.debit()`, as `dividend.parse()` and
+`callback.parse()` used to do. Both must leave the same credits, debits,
+balances, messages and ledger hashes.
+
+    python3 dividend_benchmark.py [blocks] [holders per block]
+"""
+
+import sys, logging, struct, random
+
+import util_benchmark
+from lib import (config, util, ledger, send, issuance, dividend, callback)
+
+ASSET = 'HOLDERS'
+
+class RowBatch (object):
+    """A `ledger.Batch` that writes everything at once, one by one."""
+    def __init__(self, db):
+        self.db = db
+
+    def credit(self, block_index, address, asset, quantity, action=None, event=None):
+        util.credit(self.db, block_index, address, asset, quantity, action=action, event=event)
+
+    def debit(self, block_index, address, asset, quantity, action=None, event=None):
+        util.debit(self.db, block_index, address, asset, quantity, action=action, event=event)
+
+    def credits(self, block_index, asset, postings, action=None, event=None):
+        for address, quantity in postings:
+            self.credit(block_index, address, asset, quantity, action=action, event=event)
+
+    def debits(self, block_index, asset, postings, action=None, event=None):
+        for address, quantity in postings:
+            self.debit(block_index, address, asset, quantity, action=action, event=event)
+
+    def insert(self, table, row, fields=None):
+        ledger.insert(self.db, table, row, fields=fields)
+
+    def update(self, table, key, changes, block_index=None):
+        ledger.update(self.db, table, key, changes, block_index)
+
+    def flush(self):
+        pass
+
+def setup (block_count, holder_count):
+    random.seed(0)
+    issuer = 'issuer'
+
+    transactions = [[(issuer, config.UNSPENDABLE, 1000, b'')]]
+    data = struct.pack(config.TXTYPE_FORMAT, issuance.ID) + struct.pack(issuance.FORMAT_2 + '8p', util.asset_id(ASSET), 10 ** 8 * config.UNIT, True, True, 0, 1.0, b'holders')
+    transactions.append([(issuer, None, None, data)])
+    for i in range(block_count):
+        block_transactions = []
+        for j in range(holder_count):
+            data = struct.pack(config.TXTYPE_FORMAT, send.ID) + struct.pack(send.FORMAT, util.asset_id(ASSET), random.randint(1, 1000) * config.UNIT)
+            block_transactions.append((issuer, 'holder{}'.format(i * holder_count + j), None, data))
+        transactions.append(block_transactions)
+    data = struct.pack(config.TXTYPE_FORMAT, dividend.ID) + struct.pack(dividend.FORMAT_2, 1000000, util.asset_id(ASSET), util.asset_id(config.XPT))
+    transactions.append([(issuer, None, None, data)])
+    data = struct.pack(config.TXTYPE_FORMAT, callback.ID) + struct.pack(callback.FORMAT, 0.5, util.asset_id(ASSET))
+    transactions.append([(issuer, None, None, data)])
+    return util_benchmark.create_database(transactions)
+
+def digest (db):
+    """Return a digest of the credits, the debits, the balances, the messages
+    and the ledger hashes, and the statuses of the dividend and the callback.
+    """
+    cursor = db.cursor()
+    statuses = [(table, row['status']) for table in ('dividends', 'callbacks') for row in cursor.execute('''SELECT status FROM {}'''.format(table))]
+    cursor.close()
+    return util_benchmark.digest(db, ('credits', 'debits', 'balances', 'messages', 'blocks')), statuses
+
+def run (block_count, holder_count, repetitions=3):
+    db = setup(block_count, holder_count)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Best of a few runs, alternating, of the blocks of the dividend and the
+    # callback.
+    variants = (('row', {(ledger, 'Batch'): RowBatch, (util, 'load_balances'): lambda *args: None}), ('batch', {}))
+    results, digests = util_benchmark.best_of(repetitions, variants, lambda: (util_benchmark.reparse(db), digest(db)))
+    db.close()
+
+    assert digests['row'] == digests['batch']
+    assert digests['batch'][1] == [('dividends', 'valid'), ('callbacks', 'valid')]
+    print('{} holders'.format(block_count * holder_count))
+    last_block_index = config.BLOCK_FIRST + block_count + 3
+    for transaction, block_index in (('dividend', last_block_index - 1), ('callback', last_block_index)):
+        row, batch = results['row'][block_index], results['batch'][block_index]
+        print('{:>8}: {:.3f}s by row, {:.3f}s in bulk, speedup: {:.2f}×'.format(transaction, row, batch, row / batch))
+
+if __name__ == '__main__':
+    util_benchmark.set_options()
+    block_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    holder_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    run(block_count, holder_count)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,50 @@
+#! /usr/bin/python3
+
+"""
+Benchmark of the cost of logging while reparsing, at level WARNING (where
+nothing that `util.log()` writes is emitted): blocks of burns and sends
+reparsed with every message formatted, as `util.log()` used to do, and with
+messages formatted only if they are emitted.
+
+    python3 log_benchmark.py [blocks] [sends per block]
+"""
+
+import sys, logging, struct
+
+import util_benchmark
+from lib import (config, util, send)
+
+def eager_log (db, command, category, bindings):
+    """`util.log()` as it was: every message formatted, whatever the level."""
+    if (command, category) in util.LOG_FORMATS:
+        level, format_message = util.LOG_FORMATS[(command, category)]
+        logging.log(level, format_message(db, bindings))
+
+def setup (block_count, send_count):
+    data = struct.pack(config.TXTYPE_FORMAT, send.ID) + struct.pack(send.FORMAT, util.asset_id(config.XPT), config.UNIT)
+    transactions = []
+    for block_index in range(config.BLOCK_FIRST, config.BLOCK_FIRST + block_count):
+        source = 'address{}'.format(block_index)
+        transactions.append([(source, config.UNSPENDABLE, 1000, b'')] + [(source, 'address{}'.format(i), None, data) for i in range(send_count)])
+    return util_benchmark.create_database(transactions)
+
+def run (block_count, send_count, repetitions=5):
+    db = setup(block_count, send_count)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Best of a few runs, alternating.
+    variants = (('eager', {(util, 'log'): eager_log}), ('lazy', {}))
+    results, digests = util_benchmark.best_of(repetitions, variants, lambda: (util_benchmark.reparse(db), None))
+    db.close()
+
+    for name, timings in sorted(results.items()):
+        print('{:>5}: {:.3f}s, {:.2f}ms per block'.format(name, timings['total'], timings['total'] / block_count * 1e3))
+    print('speedup: {:.2f}×'.format(results['eager']['total'] / results['lazy']['total']))
+
+if __name__ == '__main__':
+    util_benchmark.set_options()
+    block_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    send_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    run(block_count, send_count)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
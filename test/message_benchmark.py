@@ -0,0 +1,58 @@
+#! /usr/bin/python3
+
+"""
+Benchmark of the cost of writing messages: credits (and so, through the
+execution tracer, messages) written one by one, as for a transaction parsed
+on its own, and written within a block, with its balance cache and message
+buffer.
+
+    python3 message_benchmark.py [credits] [existing messages]
+"""
+
+import sys, time
+
+import util_benchmark
+from lib import (config, util)
+
+def setup (message_count):
+    db = util_benchmark.create_database([[]])
+    # A database with some history.
+    util.MESSAGE_BUFFER = util.MessageBuffer(db)
+    for i in range(message_count):
+        util.message(db, config.BLOCK_FIRST, 'reorg', None, {'block_index': i})
+    util.flush_messages(db)
+    util.MESSAGE_BUFFER = None
+    return db
+
+def credit_all (db, credit_count):
+    for i in range(credit_count):
+        util.credit(db, config.BLOCK_FIRST, 'address{}'.format(i % 100), config.XPT, i, action='benchmark', event=str(i))
+
+def run (credit_count, message_count):
+    results = {}
+    for name, buffered in (('unbuffered', False), ('buffered', True)):
+        db = setup(message_count)
+        starttime = time.time()
+        with db:
+            if buffered:
+                util.BALANCE_CACHE = util.BalanceCache()
+                util.MESSAGE_BUFFER = util.MessageBuffer(db)
+            credit_all(db, credit_count)
+            util.flush_balances(db)
+            util.flush_messages(db)
+            util.BALANCE_CACHE = None
+            util.MESSAGE_BUFFER = None
+        results[name] = time.time() - starttime
+        db.close()
+
+    for name, duration in sorted(results.items(), reverse=True):
+        print('{:>10}: {:.3f}s, {:.1f}µs per credit'.format(name, duration, duration / credit_count * 1e6))
+    print('   speedup: {:.2f}×'.format(results['unbuffered'] / results['buffered']))
+
+if __name__ == '__main__':
+    util_benchmark.set_options()
+    credit_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    message_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    run(credit_count, message_count)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,73 @@
+#! /usr/bin/python3
+
+"""
+Benchmark of the matching of orders against deep books: blocks of orders
+for an asset and XPT, at random prices and quantities, reparsed with the
+books of open orders (`orderbook`), and with every open order for the pair
+selected and sorted for each new order, as `order.match()` used to do. Both
+must leave the same orders, matches and balances.
+
+    python3 order_benchmark.py [blocks] [orders per block] [traders]
+"""
+
+import sys, logging, struct, random
+
+import util_benchmark
+from lib import (config, util, send, issuance, order, orderbook)
+
+ASSET = 'BOOKS'
+
+def setup (block_count, order_count, trader_count):
+    random.seed(0)
+    issuer = 'issuer'
+    traders = ['trader{}'.format(i) for i in range(trader_count)]
+
+    transactions = [[(address, config.UNSPENDABLE, 1000, b'') for address in [issuer] + traders]]
+    data = struct.pack(config.TXTYPE_FORMAT, issuance.ID) + struct.pack(issuance.FORMAT_2 + '5p', util.asset_id(ASSET), 10 ** 8 * config.UNIT, True, False, 0, 0.0, b'book')
+    transactions.append([(issuer, None, None, data)])
+    data = struct.pack(config.TXTYPE_FORMAT, send.ID) + struct.pack(send.FORMAT, util.asset_id(ASSET), 10 ** 5 * config.UNIT)
+    transactions.append([(issuer, trader, None, data) for trader in traders])
+    for i in range(block_count):
+        block_transactions = []
+        for j in range(order_count):
+            quantity = random.randint(1, 10) * config.UNIT
+            price = random.randint(80, 120)
+            if random.random() < 0.5:
+                give_asset, give_quantity, get_asset, get_quantity = config.XPT, quantity * price // 100, ASSET, quantity
+            else:
+                give_asset, give_quantity, get_asset, get_quantity = ASSET, quantity, config.XPT, quantity * price // 100
+            data = struct.pack(config.TXTYPE_FORMAT, order.ID) + struct.pack(order.FORMAT, util.asset_id(give_asset), give_quantity, util.asset_id(get_asset), get_quantity, 1000, 0)
+            block_transactions.append((random.choice(traders), None, None, data))
+        transactions.append(block_transactions)
+    return util_benchmark.create_database(transactions)
+
+def digest (db):
+    """Return a digest of the orders, order matches and balances."""
+    cursor = db.cursor()
+    counts = [list(cursor.execute('''SELECT COUNT(*) AS count FROM {} WHERE status = ?'''.format(table), (status,)))[0]['count'] for table, status in (('orders', 'open'), ('order_matches', 'completed'))]
+    cursor.close()
+    return util_benchmark.digest(db, ('orders', 'order_matches', 'balances')), counts
+
+def run (block_count, order_count, trader_count, repetitions=3):
+    db = setup(block_count, order_count, trader_count)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Best of a few runs, alternating.
+    variants = (('select', {(orderbook, 'orders'): lambda *args: None}), ('book', {}))
+    results, digests = util_benchmark.best_of(repetitions, variants, lambda: (util_benchmark.reparse(db), digest(db)))
+    db.close()
+
+    assert digests['select'] == digests['book']
+    print('{} open orders, {} completed matches'.format(*digests['book'][1]))
+    for name, timings in sorted(results.items()):
+        print('{:>6}: {:.3f}s, {:.2f}ms per block'.format(name, timings['total'], timings['total'] / block_count * 1e3))
+    print('speedup: {:.2f}×'.format(results['select']['total'] / results['book']['total']))
+
+if __name__ == '__main__':
+    util_benchmark.set_options()
+    block_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    order_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    trader_count = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    run(block_count, order_count, trader_count)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,71 @@
+#! /usr/bin/python3
+
+"""
+The payouts of dividends and callbacks computed with NumPy must be exactly
+those computed holder by holder, for random holders, quantities and terms.
+"""
+
+import os, sys, random
+import pytest
+
+CURR_DIR = os.path.dirname(os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__))))
+sys.path.append(os.path.normpath(os.path.join(CURR_DIR, '..')))
+
+from lib import (config, payouts)
+
+numpy = pytest.importorskip('numpy')
+
+def random_quantity (randomness, largest):
+    """Return a quantity of up to `largest`, often a round number of units,
+    or the size of dust, or one off.
+    """
+    units = largest // config.UNIT
+    return randomness.choice([
+        0,
+        randomness.randint(0, min(100, largest)),
+        min(largest, config.DEFAULT_MULTISIG_DUST_SIZE + randomness.choice([-1, 0, 1])),
+        randomness.randint(0, largest),
+        largest,
+        max(0, randomness.randint(0, units) * config.UNIT + randomness.choice([-1, 0, 1])) if units else randomness.randint(0, largest),
+    ])
+
+def random_holders (randomness, source, largest):
+    addresses = [source] + ['address{}'.format(i) for i in range(randomness.randint(0, 20))]
+    holders = []
+    for i in range(randomness.randint(0, 200)):
+        holders.append({'address': randomness.choice(addresses), 'address_quantity': random_quantity(randomness, largest), 'escrow': randomness.choice([None, 'order', 'bet'])})
+    return holders
+
+@pytest.mark.parametrize('seed', range(50))
+@pytest.mark.parametrize('testnet', [False, True])
+def test_dividend_outputs (seed, testnet, monkeypatch):
+    monkeypatch.setattr(config, 'TESTNET', testnet, raising=False)
+    randomness = random.Random(seed)
+    for i in range(20):
+        quantity_per_unit = randomness.choice([1, randomness.randint(1, 1000), randomness.randint(1, 10 ** 8), config.UNIT, config.MAX_INT])
+        # (Mostly, but not always, small enough to compute with floats.)
+        holders = random_holders(randomness, 'source', payouts.EXACT // quantity_per_unit * randomness.choice([1, 1, 1, 2]))
+        args = (holders, 'source', quantity_per_unit, randomness.choice([True, False]), randomness.choice([True, False]),
+                randomness.choice([config.XPT, config.LTC, 'DIVIDEND']), randomness.choice([290000, 295000, 310000]))
+        expected = payouts.dividend_outputs_loop(*args)
+        outputs = payouts.dividend_outputs_numpy(*args)
+        if outputs is None:     # (Not exactly computable with floats.)
+            assert max([holder['address_quantity'] for holder in holders]) * quantity_per_unit > payouts.EXACT
+            outputs = payouts.dividend_outputs(*args)
+        assert repr(outputs) == repr(expected)
+
+@pytest.mark.parametrize('seed', range(50))
+def test_callback_outputs (seed):
+    randomness = random.Random(seed)
+    for i in range(20):
+        holders = random_holders(randomness, 'source', payouts.EXACT)
+        fraction = randomness.choice([randomness.random(), 1.0, 0.5, 1 / 3, 1e-9, 0.0, -0.25, 1.5])
+        args = (holders, 'source', fraction, randomness.choice([True, False]))
+        expected = payouts.callback_outputs_loop(*args)
+        outputs = payouts.callback_outputs_numpy(*args)
+        if outputs is None:     # (Not exactly computable with floats.)
+            assert not abs(fraction) <= 1
+            outputs = payouts.callback_outputs(*args)
+        assert repr(outputs) == repr(expected)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,42 @@
+#! /usr/bin/python3
+
+"""
+Benchmark of the settlement of bet matches by a broadcast: bets of every type
+on one feed, matched over a few blocks (some liquidated on the way), then
+settled by a final broadcast, reparsed with `broadcast.settle()`, and with
+the matches settled one by one, with a credit, an insert and an update at a
+time, as `broadcast.parse()` used to do. (That both leave the same tables
+is tested by `settlement_test.py`.)
+
+    python3 settlement_benchmark.py [blocks] [bets per block] [traders]
+"""
+
+import sys, logging, random
+
+import util_benchmark
+from lib import broadcast
+import settlement_test
+
+def run (block_count, bet_count, trader_count, repetitions=3):
+    db = settlement_test.create_database(settlement_test.random_bets(random.Random(0), block_count, bet_count, trader_count))
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Best of a few runs, alternating, of the time spent settling.
+    variants = (('row', {(broadcast, 'settle'): util_benchmark.timed(settlement_test.settle_by_row, 'settle')}),
+                ('batch', {(broadcast, 'settle'): util_benchmark.timed(broadcast.settle, 'settle')}))
+    results, statuses = util_benchmark.best_of(repetitions, variants, lambda: (util_benchmark.reparse(db), settlement_test.statuses(db)))
+    db.close()
+
+    print(', '.join(['{} {}'.format(count, status) for status, count in sorted(statuses['batch'].items())]))
+    for name, timings in sorted(results.items()):
+        print('{:>6}: {:.3f}s'.format(name, timings['settle']))
+    print('speedup: {:.2f}×'.format(results['row']['settle'] / results['batch']['settle']))
+
+if __name__ == '__main__':
+    util_benchmark.set_options()
+    block_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    bet_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    trader_count = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    run(block_count, bet_count, trader_count)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,225 @@
+#! /usr/bin/python3
+
+"""
+The settlement of bet matches by a broadcast (`broadcast.settle()`): in
+bulk, it must leave the same bet matches, resolutions, credits, balances,
+escrows, messages and ledger hashes as when the matches are settled one by
+one (`settle_by_row()`), as `broadcast.parse()` used to do.
+"""
+
+import os, sys, struct, json, random
+from fractions import Fraction
+import pytest
+
+CURR_DIR = os.path.dirname(os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__))))
+sys.path.append(os.path.normpath(os.path.join(CURR_DIR, '..')))
+
+from lib import (config, util, blocks, ledger, bet, broadcast)
+import paytokensd
+
+import util_test, util_benchmark
+
+FEED = 'feed'
+BULL = 'bull'
+BEAR = 'bear'
+
+STATUSES = ['settled', 'settled: for equal', 'settled: for notequal', 'settled: liquidated for bear', 'settled: liquidated for bull']
+
+CHECKPOINTS_TESTNET = None
+
+def setup_module():
+    global CHECKPOINTS_TESTNET
+    paytokensd.set_options(database_file=':memory:', testnet=True, **util_test.COUNTERPARTYD_OPTIONS)
+    CHECKPOINTS_TESTNET = config.CHECKPOINTS_TESTNET
+    config.CHECKPOINTS_TESTNET = {}
+
+def teardown_module(function):
+    config.CHECKPOINTS_TESTNET = CHECKPOINTS_TESTNET
+
+def settle_by_row (db, tx, value, timestamp, fee_fraction_int, bet_matches):
+    """Settle `bet_matches` one by one, as `broadcast.parse()` used to."""
+    for bet_match in bet_matches:
+        bet_match_id = bet_match['tx0_hash'] + bet_match['tx1_hash']
+        bet_match_status = None
+
+        total_escrow = bet_match['forward_quantity'] + bet_match['backward_quantity']
+        fee_fraction = fee_fraction_int / config.UNIT
+        fee = int(fee_fraction * total_escrow)              # Truncate.
+        escrow_less_fee = total_escrow - fee
+
+        cfd_type_id = util.BET_TYPE_ID['BullCFD'] + util.BET_TYPE_ID['BearCFD']
+        equal_type_id = util.BET_TYPE_ID['Equal'] + util.BET_TYPE_ID['NotEqual']
+        bet_match_type_id = bet_match['tx0_bet_type'] + bet_match['tx1_bet_type']
+
+        if bet_match_type_id == cfd_type_id:
+            if bet_match['tx0_bet_type'] < bet_match['tx1_bet_type']:
+                bull_address = bet_match['tx0_address']
+                bear_address = bet_match['tx1_address']
+                bull_escrow = bet_match['forward_quantity']
+                bear_escrow = bet_match['backward_quantity']
+            else:
+                bull_address = bet_match['tx1_address']
+                bear_address = bet_match['tx0_address']
+                bull_escrow = bet_match['backward_quantity']
+                bear_escrow = bet_match['forward_quantity']
+
+            leverage = Fraction(bet_match['leverage'], 5040)
+            initial_value = bet_match['initial_value']
+
+            bear_credit = bear_escrow - (value - initial_value) * leverage * config.UNIT
+            bull_credit = escrow_less_fee - bear_credit
+            bear_credit = round(bear_credit)
+            bull_credit = round(bull_credit)
+
+            if bull_credit >= escrow_less_fee or bull_credit <= 0:
+                if bull_credit >= escrow_less_fee:
+                    bull_credit = escrow_less_fee
+                    bear_credit = 0
+                    bet_match_status = 'settled: liquidated for bull'
+                    util.credit(db, tx['block_index'], bull_address, config.XPT, bull_credit, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
+                elif bull_credit <= 0:
+                    bull_credit = 0
+                    bear_credit = escrow_less_fee
+                    bet_match_status = 'settled: liquidated for bear'
+                    util.credit(db, tx['block_index'], bear_address, config.XPT, bear_credit, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
+                util.credit(db, tx['block_index'], bet_match['feed_address'], config.XPT, fee, action='feed fee', event=tx['tx_hash'])
+                bindings = {'bet_match_id': bet_match_id, 'bet_match_type_id': bet_match_type_id, 'block_index': tx['block_index'], 'settled': False,
+                            'bull_credit': bull_credit, 'bear_credit': bear_credit, 'winner': None, 'escrow_less_fee': None, 'fee': fee}
+                ledger.insert(db, 'bet_match_resolutions', bindings, fields=broadcast.RESOLUTION_FIELDS)
+
+            elif timestamp >= bet_match['deadline']:
+                bet_match_status = 'settled'
+                util.credit(db, tx['block_index'], bull_address, config.XPT, bull_credit, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
+                util.credit(db, tx['block_index'], bear_address, config.XPT, bear_credit, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
+                util.credit(db, tx['block_index'], bet_match['feed_address'], config.XPT, fee, action='feed fee', event=tx['tx_hash'])
+                bindings = {'bet_match_id': bet_match_id, 'bet_match_type_id': bet_match_type_id, 'block_index': tx['block_index'], 'settled': True,
+                            'bull_credit': bull_credit, 'bear_credit': bear_credit, 'winner': None, 'escrow_less_fee': None, 'fee': fee}
+                ledger.insert(db, 'bet_match_resolutions', bindings, fields=broadcast.RESOLUTION_FIELDS)
+
+        elif bet_match_type_id == equal_type_id and timestamp >= bet_match['deadline']:
+            if bet_match['tx0_bet_type'] < bet_match['tx1_bet_type']:
+                equal_address = bet_match['tx0_address']
+                notequal_address = bet_match['tx1_address']
+            else:
+                equal_address = bet_match['tx1_address']
+                notequal_address = bet_match['tx0_address']
+            if value == bet_match['target_value']:
+                winner = 'Equal'
+                bet_match_status = 'settled: for equal'
+                util.credit(db, tx['block_index'], equal_address, config.XPT, escrow_less_fee, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
+            else:
+                winner = 'NotEqual'
+                bet_match_status = 'settled: for notequal'
+                util.credit(db, tx['block_index'], notequal_address, config.XPT, escrow_less_fee, action='bet {}'.format(bet_match_status), event=tx['tx_hash'])
+            util.credit(db, tx['block_index'], bet_match['feed_address'], config.XPT, fee, action='feed fee', event=tx['tx_hash'])
+            bindings = {'bet_match_id': bet_match_id, 'bet_match_type_id': bet_match_type_id, 'block_index': tx['block_index'], 'settled': None,
+                        'bull_credit': None, 'bear_credit': None, 'winner': winner, 'escrow_less_fee': escrow_less_fee, 'fee': fee}
+            ledger.insert(db, 'bet_match_resolutions', bindings, fields=broadcast.RESOLUTION_FIELDS)
+
+        if bet_match_status:
+            ledger.update(db, 'bet_matches', {'id': bet_match['tx0_hash'] + bet_match['tx1_hash']}, {'status': bet_match_status}, tx['block_index'])
+
+def block_time (i):
+    return config.BLOCK_FIRST * 10 + i * 10
+
+def create_database (transactions):
+    """Return a database with the blocks of `transactions`, the first at
+    `block_time(1)`, and so on.
+    """
+    return util_benchmark.create_database(transactions, block_time=lambda block_index: block_time(block_index - config.BLOCK_FIRST + 1))
+
+def broadcast_data (timestamp, value):
+    return struct.pack(config.TXTYPE_FORMAT, broadcast.ID) + struct.pack(broadcast.FORMAT + '4p', timestamp, value, 500000, b'feed')
+
+def bet_data (bet_type, deadline, quantity, target_value=0.0, leverage=5040):
+    return struct.pack(config.TXTYPE_FORMAT, bet.ID) + struct.pack(bet.FORMAT, bet_type, deadline, quantity, quantity, target_value, leverage, 1000)
+
+def random_bets (randomness, block_count, bet_count, trader_count):
+    """Return blocks of bets of every type on one feed, at random: CFDs, at
+    random leverages, and bets on values, which the feed sometimes hits. The
+    feed broadcasts a new value before each block of bets, and, at the
+    deadline of most of the bets, a last one.
+    """
+    traders = ['trader{}'.format(i) for i in range(trader_count)]
+    targets = [95.0, 100.0, 105.0]
+    deadline = block_time(block_count + 3)
+    transactions = [[(address, config.UNSPENDABLE, 1000, b'') for address in [FEED] + traders]]
+    for i in range(block_count):
+        value = randomness.choice([randomness.choice(targets), randomness.uniform(60, 140)])
+        block_transactions = [(FEED, None, None, broadcast_data(block_time(i + 1), value))]
+        for j in range(bet_count):
+            quantity = randomness.randint(10, 150) * config.UNIT
+            bet_deadline = randomness.choice([deadline, deadline, deadline + 1000])
+            if randomness.random() < 0.5:
+                data = bet_data(randomness.choice([util.BET_TYPE_ID['BullCFD'], util.BET_TYPE_ID['BearCFD']]), bet_deadline, quantity,
+                                leverage=randomness.choice([5040, 10080, 20160]))
+            else:
+                data = bet_data(randomness.choice([util.BET_TYPE_ID['Equal'], util.BET_TYPE_ID['NotEqual']]), bet_deadline, quantity,
+                                target_value=randomness.choice(targets))
+            block_transactions.append((randomness.choice(traders), FEED, None, data))
+        transactions.append(block_transactions)
+    transactions.append([(FEED, None, None, broadcast_data(deadline, randomness.choice(targets)))])
+    return transactions
+
+def statuses (db):
+    """Return the number of bet matches of each status."""
+    cursor = db.cursor()
+    counts = dict([(row['status'], row['count']) for row in cursor.execute('''SELECT status, COUNT(*) AS count FROM bet_matches GROUP BY status''')])
+    cursor.close()
+    return counts
+
+def digest (db):
+    return util_benchmark.digest(db, ('bet_matches', 'bet_match_resolutions', 'credits', 'balances', 'escrows', 'messages', 'blocks'))
+
+@pytest.mark.parametrize('seed', range(3))
+def test_settle (seed):
+    db = create_database(random_bets(random.Random(seed), 5, 60, 10))
+    util_benchmark.reparse(db)
+    expected = digest(db), statuses(db)
+    with util_benchmark.patched({(broadcast, 'settle'): settle_by_row}):
+        util_benchmark.reparse(db)
+    assert (digest(db), statuses(db)) == expected
+    db.close()
+
+    # Every way of settling a bet match, and not.
+    counts = expected[1]
+    assert sorted([status for status in counts if status in STATUSES]) == STATUSES
+    assert counts['pending']
+
+def test_settle_in_mempool():
+    deadline = block_time(10)
+    db = create_database([
+        [(address, config.UNSPENDABLE, 1000, b'') for address in (FEED, BULL, BEAR)],
+        [(FEED, None, None, broadcast_data(block_time(2), 100.0)),
+         (BULL, FEED, None, bet_data(util.BET_TYPE_ID['BullCFD'], deadline, 10 * config.UNIT)),
+         (BEAR, FEED, None, bet_data(util.BET_TYPE_ID['BearCFD'], deadline, 10 * config.UNIT))],
+    ])
+    util_benchmark.reparse(db)
+    cursor = db.cursor()
+    assert [row['status'] for row in cursor.execute('''SELECT status FROM bet_matches''')] == ['pending']
+
+    # Parse, as `blocks.follow()` does, a broadcast in the mempool that
+    # settles the bet match, then roll it back.
+    try:
+        with db:
+            cursor.execute('''INSERT INTO blocks(block_index, block_hash, block_time) VALUES(?,?,?)''',
+                           (config.MEMPOOL_BLOCK_INDEX, config.MEMPOOL_BLOCK_HASH, deadline))
+            cursor.execute('''INSERT INTO transactions VALUES(?,?,?,?,?,?,?,?,?,?,?)''',
+                           (100, 'mempool', config.MEMPOOL_BLOCK_INDEX, config.MEMPOOL_BLOCK_HASH, deadline, FEED, None, None, 10000, broadcast_data(deadline, 101.0), True))
+            tx = list(cursor.execute('''SELECT * FROM transactions WHERE tx_hash = ?''', ('mempool',)))[0]
+            assert blocks.parse_tx(db, tx)
+            assert [row['status'] for row in cursor.execute('''SELECT status FROM bet_matches''')] == ['settled']
+            credits = list(cursor.execute('''SELECT * FROM credits WHERE block_index = ?''', (config.MEMPOOL_BLOCK_INDEX,)))
+            assert sorted([credit['address'] for credit in credits]) == [BEAR, BULL, FEED]
+            messages = list(cursor.execute('''SELECT * FROM messages WHERE block_index = ?''', (config.MEMPOOL_BLOCK_INDEX,)))
+            assert [(message['command'], message['category']) for message in messages] == \
+                   [('insert', 'broadcasts')] + [('insert', 'credits')] * 3 + [('insert', 'bet_match_resolutions'), ('update', 'bet_matches')]
+            assert 'status' not in json.loads(messages[-1]['bindings'])
+            raise ValueError
+    except ValueError:
+        pass
+    assert [row['status'] for row in cursor.execute('''SELECT status FROM bet_matches''')] == ['pending']
+    cursor.close()
+    db.close()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,97 @@
+#! /usr/bin/python3
+
+"""
+Snapshots of the parsed state (`snapshot`), and reparses from them.
+"""
+
+import os, sys, struct
+import apsw
+
+CURR_DIR = os.path.dirname(os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__))))
+sys.path.append(os.path.normpath(os.path.join(CURR_DIR, '..')))
+
+from lib import (config, util, blocks, snapshot, send)
+import paytokensd
+
+import util_test, util_benchmark
+
+CHECKPOINTS_TESTNET = None
+
+def setup_module():
+    global CHECKPOINTS_TESTNET
+    paytokensd.set_options(database_file=':memory:', testnet=True, **util_test.COUNTERPARTYD_OPTIONS)
+    CHECKPOINTS_TESTNET = config.CHECKPOINTS_TESTNET
+    config.CHECKPOINTS_TESTNET = {}
+
+def teardown_module(function):
+    config.CHECKPOINTS_TESTNET = CHECKPOINTS_TESTNET
+
+def parsed_database (monkeypatch, tmpdir, block_count):
+    """Return a database with `block_count` blocks of burns and sends, parsed,
+    with a snapshot at every block (and without an undo journal).
+    """
+    monkeypatch.setattr(config, 'UNDOLOG_DEPTH', 0, raising=False)
+    monkeypatch.setattr(config, 'SNAPSHOT_DIR', str(tmpdir), raising=False)
+    monkeypatch.setattr(config, 'SNAPSHOT_INTERVAL', 1, raising=False)
+    monkeypatch.setattr(config, 'SNAPSHOT_RETENTION', block_count, raising=False)
+    data = struct.pack(config.TXTYPE_FORMAT, send.ID) + struct.pack(send.FORMAT, util.asset_id(config.XPT), config.UNIT)
+    db = util_benchmark.create_database([[('address{}'.format(i), config.UNSPENDABLE, 1000, b''), ('address{}'.format(i), 'destination', None, data)]
+                                         for i in range(block_count)])
+    cursor = db.cursor()
+    for block in list(cursor.execute('''SELECT * FROM blocks ORDER BY block_index''')):
+        with db:
+            blocks.parse_block(db, block['block_index'], block['block_time'])
+        snapshot.take(db, block['block_index'], blocks.SNAPSHOT_TABLES)
+    first_block = list(cursor.execute('''SELECT * FROM blocks WHERE block_index = ?''', (config.BLOCK_FIRST,)))[0]
+    monkeypatch.setattr(config, 'CHECKPOINTS_TESTNET', {config.BLOCK_FIRST: [first_block['ledger_hash'], first_block['txlist_hash']]})
+    cursor.close()
+    return db
+
+def balances (db):
+    cursor = db.cursor()
+    rows = list(cursor.execute('''SELECT * FROM balances ORDER BY rowid'''))
+    cursor.close()
+    return rows
+
+def test_full_reparse (monkeypatch, tmpdir):
+    """A full reparse replays every block, whatever the snapshots hold."""
+    db = parsed_database(monkeypatch, tmpdir, 3)
+    expected = balances(db)
+    last_block_index = config.BLOCK_FIRST + 2
+    assert snapshot.find(db, last_block_index) == last_block_index
+
+    snapshot_db = apsw.Connection(snapshot.get_path(last_block_index))
+    snapshot_cursor = snapshot_db.cursor()
+    snapshot_cursor.execute('''UPDATE balances SET quantity = quantity + 1''')
+    snapshot_db.close()
+
+    blocks.reparse(db)
+    assert balances(db) == expected
+    db.close()
+
+def test_take (monkeypatch, tmpdir):
+    """A snapshot holds the tables that it restores, and nothing else."""
+    db = parsed_database(monkeypatch, tmpdir, 1)
+    snapshot_db = apsw.Connection(snapshot.get_path(config.BLOCK_FIRST))
+    snapshot_db.setrowtrace(util.rowtracer)
+    snapshot_cursor = snapshot_db.cursor()
+    names = [(row['type'], row['name']) for row in snapshot_cursor.execute('''SELECT type, name FROM sqlite_master ORDER BY name''')]
+    assert names == [('table', name) for name in sorted(blocks.SNAPSHOT_TABLES + ['snapshot'])]
+    for table in blocks.SNAPSHOT_TABLES:
+        assert list(snapshot_cursor.execute('''SELECT * FROM {} ORDER BY rowid'''.format(table))) == \
+               list(db.cursor().execute('''SELECT * FROM {} ORDER BY rowid'''.format(table)))
+    snapshot_db.close()
+    db.close()
+
+def test_rollback (monkeypatch, tmpdir):
+    """A rollback from a snapshot leaves what parsing up to it does."""
+    db = parsed_database(monkeypatch, tmpdir, 4)
+    blocks.reparse(db, block_index=config.BLOCK_FIRST + 1)
+    assert snapshot.list_snapshots() == [config.BLOCK_FIRST + 1, config.BLOCK_FIRST]
+    expected_db = parsed_database(monkeypatch, tmpdir.mkdir('expected'), 2)
+    tables = blocks.TABLES + ['balances', 'blocks']
+    assert util_benchmark.digest(db, tables) == util_benchmark.digest(expected_db, tables)
+    expected_db.close()
+    db.close()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,66 @@
+#! /usr/bin/python3
+
+"""
+Rolling back blocks with the undo journal (`undolog.rollback()`).
+"""
+
+import os, sys
+import apsw
+
+CURR_DIR = os.path.dirname(os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__))))
+sys.path.append(os.path.normpath(os.path.join(CURR_DIR, '..')))
+
+from lib import (config, util, undolog)
+
+def connect ():
+    db = apsw.Connection(':memory:')
+    db.setrowtrace(util.rowtracer)
+    cursor = db.cursor()
+    cursor.execute('''CREATE TABLE blocks(block_index INTEGER PRIMARY KEY)''')
+    cursor.execute('''CREATE TABLE balances(address TEXT, asset TEXT, quantity INTEGER)''')
+    cursor.close()
+    undolog.initialise(db)
+    return db
+
+def dump (db):
+    cursor = db.cursor()
+    rows = [(table, list(cursor.execute('''SELECT rowid, * FROM {} ORDER BY rowid'''.format(table)))) for table in ('blocks', 'balances')]
+    cursor.close()
+    return rows
+
+def test_rollback (monkeypatch):
+    monkeypatch.setattr(config, 'UNDOLOG_DEPTH', 10, raising=False)
+    db = connect()
+    cursor = db.cursor()
+
+    undolog.start_block(db, 1)
+    cursor.execute('''INSERT INTO blocks VALUES(1)''')
+    cursor.execute('''INSERT INTO balances VALUES('alice', 'XPT', 10)''')
+    cursor.execute('''INSERT INTO balances VALUES('bob', 'XPT', 20)''')
+    cursor.execute('''INSERT INTO balances VALUES('carol', 'XPT', NULL)''')
+    expected = dump(db)
+
+    undolog.start_block(db, 2)
+    cursor.execute('''INSERT INTO blocks VALUES(2)''')
+    cursor.execute('''UPDATE balances SET quantity = 15 WHERE address = 'alice' ''')
+    cursor.execute('''UPDATE balances SET quantity = 20 WHERE address = 'bob' ''')      # (Unchanged.)
+    cursor.execute('''UPDATE balances SET quantity = NULL WHERE address = 'carol' ''')  # (Unchanged.)
+    cursor.execute('''INSERT INTO balances VALUES('dave', 'XPT', 5)''')
+
+    undolog.start_block(db, 3)
+    cursor.execute('''INSERT INTO blocks VALUES(3)''')
+    cursor.execute('''UPDATE balances SET quantity = quantity''')                       # (Unchanged.)
+    cursor.execute('''DELETE FROM balances WHERE address = 'bob' ''')
+    cursor.execute('''UPDATE balances SET quantity = 0, asset = 'XPT' WHERE address = 'dave' ''')
+
+    # Only the updates that change something are journaled.
+    statements = [row['sql'] for row in cursor.execute('''SELECT sql FROM undolog WHERE sql LIKE 'UPDATE%' ORDER BY undo_index''')]
+    assert statements == ['UPDATE balances SET quantity = 10 WHERE rowid = 1', 'UPDATE balances SET quantity = 5 WHERE rowid = 4']
+
+    assert undolog.rollback(db, 1)
+    assert dump(db) == expected
+    assert not list(cursor.execute('''SELECT * FROM undolog_block WHERE block_index > 1'''))
+    cursor.close()
+    db.close()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -6,12 +6,17 @@ from util_test import CURR_DIR
 from fixtures.vectors import UNITTEST_VECTOR
 from fixtures.params import DEFAULT_PARAMS as DP
 
-from lib import (config, util, api)
+from lib import (config, util, api, escrow, supply)
 import paytokensd
 
 def setup_module():
     paytokensd.set_options(database_file=tempfile.gettempdir() + '/fixtures.unittest.db', testnet=True, **util_test.COUNTERPARTYD_OPTIONS)
     util_test.restore_database(config.DATABASE, CURR_DIR + '/fixtures/scenarios/unittest_fixture.sql')
+    # Derive the tables that the dump doesn’t have.
+    db = util.connect_to_db()
+    escrow.initialise(db)
+    supply.initialise(db)
+    db.close()
     config.FIRST_MULTISIG_BLOCK_TESTNET = 1
     # start RPC server
     api_server = api.APIServer()
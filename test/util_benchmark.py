@@ -0,0 +1,134 @@
+#! /usr/bin/python3
+
+"""
+What the benchmarks share: a database in memory, on testnet, into which
+blocks of made‐up transactions are inserted, to be reparsed, alternately,
+with the code being measured and with what it replaces, and digested, to
+check that both leave the same tables.
+"""
+
+import os, sys, time, tempfile, contextlib, hashlib, json
+
+CURR_DIR = os.path.dirname(os.path.realpath(os.path.join(os.getcwd(), os.path.expanduser(__file__))))
+sys.path.append(os.path.normpath(os.path.join(CURR_DIR, '..')))
+
+from lib import (config, util, blocks)
+import paytokensd
+
+OPTIONS = {
+    'database_file': ':memory:',
+    'testnet': True,
+    'data_dir': tempfile.gettempdir(),
+    'rpc_port': 9999,
+    'rpc_password': 'pass',
+    'backend_rpc_port': 8888,
+    'backend_rpc_password': 'pass'
+}
+
+def set_options ():
+    paytokensd.set_options(**OPTIONS)
+    config.PREFIX = b'TESTXXXX'
+    config.CHECKPOINTS_TESTNET = {}
+
+def insert_blocks (db, transactions, block_time=None):
+    """Insert a block for each list of `transactions`, from
+    `config.BLOCK_FIRST` on, with its transactions, as (source, destination,
+    LTC amount, data). A block’s time is `block_time(block_index)`, or its
+    index.
+    """
+    cursor = db.cursor()
+    tx_index = 0
+    for block_index, block_transactions in enumerate(transactions, start=config.BLOCK_FIRST):
+        block_hash = 'block{}'.format(block_index)
+        time_ = block_time(block_index) if block_time else block_index
+        cursor.execute('''INSERT INTO blocks(block_index, block_hash, block_time) VALUES(?,?,?)''', (block_index, block_hash, time_))
+        for source, destination, ltc_amount, tx_data in block_transactions:
+            cursor.execute('''INSERT INTO transactions VALUES(?,?,?,?,?,?,?,?,?,?,?)''',
+                           (tx_index, 'tx{}'.format(tx_index), block_index, block_hash, time_, source, destination, ltc_amount, 10000, tx_data, True))
+            tx_index += 1
+    cursor.close()
+
+def create_database (transactions=(), block_time=None):
+    """Return a new database, with the blocks of `transactions` (unparsed)."""
+    db = util.connect_to_db()
+    blocks.initialise(db)
+    insert_blocks(db, transactions, block_time=block_time)
+    return db
+
+TIMINGS = {}
+
+def timed (function, key):
+    """Return `function`, timed: what it takes, during a `reparse()`, is
+    added up under `key`.
+    """
+    def timed_function (*args, **kwargs):
+        starttime = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            TIMINGS[key] = TIMINGS.get(key, 0) + time.time() - starttime
+    return timed_function
+
+def reparse (db):
+    """Reparse every block. Return how long each block took, by index, all
+    of them, as `'total'`, and the functions `timed()`, by key.
+    """
+    TIMINGS.clear()
+    cursor = db.cursor()
+    starttime = time.time()
+    with db:
+        for table in blocks.TABLES + ['balances']:
+            cursor.execute('''DROP TABLE IF EXISTS {}'''.format(table))
+        blocks.initialise(db)
+        for block in list(cursor.execute('''SELECT * FROM blocks ORDER BY block_index''')):
+            block_starttime = time.time()
+            blocks.parse_block(db, block['block_index'], block['block_time'])
+            TIMINGS[block['block_index']] = time.time() - block_starttime
+    TIMINGS['total'] = time.time() - starttime
+    cursor.close()
+    return dict(TIMINGS)
+
+def digest (db, tables):
+    """Return a digest of the rows of `tables`, those of `messages` less
+    their timestamps.
+    """
+    cursor = db.cursor()
+    md5 = hashlib.md5()
+    for table in tables:
+        for row in cursor.execute('''SELECT * FROM {} ORDER BY rowid'''.format(table)):
+            if table == 'messages':
+                del row['timestamp']
+            md5.update(json.dumps(row, sort_keys=True).encode('utf-8'))
+    cursor.close()
+    return md5.hexdigest()
+
+@contextlib.contextmanager
+def patched (patches):
+    """Set each `(object, attribute)` of `patches` to its value, meanwhile."""
+    originals = dict([(target, getattr(*target)) for target in patches])
+    for (object_, attribute), value in patches.items():
+        setattr(object_, attribute, value)
+    try:
+        yield
+    finally:
+        for (object_, attribute), value in originals.items():
+            setattr(object_, attribute, value)
+
+def best_of (repetitions, variants, measure):
+    """Call `measure()` `repetitions` times with each of `variants`, in turn:
+    `(name, patches)`, the patches being applied meanwhile (see `patched()`).
+    `measure()` returns timings, as `reparse()` does, and a digest. Return,
+    by name, the best of each timing, and the last digest.
+    """
+    results = {}
+    digests = {}
+    for i in range(repetitions):
+        for name, patches in variants:
+            with patched(patches):
+                timings, digests[name] = measure()
+            best = results.setdefault(name, {})
+            for key, duration in timings.items():
+                best[key] = min(best.get(key, float('inf')), duration)
+    return results, digests
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -319,6 +319,11 @@ def get_block_ledger(db, block_index):
     ledger = json.dumps(debits + credits, indent=4)
     return ledger
 
+def get_messages(db):
+    cursor = db.cursor()
+    messages = list(cursor.execute('''SELECT message_index, block_index, command, category, bindings FROM messages ORDER BY message_index'''))
+    return '\n'.join([json.dumps(m, sort_keys=True) for m in messages])
+
 def get_block_txlist(db, block_index):
     cursor = db.cursor()
     txlist = list(cursor.execute('''SELECT * FROM transactions WHERE block_index = ?''', (block_index,)))
@@ -376,3 +381,6 @@ def reparse(testnet=True):
                 old_txlist = get_block_txlist(prod_db, block['block_index'])
                 compare_strings(old_txlist, new_txlist)
             raise(e)
+
+    # The message feed must come out the same, but for the times at which the messages were written.
+    assert compare_strings(get_messages(prod_db), get_messages(memory_db)) == 0